@@ -1,7 +1,15 @@
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.routers import receipts, analytics, auth, notifications
+from app.routers import receipts, analytics, auth, notifications, metrics
+from app.services.extraction_backends import extraction_backend
+from app.services.job_queue import job_queue
+from app.services.process_pool import process_pool
+from app.services.model_registry import models
+from app.services import ocr  # noqa: F401  (registers the paddleocr loader)
+from app.utils.config import settings
 
 app = FastAPI(title="Receipt Scanner API")
 
@@ -18,6 +26,20 @@ app.include_router(auth.router)
 app.include_router(receipts.router)
 app.include_router(analytics.router)
 app.include_router(notifications.router)
+app.include_router(metrics.router)
+
+@app.on_event("startup")
+async def warm_up():
+    if settings.MODEL_WARMUP:
+        await asyncio.to_thread(models.warm_up, settings.MODEL_WARMUP)
+    if settings.PROCESS_POOL_WARMUP:
+        await process_pool.warm_up()
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    job_queue.shutdown()
+    extraction_backend.shutdown()
+    process_pool.shutdown()
 
 @app.get("/")
 def read_root():
@@ -28,6 +28,8 @@ class User(UserBase):
 
 class UserInDB(User):
     hashed_password: str
+    # Bumped on every receipt write; versions cached analytics responses
+    data_version: int = 0
 
 class Token(BaseModel):
     access_token: str
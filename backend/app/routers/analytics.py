@@ -1,43 +1,98 @@
-from fastapi import APIRouter, Depends, HTTPException
-from app.services.analytics_service import get_monthly_analytics, get_category_analytics
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Hashable, Literal, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
+from app.services.analytics_service import get_monthly_analytics, get_category_analytics, get_spending_by_category
+from app.services.merchant_index import get_item_spending, get_top_merchants
+from app.services.response_cache import response_cache
+from app.services.timeseries import DateRangeTooLong, get_timeseries
 from app.utils.auth import get_current_user
-from app.models.user import TokenData
+from app.models.user import TokenData, UserInDB
 from app.services.auth_service import get_user_by_email
+from app.utils.rate_limit import rate_limit
+from app.utils.range_response import etag_matches
+from app.utils.config import settings
 
 router = APIRouter(
     prefix="/analytics",
     tags=["analytics"],
     responses={404: {"description": "Not found"}},
+    dependencies=[Depends(rate_limit("analytics"))],
 )
 
-@router.get("/monthly")
-async def monthly_analytics(token_data: TokenData = Depends(get_current_user)):
+async def cached_response(
+    request: Request,
+    user: UserInDB,
+    endpoint: str,
+    params: Dict[str, Hashable],
+    compute: Callable[[], Awaitable[list]]
+) -> Response:
     """
-    Get spending totals grouped by month (YYYY-MM) for the authenticated user.
-    Returns list sorted by month (newest first).
+    Serves `{"data": await compute()}` through the versioned response cache.
+
+    The ETag is derived from the user's data version, so a matching
+    If-None-Match is answered with 304 before any analytics work.
+    """
+    key = response_cache.key(user.id, endpoint, params, user.data_version)
+    etag = response_cache.etag(key)
+    # Clients must revalidate, but may keep the body between receipt writes
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        response_cache.not_modified += 1
+        return Response(status_code=304, headers=headers)
+
+    body = response_cache.get(key)
+    if body is None:
+        body = JSONResponse({"data": await compute()}).body
+        response_cache.set(key, body)
+
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def parse_date_range(start_date: Optional[str], end_date: Optional[str]) -> Tuple[Optional[datetime], Optional[datetime]]:
     """
+    Parses YYYY-MM-DD bounds into the first and last instant of the range.
+
+    Raises:
+        HTTPException: 400 if a date is malformed or the range is longer
+            than ANALYTICS_MAX_SPAN_DAYS
+    """
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d") if start_date else None
+        end = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1, microseconds=-1) if end_date else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    if start and end and (end - start).days + 1 > settings.ANALYTICS_MAX_SPAN_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range can't be longer than {settings.ANALYTICS_MAX_SPAN_DAYS} days")
+    return start, end
+
+async def get_user(token_data: TokenData) -> UserInDB:
     user = await get_user_by_email(token_data.email)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
-    
-    result = await get_monthly_analytics(user.id)
-    return {"data": result}
+    return user
+
+@router.get("/monthly")
+async def monthly_analytics(request: Request, token_data: TokenData = Depends(get_current_user)):
+    """
+    Get spending totals grouped by month (YYYY-MM) for the authenticated user.
+    Returns list sorted by month (newest first).
+    """
+    user = await get_user(token_data)
+    return await cached_response(request, user, "monthly", {}, lambda: get_monthly_analytics(user.id))
 
 @router.get("/category")
-async def category_analytics(token_data: TokenData = Depends(get_current_user)):
+async def category_analytics(request: Request, token_data: TokenData = Depends(get_current_user)):
     """
     Get spending totals grouped by category for the authenticated user.
     Returns list sorted by total (highest first).
     """
-    user = await get_user_by_email(token_data.email)
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-    
-    result = await get_category_analytics(user.id)
-    return {"data": result}
+    user = await get_user(token_data)
+    return await cached_response(request, user, "category", {}, lambda: get_category_analytics(user.id))
 
 @router.get("/spending_by_category")
 async def spending_by_category(
+    request: Request,
     start_date: str = None,
     end_date: str = None,
     token_data: TokenData = Depends(get_current_user)
@@ -51,10 +106,92 @@ async def spending_by_category(
     
     Returns list sorted by total (highest first).
     """
-    user = await get_user_by_email(token_data.email)
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
+    user = await get_user(token_data)
+    parse_date_range(start_date, end_date)
+    return await cached_response(
+        request,
+        user,
+        "spending_by_category",
+        {"start_date": start_date, "end_date": end_date},
+        lambda: get_spending_by_category(user.id, start_date, end_date)
+    )
+
+@router.get("/timeseries")
+async def timeseries_analytics(
+    request: Request,
+    granularity: Literal["day", "week", "month", "rolling", "yoy"] = Query("day", description="Series to compute"),
+    start_date: Optional[str] = Query(None, description="First day (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="Last day (YYYY-MM-DD)"),
+    category: Optional[str] = Query(None, description="Only this category"),
+    window: int = Query(30, ge=1, le=366, description="Rolling window in days"),
+    token_data: TokenData = Depends(get_current_user)
+):
+    """
+    Get spending over time for the authenticated user.
+    
+    Granularities:
+        day, week, month: totals and counts per period (weeks start on Monday)
+        rolling: trailing `window`-day spending for every day in the range
+        yoy: monthly totals next to the same month a year earlier
+    
+    Receipts are placed by their purchase date. Returns periods oldest first.
+    A rolling series covers at most ANALYTICS_MAX_SPAN_DAYS days; without a
+    start date it covers the most recent ones.
+    """
+    user = await get_user(token_data)
+    parse_date_range(start_date, end_date)
+    
+    params = {
+        "granularity": granularity,
+        "start_date": start_date,
+        "end_date": end_date,
+        "category": category,
+        "window": window if granularity == "rolling" else None,
+    }
+    try:
+        return await cached_response(
+            request,
+            user,
+            "timeseries",
+            params,
+            lambda: get_timeseries(user.id, user.data_version, granularity, start_date, end_date, category, window)
+        )
+    except DateRangeTooLong as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/merchants")
+async def merchant_analytics(
+    request: Request,
+    limit: int = Query(10, ge=1, le=100, description="Number of merchants"),
+    token_data: TokenData = Depends(get_current_user)
+):
+    """
+    Get the authenticated user's top merchants by total spend.
+    
+    Store names are canonicalized, so spellings of the same merchant
+    ("D-Mart", "DMART Ghatkopar") are counted together.
+    Returns list sorted by total (highest first).
+    """
+    user = await get_user(token_data)
+    return await cached_response(request, user, "merchants", {"limit": limit}, lambda: get_top_merchants(user.id, limit))
+
+@router.get("/items")
+async def item_analytics(
+    request: Request,
+    q: Optional[str] = Query(None, description="Only items whose name contains all of these words"),
+    start_date: Optional[str] = Query(None, description="First purchase day (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="Last purchase day (YYYY-MM-DD)"),
+    limit: int = Query(20, ge=1, le=100, description="Number of items"),
+    token_data: TokenData = Depends(get_current_user)
+):
+    """
+    Get the authenticated user's spending per line item, with the merchants
+    each item was bought from.
+    
+    Returns list sorted by total (highest first).
+    """
+    user = await get_user(token_data)
+    start, end = parse_date_range(start_date, end_date)
     
-    from app.services.analytics_service import get_spending_by_category
-    result = await get_spending_by_category(user.id, start_date, end_date)
-    return {"data": result}
+    params = {"q": q, "start_date": start_date, "end_date": end_date, "limit": limit}
+    return await cached_response(request, user, "items", params, lambda: get_item_spending(user.id, q, start, end, limit))
@@ -0,0 +1,79 @@
+"""
+Metrics Router
+
+Exposes in-process counters for the extraction pipeline, rate limiter and
+analytics and search caches. The counters cover every user of the process,
+so they need a signed-in user, and only those listed in METRICS_USERS when
+it is set.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.services.extraction_cache import extraction_cache
+from app.services import duplicate_service, extraction_service, extraction_backends, image_store
+from app.services.process_pool import process_pool
+from app.services.response_cache import response_cache
+from app.services.search_service import prefix_index_cache
+from app.services.timeseries import snapshot_cache
+from app.services.model_registry import models
+from app.utils.preprocess import pipeline_stats
+from app.utils.rate_limit import rate_limiter
+from app.utils.auth import get_current_user
+from app.utils.config import settings
+from app.models.user import TokenData
+
+
+def require_metrics_access(token_data: TokenData = Depends(get_current_user)) -> TokenData:
+    if settings.METRICS_USERS and (token_data.email or "").lower() not in settings.METRICS_USERS:
+        raise HTTPException(status_code=403, detail="Not allowed to read metrics")
+    return token_data
+
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["metrics"],
+    responses={404: {"description": "Not found"}},
+    dependencies=[Depends(require_metrics_access)],
+)
+
+
+@router.get("/extraction")
+async def extraction_metrics():
+    """
+    Get extraction pipeline counters for this process.
+    """
+    return {
+        "cache": extraction_cache.stats(),
+        "duplicates": dict(duplicate_service.stats),
+        "backend": extraction_backends.extraction_backend.stats(),
+        "gemini_payload": dict(extraction_backends.payload_stats),
+        "tiers": extraction_service.tier_summary(),
+        "preprocess": pipeline_stats(),
+        "process_pool": process_pool.stats(),
+        "models": models.stats(),
+        "images": image_store.image_stats(),
+    }
+
+
+@router.get("/rate_limits")
+async def rate_limit_metrics():
+    """
+    Get rate limiter counters for this process.
+    """
+    return rate_limiter.stats()
+
+
+@router.get("/analytics_cache")
+async def analytics_cache_metrics():
+    """
+    Get analytics response cache and time-series snapshot counters for this process.
+    """
+    return {"responses": response_cache.stats(), "timeseries": snapshot_cache.stats()}
+
+
+@router.get("/search")
+async def search_metrics():
+    """
+    Get receipt search counters and prefix index sizes for this process.
+    """
+    return prefix_index_cache.stats()
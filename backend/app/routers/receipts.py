@@ -1,12 +1,25 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Depends
-from app.services.gemini_service import extract_receipt_data
-from app.services.receipts_service import save_receipt, get_receipt_by_id, get_all_receipts, update_receipt, delete_receipt
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Depends, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from app.services.extraction_service import process_receipt_upload, process_receipt_batch, stream_receipt_upload
+from app.services.job_queue import job_queue, JobStatus, QueueFullError, ExtractionJob
+from app.services.resilience import ServiceUnavailableError
+from app.services.receipt_export import FORMATS, export_headers, export_receipts
+from app.services.search_service import search_receipts
+from app.services.receipts_service import save_receipt, get_receipt_by_id, get_receipts_page, update_receipt, delete_receipt
 from app.services.category_service import CategoryService
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Literal, Optional, List
+from datetime import datetime, timedelta
 from app.utils.auth import get_current_user
 from app.models.user import TokenData
 from app.services.auth_service import get_user_by_email
+from app.utils.config import settings
+from app.utils.ingest import ingest_upload, IngestedUpload, UploadTooLargeError
+from app.utils.rate_limit import rate_limit
+from app.utils.range_response import gridfs_response
+from app.services import image_store
+import json
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -33,12 +46,51 @@ class UpdateReceiptRequest(BaseModel):
     category: Optional[str] = None
 
 
-@router.post("/upload_receipt")
+async def read_upload(file: UploadFile) -> IngestedUpload:
+    """Read an upload into a size-bounded, spooled buffer or raise 413."""
+    try:
+        return await ingest_upload(
+            file,
+            max_bytes=settings.UPLOAD_MAX_BYTES,
+            spool_threshold=settings.UPLOAD_SPOOL_THRESHOLD,
+            chunk_size=settings.UPLOAD_CHUNK_SIZE
+        )
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
+def raise_job_failure(job: ExtractionJob):
+    """503 with Retry-After while the extraction backend is unavailable, 500 otherwise."""
+    if isinstance(job.exception, ServiceUnavailableError):
+        raise HTTPException(
+            status_code=503,
+            detail=f"Extraction service unavailable: {job.error}",
+            headers={"Retry-After": str(max(1, round(job.exception.retry_after)))}
+        )
+    raise HTTPException(status_code=500, detail=f"Extraction failed: {job.error}")
+
+
+@router.post("/upload_receipt", dependencies=[Depends(rate_limit("upload"))])
 async def upload_receipt(
+    response: Response,
     file: UploadFile = File(...),
+    wait: bool = Query(False, description="Block until extraction finishes and return the result"),
+    allow_duplicate: bool = Query(False, description="Skip the check against recent receipts with a matching image"),
     token_data: TokenData = Depends(get_current_user)
 ):
-    """Upload and extract receipt data. Requires authentication."""
+    """
+    Upload a receipt image for extraction. Requires authentication.
+
+    By default the image is queued and a job is returned immediately (202);
+    poll `GET /receipts/jobs/{job_id}` for its status. Pass `wait=true` to get
+    the extracted receipt in the same response.
+
+    If the photo looks like a receipt uploaded in the last few weeks, the
+    new receipt is saved with `possible_duplicate_of` set to the earlier
+    one. With DUPLICATE_ACTION=skip, it is not saved when its store, total
+    and date match too, and the existing receipt is returned with status
+    "duplicate". Pass `allow_duplicate=true` to skip the check.
+    """
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
     
@@ -47,47 +99,171 @@ async def upload_receipt(
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     
-    content = await file.read()
-    logger.info(f"Received image upload from user {user.email}: {file.filename}, size: {len(content)} bytes")
+    upload = await read_upload(file)
+    logger.info(f"Received image upload from user {user.email}: {file.filename}, size: {upload.size} bytes, spooled: {upload.spooled}")
+    
+    async def process():
+        try:
+            return await process_receipt_upload(upload.view, user.id, allow_duplicate, file.filename)
+        finally:
+            upload.close()
     
-    # Direct Gemini extraction
     try:
-        receipt_data = extract_receipt_data(content)
-        logger.info(f"Gemini extraction completed: store={receipt_data.get('store_name')}, total={receipt_data.get('total')}")
-    except Exception as e:
-        logger.error(f"Gemini extraction failed: {str(e)}")
-        receipt_data = {}
+        job = job_queue.submit(user.id, process)
+    except QueueFullError:
+        upload.close()
+        logger.warning(f"Extraction queue full, rejecting upload from user {user.email}")
+        raise HTTPException(
+            status_code=503,
+            detail="Too many receipts are being processed, please retry shortly",
+            headers={"Retry-After": "5"}
+        )
     
-    if receipt_data:
-        gemini_category = receipt_data.get('category')
-        
-        if gemini_category and CategoryService.validate_category(gemini_category):
-            logger.info(f"Gemini assigned category: {gemini_category}")
-        else:
-            category = CategoryService.assign_category(receipt_data)
-            receipt_data['category'] = category
-            logger.info(f"Auto-assigned category (fallback): {category}")
-
-        if not receipt_data.get('date'):
-            from datetime import datetime
-            current_date = datetime.now().strftime("%Y-%m-%d")
-            receipt_data['date'] = current_date
-            logger.info(f"Date missing, defaulted to: {current_date}")
+    if not wait:
+        response.status_code = 202
+        return job.to_dict()
+    
+    await job_queue.wait(job)
+    if job.status != JobStatus.COMPLETED:
+        raise_job_failure(job)
+    
+    return {**job.result, "job_id": job.id}
+
+
+@router.post("/upload_receipt/stream", dependencies=[Depends(rate_limit("upload"))])
+async def upload_receipt_stream(
+    file: UploadFile = File(...),
+    allow_duplicate: bool = Query(False, description="Skip the check against recent receipts with a matching image"),
+    token_data: TokenData = Depends(get_current_user)
+):
+    """
+    Upload a receipt image and follow its extraction as Server-Sent Events.
+
+    Fields are sent as `field` events and line items as `item` events as
+    soon as Gemini produces them; a final `done` event carries the same
+    result as `POST /receipts/upload_receipt?wait=true`.
+    """
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    
+    user = await get_user_by_email(token_data.email)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
     
+    upload = await read_upload(file)
+    logger.info(f"Received streaming upload from user {user.email}: {file.filename}, size: {upload.size} bytes")
+    
+    async def events():
+        try:
+            async for event in stream_receipt_upload(upload.view, user.id, allow_duplicate, file.filename):
+                yield f"event: {event['event']}\ndata: {json.dumps(jsonable_encoder(event['data']))}\n\n"
+        finally:
+            upload.close()
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/upload_receipts", dependencies=[Depends(rate_limit("batch_upload"))])
+async def upload_receipts(
+    files: List[UploadFile] = File(...),
+    allow_duplicate: bool = Query(False, description="Skip the check against recent receipts with a matching image"),
+    token_data: TokenData = Depends(get_current_user)
+):
+    """
+    Upload several receipt images in one request. Requires authentication.
+
+    Extraction runs concurrently (up to BATCH_UPLOAD_CONCURRENCY at a time)
+    and results stream back as newline-delimited JSON, one line per file
+    as soon as it finishes with status "pending". Once all receipts have
+    been saved together, a "saved" or "failed" line follows for each
+    pending receipt, then a summary line.
+    """
+    if len(files) > settings.BATCH_UPLOAD_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many files. Maximum is {settings.BATCH_UPLOAD_MAX_FILES} per batch"
+        )
+    
+    for file in files:
+        if not file.content_type.startswith("image/"):
+            raise HTTPException(status_code=400, detail=f"File must be an image: {file.filename}")
+    
+    user = await get_user_by_email(token_data.email)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    # Read everything before streaming starts; form files are closed once the handler returns
+    uploads = []
     try:
-        saved_receipt = await save_receipt(receipt_data, "", 0.0, user.id)
-        receipt_id = saved_receipt.get("_id")
-        logger.info(f"Receipt saved to MongoDB with ID: {receipt_id} for user: {user.email}")
-    except Exception as e:
-        logger.error(f"MongoDB save failed: {str(e)}")
-        receipt_id = None
+        for file in files:
+            uploads.append(await read_upload(file))
+    except BaseException:
+        for upload in uploads:
+            upload.close()
+        raise
+    logger.info(f"Received batch upload from user {user.email}: {len(uploads)} files, {sum(u.size for u in uploads)} bytes")
     
-    return {
-        "extracted": receipt_data,
-        "confidence": 0.0,
-        "status": "processed",
-        "receipt_id": receipt_id
-    }
+    async def stream_results():
+        try:
+            contents = [(upload.filename, upload.view) for upload in uploads]
+            async for result in process_receipt_batch(contents, user.id, allow_duplicate):
+                yield json.dumps(jsonable_encoder(result)) + "\n"
+        finally:
+            for upload in uploads:
+                upload.close()
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(
+    job_id: str,
+    token_data: TokenData = Depends(get_current_user)
+):
+    """
+    Get the status of an extraction job. Requires authentication.
+    """
+    user = await get_user_by_email(token_data.email)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    job = job_queue.get(job_id, user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return job.to_dict()
+
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(
+    job_id: str,
+    response: Response,
+    token_data: TokenData = Depends(get_current_user)
+):
+    """
+    Get the extraction result of a finished job. Requires authentication.
+    Returns 202 with the job status while extraction is still running.
+    """
+    user = await get_user_by_email(token_data.email)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    job = job_queue.get(job_id, user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    if not job.finished:
+        response.status_code = 202
+        return job.to_dict()
+    
+    if job.status == JobStatus.FAILED:
+        raise_job_failure(job)
+    
+    return {**job.result, "job_id": job.id}
 
 
 @router.get("/receipt/{id}")
@@ -112,31 +288,146 @@ async def get_receipt(
     logger.info(f"Receipt retrieved successfully: {id}")
     return receipt
 
+
+async def get_receipt_image_id(id: str, token_data: TokenData) -> str:
+    user = await get_user_by_email(token_data.email)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    receipt = await get_receipt_by_id(id, user.id)
+    if not receipt or not receipt.get("image_id"):
+        raise HTTPException(status_code=404, detail="Receipt image not found")
+    return receipt["image_id"]
+
+
+@router.get("/receipt/{id}/image")
+async def get_receipt_image(
+    id: str,
+    request: Request,
+    token_data: TokenData = Depends(get_current_user)
+):
+    """
+    Download the original photo of a receipt. Requires authentication.
+    Supports `Range` requests and ETag revalidation.
+    """
+    image_id = await get_receipt_image_id(id, token_data)
+    original = await image_store.open_original(image_id)
+    if original is None:
+        raise HTTPException(status_code=404, detail="Receipt image not found")
+    
+    media_type = (original.metadata or {}).get("content_type", "application/octet-stream")
+    return await gridfs_response(request, original, media_type)
+
+
+@router.get("/receipt/{id}/thumbnail")
+async def get_receipt_thumbnail(
+    id: str,
+    request: Request,
+    token_data: TokenData = Depends(get_current_user)
+):
+    """
+    Get a small WebP preview of a receipt photo for list views. Requires
+    authentication. Supports `Range` requests and ETag revalidation.
+    """
+    image_id = await get_receipt_image_id(id, token_data)
+    thumbnail = await image_store.open_thumbnail(image_id)
+    if thumbnail is None:
+        raise HTTPException(status_code=404, detail="Receipt image not found")
+    
+    return await gridfs_response(request, thumbnail, "image/webp")
+
 @router.get("/receipts")
 async def get_receipts(
     page: int = Query(1, ge=1, description="Page number"),
     limit: int = Query(10, ge=1, le=100, description="Items per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page; overrides page"),
     token_data: TokenData = Depends(get_current_user)
 ):
     """
-    Fetch paginated list of receipts for the authenticated user.
+    Fetch paginated list of receipts for the authenticated user, newest first.
+    
+    Pass the returned `next_cursor` as `cursor` to get the following page;
+    unlike `page`, it costs the same however deep the page is.
     """
     user = await get_user_by_email(token_data.email)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     
-    logger.info(f"User {user.email} fetching receipts: page={page}, limit={limit}")
+    logger.info(f"User {user.email} fetching receipts: page={page}, cursor={cursor}, limit={limit}")
     skip = (page - 1) * limit
-    receipts = await get_all_receipts(user.id, skip=skip, limit=limit)
+    try:
+        receipts, next_cursor = await get_receipts_page(user.id, cursor=cursor, skip=skip, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
     logger.info(f"Retrieved {len(receipts)} receipts for user {user.email}")
     return {
-        "page": page,
+        "page": None if cursor else page,
         "limit": limit,
         "receipts": receipts,
-        "count": len(receipts)
+        "count": len(receipts),
+        "next_cursor": next_cursor
     }
 
+@router.get("/search")
+async def search_receipts_endpoint(
+    q: str = Query(..., min_length=1, max_length=200, description="Words to search for"),
+    prefix: bool = Query(False, description="Match word prefixes, for typeahead"),
+    page: int = Query(1, ge=1, description="Page number"),
+    limit: int = Query(20, ge=1, le=100, description="Items per page"),
+    token_data: TokenData = Depends(get_current_user)
+):
+    """
+    Search the authenticated user's receipts by store name, line items and
+    payment method. Results are ranked best match first.
+    """
+    user = await get_user_by_email(token_data.email)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    skip = (page - 1) * limit
+    # One extra result tells whether another page exists
+    receipts = await search_receipts(user.id, user.data_version, q, prefix=prefix, skip=skip, limit=limit + 1)
+    
+    return {
+        "query": q,
+        "page": page,
+        "limit": limit,
+        "receipts": receipts[:limit],
+        "count": len(receipts[:limit]),
+        "has_more": len(receipts) > limit
+    }
+
+@router.get("/export", dependencies=[Depends(rate_limit("export"))])
+async def export_receipts_endpoint(
+    format: Literal["csv", "ndjson", "parquet"] = Query("csv", description="File format"),
+    start_date: Optional[str] = Query(None, description="First purchase day (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="Last purchase day (YYYY-MM-DD)"),
+    category: Optional[str] = Query(None, description="Only this category"),
+    token_data: TokenData = Depends(get_current_user)
+):
+    """
+    Download all of the authenticated user's receipts, oldest first, as CSV,
+    NDJSON or Parquet. The file is streamed while receipts are read, so
+    downloads of any size start immediately.
+    """
+    user = await get_user_by_email(token_data.email)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d") if start_date else None
+        end = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1, microseconds=-1) if end_date else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    
+    logger.info(f"User {user.email} exporting receipts as {format}: {start_date}..{end_date}, category={category}")
+    return StreamingResponse(
+        export_receipts(user.id, format, start, end, category),
+        media_type=FORMATS[format][0],
+        headers=export_headers(format)
+    )
+
 @router.put("/receipt/{id}")
 async def update_receipt_endpoint(
     id: str,
@@ -1,84 +1,117 @@
+import logging
 from datetime import datetime
 from app.utils.db import get_database
-from collections import defaultdict
-from typing import Optional
+from app.utils.keyed_lock import KeyedLock
+from app.services.receipt_normalizer import from_minor_units
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Analytics only read these fields, so with user_id leading the index
+# MongoDB answers the pipelines from index keys without fetching documents
+ANALYTICS_INDEX = [("user_id", 1), ("created_at", 1), ("category", 1), ("total_minor", 1)]
+
+_index_ready = False
+
+# Materialized per user x month x category sums (in minor units), kept
+# current by the receipt writes in receipts_service so the unfiltered
+# analytics read a handful of rollup documents instead of every receipt
+ROLLUPS_COLLECTION = "spending_rollups"
+ROLLUP_USERS_COLLECTION = "spending_rollup_users"
+# Bumped when the rollup document format changes, so old rollups are rebuilt
+ROLLUP_SCHEMA = 2
+
+_rollup_index_ready = False
+# Users whose rollups are known to exist, so reads skip the marker lookup
+_rollup_users: Set[str] = set()
+_rebuild_locks = KeyedLock()
+
+async def get_receipts_collection():
+    global _index_ready
+
+    db = await get_database()
+    receipts_collection = db.receipts
+
+    if not _index_ready:
+        await receipts_collection.create_index(ANALYTICS_INDEX)
+        _index_ready = True
+
+    return receipts_collection
+
+
+def _totals_pipeline(match: dict, group_key, sort: dict) -> list:
+    """
+    Builds a pipeline summing the totals (in minor units) of matching receipts.
+
+    Only index fields are projected (and `_id` is dropped) so the $match
+    and $project stages stay covered by ANALYTICS_INDEX. Receipts without
+    a non-zero total are left out.
+    """
+    return [
+        {"$match": match},
+        {"$project": {"_id": 0, "created_at": 1, "category": 1, "amount": "$total_minor"}},
+        {"$match": {"amount": {"$nin": [None, 0]}}},
+        {"$group": {
+            "_id": group_key,
+            "total": {"$sum": "$amount"},
+            "count": {"$sum": 1},
+            "min": {"$min": "$amount"},
+            "max": {"$max": "$amount"},
+        }},
+        {"$sort": sort},
+    ]
+
+
+def _category_or(default: Optional[str]) -> dict:
+    # Missing, null and empty categories all fall back to `default`
+    return {"$cond": [{"$in": [{"$ifNull": ["$category", ""]}, ["", None]]}, default, "$category"]}
+
 
 async def get_monthly_analytics(user_id: str):
     """
     Returns spending totals grouped by month (YYYY-MM) for a specific user.
     """
-    db = await get_database()
-    receipts_collection = db.receipts
-    
-    cursor = receipts_collection.find({"user_id": user_id})
-    receipts = await cursor.to_list(length=None)
-    
-    monthly_totals = defaultdict(float)
-    
-    for receipt in receipts:
-        total = receipt.get("total")
-        created_at = receipt.get("created_at")
-        
-        if total and created_at:
-            # Format as YYYY-MM
-            month_key = created_at.strftime("%Y-%m")
-            monthly_totals[month_key] += total
-
-    result = [
-        {"month": month, "total": total}
-        for month, total in sorted(monthly_totals.items(), reverse=True)
-    ]
-    
-    return result
+    groups = await _read_rollups(user_id, "$month", {"_id": -1})
+
+    return [{"month": group["_id"], "total": group["total"]} for group in groups]
 
 
 async def get_category_analytics(user_id: str):
     """
     Returns spending totals grouped by category for a specific user.
     """
-    db = await get_database()
-    receipts_collection = db.receipts
-    
-    cursor = receipts_collection.find({"user_id": user_id})
-    receipts = await cursor.to_list(length=None)
-    
-    category_totals = defaultdict(float)
-    
-    for receipt in receipts:
-        total = receipt.get("total")
-        category = receipt.get("category")
-        
-        if total:
-            cat = category if category else "uncategorized"
-            category_totals[cat] += total
-    
-    result = [
-        {"category": category, "total": total}
-        for category, total in sorted(category_totals.items(), key=lambda x: x[1], reverse=True)
-    ]
-    
-    return result
+    groups = await _read_rollups(user_id, {"$ifNull": ["$category", "uncategorized"]}, {"total": -1})
+
+    return [{"category": group["_id"], "total": group["total"]} for group in groups]
 
 
 async def get_spending_by_category(user_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """
     Returns spending totals grouped by category for a specific user,
     optionally filtered by date range.
-    
+
     Args:
         user_id: User ID to filter receipts
         start_date: Optional start date in ISO format (YYYY-MM-DD)
         end_date: Optional end date in ISO format (YYYY-MM-DD)
-    
+
     Returns:
         List of dicts with category, total, and count
     """
-    db = await get_database()
-    receipts_collection = db.receipts
-    
+    if not start_date and not end_date:
+        groups = await _read_rollups(user_id, {"$ifNull": ["$category", "general"]}, {"total": -1})
+        return [
+            {"category": group["_id"], "total": group["total"], "count": group["count"]}
+            for group in groups
+        ]
+
+    # Day-level ranges don't line up with monthly rollups; sum the receipts
+    receipts_collection = await get_receipts_collection()
+
     # Build query
     query = {"user_id": user_id}
-    
+
     # Add date filtering if provided
     if start_date or end_date:
         date_filter = {}
@@ -90,39 +123,238 @@ async def get_spending_by_category(user_id: str, start_date: Optional[str] = Non
             end_dt = end_dt.replace(hour=23, minute=59, second=59, microsecond=999999)
             date_filter["$lte"] = end_dt
         query["created_at"] = date_filter
-    
-    cursor = receipts_collection.find(query)
-    receipts = await cursor.to_list(length=None)
-    
-    category_data = defaultdict(lambda: {"total": 0.0, "count": 0})
-    
+
+    pipeline = _totals_pipeline(query, _category_or("general"), {"total": -1})
+    groups = await receipts_collection.aggregate(pipeline).to_list(length=None)
+
+    return [
+        {"category": group["_id"], "total": from_minor_units(group["total"]), "count": group["count"]}
+        for group in groups
+    ]
+
+
+RollupKey = Tuple[str, str, Optional[str]]
+
+
+def rollup_entry(receipt: Optional[dict]) -> Optional[Tuple[RollupKey, int]]:
+    """
+    Returns the rollup a receipt counts towards and the amount it adds.
+
+    Returns:
+        tuple: ((user_id, "YYYY-MM", category or None), total in minor
+        units), or None if the receipt has no date or no non-zero total
+    """
+    if not receipt:
+        return None
+    amount = receipt.get("total_minor")
+    created_at = receipt.get("created_at")
+    if not amount or not isinstance(created_at, datetime):
+        return None
+    return (receipt["user_id"], created_at.strftime("%Y-%m"), receipt.get("category") or None), amount
+
+
+def _rollup_id(key: RollupKey) -> str:
+    user_id, month, category = key
+    return f"{user_id}|{month}|{category or ''}"
+
+
+async def get_rollups_collection():
+    global _rollup_index_ready
+
+    db = await get_database()
+    rollups_collection = db[ROLLUPS_COLLECTION]
+
+    if not _rollup_index_ready:
+        await rollups_collection.create_index([("user_id", 1), ("month", -1)])
+        _rollup_index_ready = True
+
+    return rollups_collection
+
+
+async def add_to_rollups(receipts: Iterable[dict]):
+    """
+    Counts newly inserted receipts into their rollups.
+
+    Receipts sharing a rollup are merged first, so a batch costs one
+    upsert per user x month x category in a single bulk write.
+    """
+    deltas: Dict[RollupKey, dict] = {}
     for receipt in receipts:
-        total = receipt.get("total", 0)
-        category = receipt.get("category") or "general"
-        
-        if total:
-            try:
-                if isinstance(total, str):
-                    # Remove commas and convert to float
-                    total = float(total.replace(',', ''))
-                elif not isinstance(total, (int, float)):
-                    # Skip if not a number
-                    continue
-                    
-                category_data[category]["total"] += float(total)
-                category_data[category]["count"] += 1
-            except (ValueError, TypeError):
-                # Skip invalid totals
-                continue
-    
-    result = [
+        entry = rollup_entry(receipt)
+        if entry is None:
+            continue
+        key, amount = entry
+        delta = deltas.setdefault(key, {"total": 0, "count": 0, "min": amount, "max": amount})
+        delta["total"] += amount
+        delta["count"] += 1
+        delta["min"] = min(delta["min"], amount)
+        delta["max"] = max(delta["max"], amount)
+
+    if not deltas:
+        return
+
+    rollups_collection = await get_rollups_collection()
+    await rollups_collection.bulk_write([
+        UpdateOne(
+            {"_id": _rollup_id(key)},
+            {
+                "$inc": {"total": delta["total"], "count": delta["count"]},
+                "$min": {"min": delta["min"]},
+                "$max": {"max": delta["max"]},
+                "$setOnInsert": {"user_id": key[0], "month": key[1], "category": key[2]},
+            },
+            upsert=True,
+        )
+        for key, delta in deltas.items()
+    ], ordered=False)
+
+
+async def _remove_from_rollup(key: RollupKey, amount: int):
+    rollups_collection = await get_rollups_collection()
+    rollup = await rollups_collection.find_one_and_update(
+        {"_id": _rollup_id(key)},
+        {"$inc": {"total": -amount, "count": -1}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if rollup is None:
+        return
+    if rollup["count"] <= 0:
+        await rollups_collection.delete_one({"_id": rollup["_id"], "count": {"$lte": 0}})
+    elif amount <= rollup.get("min", amount) or amount >= rollup.get("max", amount):
+        # $inc can't undo a $min/$max; re-derive the bounds from this month's receipts
+        await _recompute_rollup(key)
+
+
+async def _recompute_rollup(key: RollupKey):
+    user_id, month, category = key
+    start = datetime.strptime(month, "%Y-%m")
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    match = {
+        "user_id": user_id,
+        "created_at": {"$gte": start, "$lt": end},
+        "category": category if category else {"$in": [None, ""]},
+    }
+
+    receipts_collection = await get_receipts_collection()
+    groups = await receipts_collection.aggregate(_totals_pipeline(match, None, {"_id": 1})).to_list(length=None)
+
+    rollups_collection = await get_rollups_collection()
+    if not groups:
+        await rollups_collection.delete_one({"_id": _rollup_id(key)})
+        return
+    group = groups[0]
+    await rollups_collection.update_one(
+        {"_id": _rollup_id(key)},
+        {"$set": {
+            "user_id": user_id, "month": month, "category": category,
+            "total": group["total"], "count": group["count"], "min": group["min"], "max": group["max"],
+        }},
+        upsert=True,
+    )
+
+
+async def update_rollups(before: Optional[dict], after: Optional[dict]):
+    """
+    Applies the change from one version of a receipt to another.
+
+    Pass before=None for an insert and after=None for a delete. Each
+    rollup update is an atomic $inc, but receipt and rollup writes are
+    not one transaction; `rebuild_rollups` repairs any drift.
+    """
+    old = rollup_entry(before)
+    new = rollup_entry(after)
+    if old == new:
+        return
+    if old is not None:
+        await _remove_from_rollup(*old)
+    if new is not None:
+        await add_to_rollups([after])
+
+
+async def rebuild_rollups(user_id: str) -> int:
+    """
+    Regenerates a user's rollups from their receipts.
+
+    Returns:
+        int: Number of rollup documents written
+    """
+    # Concurrent rebuilds of one user would race on the same rollup ids
+    async with _rebuild_locks.hold(user_id):
+        return await _rebuild(user_id)
+
+
+async def _rebuild(user_id: str) -> int:
+    receipts_collection = await get_receipts_collection()
+    pipeline = _totals_pipeline(
+        {"user_id": user_id, "created_at": {"$gt": datetime.min}},
         {
-            "category": category,
-            "total": data["total"],
-            "count": data["count"]
-        }
-        for category, data in sorted(category_data.items(), key=lambda x: x[1]["total"], reverse=True)
-    ]
-    
-    return result
+            "month": {"$dateToString": {"format": "%Y-%m", "date": "$created_at"}},
+            "category": _category_or(None),
+        },
+        {"_id": 1},
+    )
+    groups = await receipts_collection.aggregate(pipeline).to_list(length=None)
+
+    rollups = []
+    for group in groups:
+        key = (user_id, group["_id"]["month"], group["_id"]["category"])
+        rollups.append({
+            "_id": _rollup_id(key),
+            "user_id": user_id,
+            "month": key[1],
+            "category": key[2],
+            "total": group["total"],
+            "count": group["count"],
+            "min": group["min"],
+            "max": group["max"],
+        })
+
+    rollups_collection = await get_rollups_collection()
+    # Replaced in place rather than deleted and reinserted, so readers never
+    # see the user without rollups and a concurrent $inc upsert can't collide
+    if rollups:
+        await rollups_collection.bulk_write(
+            [ReplaceOne({"_id": rollup["_id"]}, rollup, upsert=True) for rollup in rollups],
+            ordered=False
+        )
+    await rollups_collection.delete_many({"user_id": user_id, "_id": {"$nin": [rollup["_id"] for rollup in rollups]}})
+
+    db = await get_database()
+    await db[ROLLUP_USERS_COLLECTION].update_one(
+        {"_id": user_id},
+        {"$set": {"rebuilt_at": datetime.utcnow(), "rollups": len(rollups), "schema": ROLLUP_SCHEMA}},
+        upsert=True
+    )
+    _rollup_users.add(user_id)
+    return len(rollups)
+
+
+async def ensure_rollups(user_id: str):
+    """Builds a user's rollups on first read if they are missing or outdated."""
+    if user_id in _rollup_users:
+        return
+    async with _rebuild_locks.hold(user_id):
+        if user_id in _rollup_users:
+            # Built by a request we waited for
+            return
+        db = await get_database()
+        marker = await db[ROLLUP_USERS_COLLECTION].find_one({"_id": user_id})
+        if marker is not None and marker.get("schema") == ROLLUP_SCHEMA:
+            _rollup_users.add(user_id)
+            return
+        logger.info(f"Building spending rollups for user {user_id}")
+        await _rebuild(user_id)
+
+
+async def _read_rollups(user_id: str, group_key, sort: dict) -> List[dict]:
+    await ensure_rollups(user_id)
+    rollups_collection = await get_rollups_collection()
+    groups = await rollups_collection.aggregate([
+        {"$match": {"user_id": user_id, "count": {"$gt": 0}}},
+        {"$group": {"_id": group_key, "total": {"$sum": "$total"}, "count": {"$sum": "$count"}}},
+        {"$sort": sort},
+    ]).to_list(length=None)
 
+    for group in groups:
+        group["total"] = from_minor_units(group["total"])
+    return groups
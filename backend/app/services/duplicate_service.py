@@ -0,0 +1,143 @@
+"""
+Near-Duplicate Receipt Detection
+
+Flags uploads that are another photo of a receipt the user already saved.
+Each receipt stores a 64-bit difference hash of its image, split into eight
+8-bit bands. Two hashes within Hamming distance 7 must agree on at least one
+band, so an indexed `$in` over the bands finds every candidate and only those
+few are compared bit by bit.
+
+Mostly-white receipt photos crowd the hash space, so an image match is only
+a candidate: the new receipt is saved with `possible_duplicate_of` set. It is
+treated as a confirmed duplicate only when the extracted store, total and
+date also match, and only then can DUPLICATE_ACTION=skip suppress the save.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import cv2
+
+from app.services.receipt_normalizer import normalize_receipt_fields
+from app.utils.config import settings
+from app.utils.db import get_database
+from app.utils.preprocess import decode_image, dhash
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+BAND_HEX_CHARS = 2
+BANDS = HASH_BITS // (BAND_HEX_CHARS * 4)
+# Pigeonhole: hashes fewer than BANDS bits apart share at least one whole band
+MAX_GUARANTEED_DISTANCE = BANDS - 1
+
+DUPLICATE_ACTIONS = ("flag", "skip")
+# Extracted fields that must all match for an image match to count as a duplicate
+CONTENT_FIELDS = ("merchant_key", "total_minor", "date")
+
+if not 0 <= settings.DUPLICATE_MAX_DISTANCE <= MAX_GUARANTEED_DISTANCE:
+    raise ValueError(
+        f"DUPLICATE_MAX_DISTANCE must be between 0 and {MAX_GUARANTEED_DISTANCE}, "
+        f"the largest distance the {BANDS}-band index is guaranteed to find"
+    )
+if settings.DUPLICATE_ACTION not in DUPLICATE_ACTIONS:
+    raise ValueError(f"Unknown DUPLICATE_ACTION: {settings.DUPLICATE_ACTION}")
+
+_index_ready = False
+
+stats = {"checked": 0, "duplicates": 0, "confirmed": 0}
+
+
+def compute_image_hash(image_bytes: bytes) -> Optional[str]:
+    """
+    Compute the perceptual hash of an uploaded image.
+
+    Decodes at 1/8 scale since the hash only needs a 9x8 thumbnail.
+
+    Returns:
+        Hex hash string, or None if the bytes are not a decodable image
+    """
+    image = decode_image(image_bytes, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if image is None:
+        return None
+    return dhash(image)
+
+
+def hash_bands(image_hash: str) -> List[str]:
+    """Split a hex hash into position-tagged bands for bucket lookup."""
+    return [
+        f"{i // BAND_HEX_CHARS}:{image_hash[i:i + BAND_HEX_CHARS]}"
+        for i in range(0, len(image_hash), BAND_HEX_CHARS)
+    ]
+
+
+def hamming_distance(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def same_content(receipt_data: dict, existing: dict) -> bool:
+    """
+    Whether an extraction has the same store, total and date as an existing
+    receipt. Missing values never match.
+    """
+    new = normalize_receipt_fields({field: receipt_data.get(field) for field in ("store_name", "total", "date")})
+    old = normalize_receipt_fields({field: existing.get(field) for field in ("store_name", "total", "date")})
+    return all(new[field] is not None and new[field] == old[field] for field in CONTENT_FIELDS)
+
+
+def image_hash_fields(image_hash: Optional[str]) -> Dict[str, object]:
+    """Receipt document fields that put a receipt into the duplicate index."""
+    if not image_hash:
+        return {}
+    return {"image_phash": image_hash, "image_phash_bands": hash_bands(image_hash)}
+
+
+async def find_near_duplicate(user_id: str, image_hash: str) -> Optional[dict]:
+    """
+    Find the closest recent receipt of the user whose image matches the hash.
+    A match is only a candidate; confirm it with `same_content`.
+
+    Args:
+        user_id: Owner of the receipts to search
+        image_hash: Hash from `compute_image_hash`
+
+    Returns:
+        The matching receipt document, or None
+    """
+    global _index_ready
+
+    db = await get_database()
+    receipts_collection = db.receipts
+
+    if not _index_ready:
+        await receipts_collection.create_index([("user_id", 1), ("image_phash_bands", 1), ("created_at", -1)])
+        _index_ready = True
+
+    since = datetime.utcnow() - timedelta(days=settings.DUPLICATE_LOOKBACK_DAYS)
+    cursor = receipts_collection.find(
+        {
+            "user_id": user_id,
+            "image_phash_bands": {"$in": hash_bands(image_hash)},
+            "created_at": {"$gte": since},
+        },
+        {"image_phash": 1},
+    )
+
+    best_id = None
+    best_distance = settings.DUPLICATE_MAX_DISTANCE + 1
+    async for candidate in cursor:
+        distance = hamming_distance(image_hash, candidate["image_phash"])
+        if distance < best_distance:
+            best_id, best_distance = candidate["_id"], distance
+
+    stats["checked"] += 1
+    if best_id is None:
+        return None
+
+    stats["duplicates"] += 1
+    receipt = await receipts_collection.find_one({"_id": best_id})
+    if receipt:
+        receipt["_id"] = str(receipt["_id"])
+        logger.info(f"Upload matches receipt {receipt['_id']} (distance {best_distance})")
+    return receipt
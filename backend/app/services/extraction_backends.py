@@ -0,0 +1,427 @@
+"""
+Extraction Backends
+
+The model that turns a receipt image into structured data sits behind a
+small interface so the upload path can run against Gemini, local OCR, or
+a deterministic stub. The stub needs no network and is meant for offline
+throughput and tail-latency benchmarks of the upload endpoints.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import random
+import time
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple
+
+from app.services.gemini_service import extract_receipt_data, stream_receipt_text
+from app.services.job_queue import job_queue
+from app.services.process_pool import process_pool
+from app.services.receipt_parser import parse_receipt_text
+from app.services.resilience import AdaptiveLimiter, CircuitBreaker, ResilientClient, ServiceUnavailableError, TransientError
+from app.utils.config import settings
+from app.utils.preprocess import compress_for_upload, detect_mime_type
+
+logger = logging.getLogger(__name__)
+
+payload_stats = {"requests": 0, "bytes_in": 0, "bytes_sent": 0}
+
+# Name of the backend that produced the current task's latest result
+_result_source: ContextVar[Optional[str]] = ContextVar("extraction_result_source", default=None)
+
+
+def result_source() -> Optional[str]:
+    """
+    Name of the backend whose result the last `extract` or `stream` in this
+    task returned. Differs from the configured backend's name when it fell
+    back.
+    """
+    return _result_source.get()
+
+
+class BackendError(Exception):
+    """Raised when an extraction backend fails to produce a result."""
+
+
+def prepare_gemini_payload(image_bytes: bytes) -> Tuple[bytes, str]:
+    """
+    Downscales and recompresses an upload to the configured byte budget.
+
+    Returns:
+        tuple: (payload bytes, MIME type)
+    """
+    try:
+        payload, mime_type = compress_for_upload(
+            image_bytes,
+            max_edge=settings.GEMINI_IMAGE_MAX_EDGE,
+            max_bytes=settings.GEMINI_IMAGE_MAX_BYTES,
+            fmt=settings.GEMINI_IMAGE_FORMAT
+        )
+    except Exception as e:
+        logger.error(f"Image compression failed, sending original: {str(e)}")
+        payload, mime_type = image_bytes, detect_mime_type(image_bytes) or "image/jpeg"
+
+    payload_stats["requests"] += 1
+    payload_stats["bytes_in"] += len(image_bytes)
+    payload_stats["bytes_sent"] += len(payload)
+    logger.info(f"Gemini payload: {len(image_bytes)} bytes in, {len(payload)} bytes sent ({mime_type}, {len(payload) / max(len(image_bytes), 1):.0%})")
+    return payload, mime_type
+
+
+class ExtractionBackend:
+    """
+    Turns a receipt image into receipt data.
+
+    Subclasses implement `extract`; `stream` defaults to sending the whole
+    result as a single JSON fragment.
+    """
+
+    name = "base"
+    # Whether results may be written to the shared extraction cache
+    cacheable = True
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+
+    async def extract(self, image_bytes: bytes) -> Tuple[dict, str]:
+        """
+        Returns:
+            tuple: (receipt_data, raw OCR text or "" if the backend read none)
+
+        Raises:
+            BackendError: If no result could be produced
+        """
+        raise NotImplementedError
+
+    async def stream(self, image_bytes: bytes) -> AsyncIterator[str]:
+        """Yields the receipt as JSON text fragments that concatenate to one object."""
+        receipt_data, _ = await self.extract(image_bytes)
+        yield json.dumps(receipt_data)
+
+    def shutdown(self):
+        """Releases the backend's worker threads, if it has any."""
+
+    def stats(self) -> Dict[str, object]:
+        return {"name": self.name, "calls": self.calls, "failures": self.failures}
+
+
+class RemoteBackend(ExtractionBackend):
+    """
+    A backend whose model is called over the network through a ResilientClient.
+
+    While the model is unavailable (circuit open, no spare capacity or
+    retries exhausted) requests go to `fallback` if one is configured;
+    otherwise ServiceUnavailableError propagates so callers fail fast.
+    `result_source` then names the fallback, so its results can be kept
+    out of the extraction cache.
+    """
+
+    def __init__(self, client: ResilientClient, fallback: Optional[ExtractionBackend] = None):
+        super().__init__()
+        self.client = client
+        self.fallback = fallback
+        self.fallbacks = 0
+
+    def prepare(self, image_bytes: bytes) -> Tuple[bytes, str]:
+        """Turns an upload into the (payload, MIME type) sent upstream."""
+        return image_bytes, detect_mime_type(image_bytes) or "image/jpeg"
+
+    def request(self, payload: bytes, mime_type: str, timeout: float) -> dict:
+        """Blocking call returning receipt data; must honour `timeout`."""
+        raise NotImplementedError
+
+    def request_stream(self, payload: bytes, mime_type: str, timeout: float) -> Iterator[str]:
+        """Blocking call yielding JSON text fragments; must honour `timeout`."""
+        raise NotImplementedError
+
+    def _falling_back(self, error: ServiceUnavailableError) -> bool:
+        self.failures += 1
+        if self.fallback is None:
+            return False
+        self.fallbacks += 1
+        _result_source.set(self.fallback.name)
+        logger.warning(f"{self.name} unavailable ({error}), falling back to {self.fallback.name}")
+        return True
+
+    async def extract(self, image_bytes: bytes) -> Tuple[dict, str]:
+        self.calls += 1
+        payload, mime_type = await job_queue.run_blocking(self.prepare, image_bytes)
+        try:
+            receipt_data = await self.client.call(self.request, payload, mime_type)
+            _result_source.set(self.name)
+            return receipt_data, ""
+        except ServiceUnavailableError as e:
+            if not self._falling_back(e):
+                raise
+        except Exception:
+            self.failures += 1
+            raise
+        return await self.fallback.extract(image_bytes)
+
+    async def stream(self, image_bytes: bytes) -> AsyncIterator[str]:
+        self.calls += 1
+        payload, mime_type = await job_queue.run_blocking(self.prepare, image_bytes)
+        try:
+            _result_source.set(self.name)
+            async for text in self.client.stream(self.request_stream, payload, mime_type):
+                yield text
+            return
+        except ServiceUnavailableError as e:
+            # Only raised before the first fragment, so switching is safe
+            if not self._falling_back(e):
+                raise
+        except Exception:
+            self.failures += 1
+            raise
+        async for text in self.fallback.stream(image_bytes):
+            yield text
+
+    def shutdown(self):
+        self.client.shutdown()
+        if self.fallback is not None:
+            self.fallback.shutdown()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            **super().stats(),
+            "fallback": self.fallback.name if self.fallback else None,
+            "fallbacks": self.fallbacks,
+            **self.client.stats(),
+        }
+
+
+class GeminiBackend(RemoteBackend):
+    name = "gemini"
+
+    def prepare(self, image_bytes: bytes) -> Tuple[bytes, str]:
+        return prepare_gemini_payload(image_bytes)
+
+    def request(self, payload: bytes, mime_type: str, timeout: float) -> dict:
+        return extract_receipt_data(payload, mime_type, timeout=timeout)
+
+    def request_stream(self, payload: bytes, mime_type: str, timeout: float) -> Iterator[str]:
+        return stream_receipt_text(payload, mime_type, timeout=timeout)
+
+
+class LocalOCRBackend(ExtractionBackend):
+    """PaddleOCR in the process pool plus the rule-based parser."""
+
+    name = "ocr"
+
+    async def extract(self, image_bytes: bytes) -> Tuple[dict, str]:
+        self.calls += 1
+        try:
+            raw_ocr_text = await process_pool.ocr(image_bytes, pipeline=settings.OCR_PREPROCESS_PIPELINE or None)
+        except Exception as e:
+            self.failures += 1
+            raise BackendError(f"Local OCR failed: {str(e)}") from e
+        _result_source.set(self.name)
+        return parse_receipt_text(raw_ocr_text), raw_ocr_text
+
+
+LATENCY_DISTRIBUTIONS = ("constant", "uniform", "normal", "lognormal", "exponential")
+
+STUB_STORES = [
+    ("Fresh Mart", "grocery"),
+    ("Spice Route Kitchen", "restaurant"),
+    ("City Fuel Station", "petrol"),
+    ("Wellness Pharmacy", "pharmacy"),
+    ("Gadget Hub", "electronics"),
+    ("QuickBite Delivery", "food_delivery"),
+]
+STUB_ITEMS = ["Milk", "Bread", "Eggs", "Rice", "Paneer", "Coffee", "Tea", "Biscuits", "Soap", "Apples"]
+STUB_PAYMENT_METHODS = ["Cash", "Card", "UPI"]
+
+
+class StubBackend(RemoteBackend):
+    """
+    Deterministic offline backend for load testing.
+
+    The same image always yields the same receipt. Each call blocks a job
+    queue worker for a latency drawn from the configured distribution, the
+    way a real SDK call would, and can be made to fail or stall at random.
+    Calls go through the same ResilientClient as Gemini, so timeouts,
+    retries, the concurrency limit and the circuit breaker can be
+    exercised offline.
+
+    Args:
+        client: Client wrapping every call
+        fallback: Backend used while the stub is "unavailable"
+        distribution: One of LATENCY_DISTRIBUTIONS
+        latency_ms: Median latency (mean for "exponential")
+        spread: Shape of the distribution: relative half-width for
+            "uniform", coefficient of variation for "normal", sigma for
+            "lognormal"
+        failure_rate: Probability a call raises BackendError
+        stall_rate: Probability a call takes `stall_ms` instead
+        stall_ms: Latency of a stalled call
+        seed: Seed for latency and failure draws; None for nondeterministic
+    """
+
+    name = "stub"
+    cacheable = False
+
+    def __init__(
+        self,
+        client: ResilientClient,
+        fallback: Optional[ExtractionBackend] = None,
+        distribution: str = "lognormal",
+        latency_ms: float = 1500.0,
+        spread: float = 0.5,
+        failure_rate: float = 0.0,
+        stall_rate: float = 0.0,
+        stall_ms: float = 30000.0,
+        seed: Optional[int] = None
+    ):
+        super().__init__(client, fallback)
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+
+        self.distribution = distribution
+        self.latency_ms = latency_ms
+        self.spread = spread
+        self.failure_rate = failure_rate
+        self.stall_rate = stall_rate
+        self.stall_ms = stall_ms
+        self._rng = random.Random(seed)
+        self.stalls = 0
+        self.injected_failures = 0
+
+    def sample_latency(self) -> float:
+        """Latency of the next call in seconds."""
+        if self.stall_rate and self._rng.random() < self.stall_rate:
+            self.stalls += 1
+            return self.stall_ms / 1000
+
+        m, s = self.latency_ms, self.spread
+        if self.distribution == "constant":
+            latency = m
+        elif self.distribution == "uniform":
+            latency = self._rng.uniform(m * (1 - s), m * (1 + s))
+        elif self.distribution == "normal":
+            latency = self._rng.gauss(m, m * s)
+        elif self.distribution == "lognormal":
+            latency = m * math.exp(self._rng.gauss(0, s))
+        else:
+            latency = self._rng.expovariate(1 / m) if m > 0 else 0.0
+        return max(latency, 0.0) / 1000
+
+    @staticmethod
+    def fake_receipt(image_bytes: bytes) -> dict:
+        """A plausible receipt derived from the image's hash."""
+        rng = random.Random(hashlib.sha256(image_bytes).digest())
+        store_name, category = rng.choice(STUB_STORES)
+        items = [
+            {
+                "name": rng.choice(STUB_ITEMS),
+                "quantity": rng.randint(1, 3),
+                "price": round(rng.uniform(10, 500), 2),
+            }
+            for _ in range(rng.randint(1, 6))
+        ]
+        return {
+            "store_name": store_name,
+            "date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "total": round(sum(item["quantity"] * item["price"] for item in items), 2),
+            "category": category,
+            "payment_method": rng.choice(STUB_PAYMENT_METHODS),
+            "items": items,
+        }
+
+    def _wait(self, latency: float, timeout: Optional[float]):
+        if timeout is not None and latency > timeout:
+            timeout = max(0.0, timeout)
+            time.sleep(timeout)
+            raise TimeoutError(f"Stub call timed out after {timeout}s")
+        time.sleep(latency)
+
+    def _maybe_fail(self, rate: float):
+        if rate and self._rng.random() < rate:
+            self.injected_failures += 1
+            raise TransientError("Injected stub failure")
+
+    def request(self, payload: bytes, mime_type: str, timeout: float) -> dict:
+        self._wait(self.sample_latency(), timeout)
+        self._maybe_fail(self.failure_rate)
+        return self.fake_receipt(payload)
+
+    def request_stream(self, payload: bytes, mime_type: str, timeout: float, chunks: int = 8) -> Iterator[str]:
+        # Spread the latency over the fragments like a streamed model response
+        latency = self.sample_latency()
+        deadline = time.monotonic() + timeout if timeout else None
+        text = json.dumps(self.fake_receipt(payload))
+        size = math.ceil(len(text) / chunks)
+        for start in range(0, len(text), size):
+            remaining = None
+            if deadline is not None:
+                remaining = max(0.0, deadline - time.monotonic())
+                if remaining == 0:
+                    raise TimeoutError(f"Stub stream timed out after {timeout}s")
+            self._wait(latency / chunks, remaining)
+            self._maybe_fail(self.failure_rate / chunks)
+            yield text[start:start + size]
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            **super().stats(),
+            "distribution": self.distribution,
+            "latency_ms": self.latency_ms,
+            "spread": self.spread,
+            "failure_rate": self.failure_rate,
+            "stall_rate": self.stall_rate,
+            "stalls": self.stalls,
+            "injected_failures": self.injected_failures,
+        }
+
+
+def create_client(name: str) -> ResilientClient:
+    limiter = AdaptiveLimiter(
+        initial=settings.GEMINI_LIMIT_INITIAL,
+        min_limit=settings.GEMINI_LIMIT_MIN,
+        max_limit=settings.GEMINI_LIMIT_MAX,
+        latency_target=settings.GEMINI_LIMIT_LATENCY_SECONDS,
+        backoff=settings.GEMINI_LIMIT_BACKOFF,
+    )
+    breaker = CircuitBreaker(
+        failure_threshold=settings.GEMINI_BREAKER_FAILURES,
+        reset_timeout=settings.GEMINI_BREAKER_RESET_SECONDS,
+    )
+    return ResilientClient(
+        name,
+        limiter,
+        breaker,
+        timeout=settings.GEMINI_TIMEOUT_SECONDS,
+        max_retries=settings.GEMINI_MAX_RETRIES,
+        retry_base=settings.GEMINI_RETRY_BASE_SECONDS,
+        retry_max=settings.GEMINI_RETRY_MAX_SECONDS,
+        acquire_timeout=settings.GEMINI_ACQUIRE_TIMEOUT_SECONDS,
+    )
+
+
+def create_backend(name: str) -> ExtractionBackend:
+    """Builds the backend named by EXTRACTION_BACKEND."""
+    if name == "ocr":
+        return LocalOCRBackend()
+
+    fallback = LocalOCRBackend() if settings.GEMINI_FALLBACK == "ocr" else None
+    if name == "gemini":
+        return GeminiBackend(create_client(name), fallback)
+    if name == "stub":
+        return StubBackend(
+            create_client(name),
+            fallback,
+            distribution=settings.STUB_LATENCY_DISTRIBUTION,
+            latency_ms=settings.STUB_LATENCY_MS,
+            spread=settings.STUB_LATENCY_SPREAD,
+            failure_rate=settings.STUB_FAILURE_RATE,
+            stall_rate=settings.STUB_STALL_RATE,
+            stall_ms=settings.STUB_STALL_MS,
+            seed=settings.STUB_SEED,
+        )
+    raise ValueError(f"Unknown extraction backend: {name}")
+
+
+extraction_backend = create_backend(settings.EXTRACTION_BACKEND)
@@ -0,0 +1,136 @@
+"""
+Extraction Cache
+
+Content-addressed cache of Gemini extraction results, keyed by the SHA-256
+of the uploaded image bytes. An in-process LRU sits in front of a Mongo
+collection whose documents expire through a TTL index.
+"""
+
+import copy
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from app.utils.config import settings
+from app.utils.db import get_database
+
+logger = logging.getLogger(__name__)
+
+
+def hash_image(image_bytes: bytes) -> str:
+    """Return the hex SHA-256 digest identifying an image."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class ExtractionCache:
+    """Two-level (memory + Mongo) cache of structured extraction results."""
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._index_ready = False
+
+        self.memory_hits = 0
+        self.mongo_hits = 0
+        self.misses = 0
+        self._miss_seconds = 0.0
+        self._timed_misses = 0
+
+    async def _collection(self):
+        db = await get_database()
+        collection = db.extraction_cache
+        if not self._index_ready:
+            await collection.create_index("created_at", expireAfterSeconds=self.ttl_seconds)
+            self._index_ready = True
+        return collection
+
+    def _remember(self, image_hash: str, data: Dict[str, Any]):
+        with self._lock:
+            self._entries[image_hash] = data
+            self._entries.move_to_end(image_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def get(self, image_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached extraction.
+
+        Args:
+            image_hash: Digest from `hash_image`
+
+        Returns:
+            A copy of the cached receipt data, or None on a miss
+        """
+        with self._lock:
+            data = self._entries.get(image_hash)
+            if data is not None:
+                self._entries.move_to_end(image_hash)
+                self.memory_hits += 1
+                return copy.deepcopy(data)
+
+        try:
+            collection = await self._collection()
+            doc = await collection.find_one({"_id": image_hash})
+        except Exception as e:
+            logger.error(f"Extraction cache lookup failed: {str(e)}")
+            doc = None
+
+        if doc is None:
+            self.misses += 1
+            return None
+
+        self.mongo_hits += 1
+        self._remember(image_hash, doc["data"])
+        return copy.deepcopy(doc["data"])
+
+    async def set(self, image_hash: str, data: Dict[str, Any], extraction_seconds: Optional[float] = None):
+        """
+        Store an extraction result.
+
+        Args:
+            image_hash: Digest from `hash_image`
+            data: Structured receipt data returned by the extractor
+            extraction_seconds: How long the uncached extraction took, used
+                to estimate the time saved by later hits
+        """
+        if extraction_seconds is not None:
+            self._miss_seconds += extraction_seconds
+            self._timed_misses += 1
+
+        data = copy.deepcopy(data)
+        self._remember(image_hash, data)
+
+        try:
+            collection = await self._collection()
+            await collection.replace_one(
+                {"_id": image_hash},
+                {"_id": image_hash, "data": data, "created_at": datetime.utcnow()},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Extraction cache write failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.mongo_hits
+        lookups = hits + self.misses
+        avg_extraction = self._miss_seconds / self._timed_misses if self._timed_misses else 0.0
+        return {
+            "memory_hits": self.memory_hits,
+            "mongo_hits": self.mongo_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._entries),
+            "avg_extraction_seconds": avg_extraction,
+            "estimated_seconds_saved": hits * avg_extraction,
+        }
+
+
+extraction_cache = ExtractionCache(
+    max_entries=settings.EXTRACTION_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.EXTRACTION_CACHE_TTL_SECONDS,
+)
@@ -0,0 +1,575 @@
+"""
+Receipt Extraction Pipeline
+
+Turns an uploaded receipt image into a saved receipt document. Runs inside
+an extraction job; blocking work is pushed onto the job queue's worker pool.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import AsyncIterator, Iterable, List, Optional, Set, Tuple
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from app.services.gemini_service import parse_response_text, EMPTY_RECEIPT
+from app.services.extraction_backends import extraction_backend, result_source
+from app.services.resilience import ServiceUnavailableError
+from app.services.receipts_service import save_receipt, save_receipts, build_receipt_doc, inserted_receipt_ids
+from app.services.category_service import CategoryService
+from app.services.job_queue import job_queue
+from app.services.extraction_cache import extraction_cache, hash_image
+from app.services import image_store
+from app.services import duplicate_service
+from app.services.duplicate_service import compute_image_hash, find_near_duplicate, image_hash_fields, same_content
+from app.utils.config import settings
+from app.utils.db import get_database
+from app.services.process_pool import process_pool
+from app.services.receipt_parser import parse_receipt_text
+from app.utils.confidence import calculate_confidence
+from app.utils.json_stream import IncrementalJSONParser
+
+logger = logging.getLogger(__name__)
+
+# Tiered extraction outcomes: accepted from local OCR vs escalated to the extraction backend
+tier_stats = {"local": 0, "escalated": 0, "ocr_failed": 0}
+
+# Array fields reported element by element while streaming
+STREAMED_ARRAYS = ["items"]
+
+# Batch inserts still running after their client disconnected
+_pending_saves: Set[asyncio.Task] = set()
+
+
+def tier_summary() -> dict:
+    attempts = tier_stats["local"] + tier_stats["escalated"]
+    return {
+        "mode": settings.EXTRACTION_MODE,
+        "threshold": settings.OCR_CONFIDENCE_THRESHOLD,
+        **tier_stats,
+        "escalation_rate": tier_stats["escalated"] / attempts if attempts else 0.0,
+    }
+
+
+async def extract_locally(image_bytes: bytes) -> Tuple[dict, str, float]:
+    """
+    First extraction tier: PaddleOCR in the process pool plus the rule-based parser.
+
+    Returns:
+        tuple: (receipt_data, raw_ocr_text, confidence score)
+    """
+    try:
+        raw_ocr_text = await process_pool.ocr(image_bytes, pipeline=settings.OCR_PREPROCESS_PIPELINE or None)
+    except Exception as e:
+        logger.error(f"Local OCR failed: {str(e)}")
+        tier_stats["ocr_failed"] += 1
+        return {}, "", 0.0
+
+    receipt_data = parse_receipt_text(raw_ocr_text)
+    score, status = calculate_confidence(receipt_data, raw_ocr_text)
+    logger.info(f"Local OCR extraction: store={receipt_data.get('store_name')}, total={receipt_data.get('total')}, confidence={score} ({status})")
+    return receipt_data, raw_ocr_text, score
+
+
+async def extract_with_backend(image_bytes: bytes) -> Tuple[dict, str]:
+    receipt_data, raw_text = await extraction_backend.extract(image_bytes)
+    logger.info(f"{extraction_backend.name} extraction completed: store={receipt_data.get('store_name')}, total={receipt_data.get('total')}")
+    return receipt_data, raw_text
+
+
+def _new_extraction() -> dict:
+    return {
+        "receipt_data": {},
+        "raw_ocr_text": "",
+        "confidence": 0.0,
+        "source": None,
+        "image_phash": None,
+        "image_id": None,
+        "duplicate": None,
+        "duplicate_confirmed": False,
+    }
+
+
+async def _check_duplicate(extraction: dict, image_bytes: bytes, user_id: str, allow_duplicate: bool):
+    """Hashes the image into `extraction` and records the user's receipt with a matching image, if any."""
+    try:
+        extraction["image_phash"] = await job_queue.run_blocking(compute_image_hash, image_bytes)
+        if extraction["image_phash"] and not allow_duplicate:
+            extraction["duplicate"] = await find_near_duplicate(user_id, extraction["image_phash"])
+    except Exception as e:
+        logger.error(f"Duplicate check failed: {str(e)}")
+
+
+async def _try_local_tier(extraction: dict, image_bytes: bytes) -> Optional[dict]:
+    """
+    Runs the local OCR tier when tiered mode is on.
+
+    Returns:
+        The parsed receipt data if it scored above the threshold, else None
+    """
+    if settings.EXTRACTION_MODE != "tiered":
+        return None
+
+    local_data, raw_ocr_text, confidence = await extract_locally(image_bytes)
+    extraction.update(raw_ocr_text=raw_ocr_text, confidence=confidence)
+
+    if confidence >= settings.OCR_CONFIDENCE_THRESHOLD:
+        tier_stats["local"] += 1
+        return local_data
+
+    tier_stats["escalated"] += 1
+    logger.info(f"Escalating to {extraction_backend.name}: local confidence {confidence} < {settings.OCR_CONFIDENCE_THRESHOLD}")
+    return None
+
+
+def _finalize_receipt_data(receipt_data: dict):
+    if not receipt_data:
+        return
+
+    gemini_category = receipt_data.get('category')
+
+    if gemini_category and CategoryService.validate_category(gemini_category):
+        logger.info(f"Gemini assigned category: {gemini_category}")
+    else:
+        category = CategoryService.assign_category(receipt_data)
+        receipt_data['category'] = category
+        logger.info(f"Auto-assigned category (fallback): {category}")
+
+    if not receipt_data.get('date'):
+        current_date = datetime.now().strftime("%Y-%m-%d")
+        receipt_data['date'] = current_date
+        logger.info(f"Date missing, defaulted to: {current_date}")
+
+
+def _confirm_duplicate(extraction: dict):
+    """Confirms an image match against the extracted store, total and date."""
+    duplicate = extraction["duplicate"]
+    if duplicate is not None and same_content(extraction["receipt_data"], duplicate):
+        extraction["duplicate_confirmed"] = True
+        duplicate_service.stats["confirmed"] += 1
+
+
+def _suppressed(extraction: dict) -> bool:
+    """Whether the upload is a confirmed duplicate that shouldn't be saved."""
+    return extraction["duplicate_confirmed"] and settings.DUPLICATE_ACTION == "skip"
+
+
+def _duplicate_fields(extraction: dict) -> dict:
+    """Flags a saved receipt whose image matched an earlier one."""
+    if extraction["duplicate"] is None:
+        return {}
+    return {"possible_duplicate_of": extraction["duplicate"]["_id"]}
+
+
+def _rescore_with_ocr(extraction: dict, receipt_data: dict):
+    if extraction["raw_ocr_text"]:
+        extraction["confidence"], _ = calculate_confidence(receipt_data, extraction["raw_ocr_text"])
+
+
+async def extract_receipt(image_bytes: bytes, user_id: str, allow_duplicate: bool = False) -> dict:
+    """
+    Extracts and categorizes a receipt image without saving it.
+
+    In "tiered" mode local OCR runs first and the extraction backend is
+    only called when the local result scores below OCR_CONFIDENCE_THRESHOLD.
+
+    Args:
+        image_bytes: The uploaded image as bytes
+        user_id: ID of the user who owns the receipt
+        allow_duplicate: Skip the near-duplicate check
+
+    Returns:
+        dict: receipt_data, raw_ocr_text, confidence, source ("ocr",
+        "cache" or the name of the backend that produced it) and image_phash. When `duplicate` is set it
+        is the user's existing receipt with a matching image, and
+        `duplicate_confirmed` says whether the extracted content matches too.
+
+    Raises:
+        ServiceUnavailableError: If the extraction backend is unavailable
+    """
+    extraction = _new_extraction()
+
+    await _check_duplicate(extraction, image_bytes, user_id, allow_duplicate)
+
+    image_hash = await job_queue.run_blocking(hash_image, image_bytes)
+    receipt_data = await extraction_cache.get(image_hash)
+
+    if receipt_data is not None:
+        logger.info(f"Extraction cache hit for image {image_hash[:12]}")
+        source = "cache"
+    else:
+        started = time.perf_counter()
+        receipt_data = await _try_local_tier(extraction, image_bytes)
+        source = "ocr"
+        fell_back = False
+
+        if receipt_data is None:
+            source = extraction_backend.name
+            try:
+                receipt_data, raw_text = await extract_with_backend(image_bytes)
+                source = result_source() or source
+                fell_back = source != extraction_backend.name
+                if raw_text:
+                    extraction["raw_ocr_text"] = raw_text
+                _rescore_with_ocr(extraction, receipt_data)
+            except ServiceUnavailableError:
+                # Fail the upload rather than save an empty receipt
+                raise
+            except Exception as e:
+                logger.error(f"{extraction_backend.name} extraction failed: {str(e)}")
+                receipt_data = {}
+
+        # A fallback result stands in for the backend's only while it is down
+        if extraction_backend.cacheable and not fell_back and (receipt_data.get('store_name') or receipt_data.get('total')):
+            await extraction_cache.set(image_hash, receipt_data, extraction_seconds=time.perf_counter() - started)
+
+    _finalize_receipt_data(receipt_data)
+
+    extraction.update(receipt_data=receipt_data, source=source)
+    _confirm_duplicate(extraction)
+    return extraction
+
+
+def _duplicate_result(duplicate: dict) -> dict:
+    return {
+        "extracted": duplicate,
+        "confidence": duplicate.get("confidence", 0.0),
+        "status": "duplicate",
+        "receipt_id": duplicate["_id"],
+        "duplicate_of": duplicate["_id"]
+    }
+
+
+async def _store_image(image_bytes: bytes, user_id: str, filename: Optional[str]) -> Optional[str]:
+    """Keeps the original upload in GridFS; a failure here never fails the upload."""
+    if not settings.STORE_RECEIPT_IMAGES:
+        return None
+    try:
+        return await image_store.save_original(image_bytes, user_id, filename)
+    except Exception as e:
+        logger.error(f"Storing receipt image failed: {str(e)}")
+        return None
+
+
+async def _discard_images(image_ids: Iterable[str]):
+    """Deletes images whose receipt was never saved."""
+    for image_id in image_ids:
+        try:
+            await image_store.delete_images(image_id)
+        except Exception as e:
+            logger.error(f"Deleting unsaved receipt image {image_id} failed: {str(e)}")
+
+
+async def _save_extraction(extraction: dict, user_id: str, image_bytes: bytes, filename: Optional[str] = None) -> dict:
+    """Saves an extraction with its original image and returns the upload result."""
+    receipt_data = extraction["receipt_data"]
+    image_id = await _store_image(image_bytes, user_id, filename)
+    try:
+        saved_receipt = await save_receipt(
+            {**receipt_data, **image_hash_fields(extraction["image_phash"]), **_duplicate_fields(extraction), "image_id": image_id},
+            extraction["raw_ocr_text"],
+            extraction["confidence"],
+            user_id
+        )
+        receipt_id = saved_receipt.get("_id")
+        logger.info(f"Receipt saved to MongoDB with ID: {receipt_id} for user: {user_id}")
+    except Exception as e:
+        logger.error(f"MongoDB save failed: {str(e)}")
+        receipt_id = None
+        if image_id:
+            await _discard_images([image_id])
+            image_id = None
+
+    return {
+        "extracted": receipt_data,
+        "confidence": extraction["confidence"],
+        "status": "processed",
+        "source": extraction["source"],
+        "receipt_id": receipt_id,
+        "image_id": image_id,
+        **_duplicate_fields(extraction)
+    }
+
+
+async def process_receipt_upload(
+    image_bytes: bytes,
+    user_id: str,
+    allow_duplicate: bool = False,
+    filename: Optional[str] = None
+) -> dict:
+    """
+    Extracts, categorizes and saves a receipt image.
+
+    Args:
+        image_bytes: The uploaded image as bytes
+        user_id: ID of the user who owns the receipt
+        allow_duplicate: Save the receipt even if it looks like another
+            photo of one the user already uploaded
+        filename: Client filename, kept with the stored image
+
+    Returns:
+        dict: Upload result with extracted data and saved receipt ID, and
+        `possible_duplicate_of` if the image matched an earlier receipt.
+        With DUPLICATE_ACTION=skip, a receipt whose image, store, total and
+        date all match is not saved; the existing one is returned with
+        status "duplicate".
+
+    Raises:
+        ServiceUnavailableError: If the extraction backend is unavailable
+    """
+    extraction = await extract_receipt(image_bytes, user_id, allow_duplicate)
+    if _suppressed(extraction):
+        return _duplicate_result(extraction["duplicate"])
+
+    return await _save_extraction(extraction, user_id, image_bytes, filename)
+
+
+def _field_events(receipt_data: dict) -> List[dict]:
+    """Progress events for a receipt that was extracted in one piece."""
+    events = []
+    for key, value in receipt_data.items():
+        if key in STREAMED_ARRAYS and isinstance(value, list):
+            events.extend({"event": "item", "data": {"field": key, "index": i, "item": item}} for i, item in enumerate(value))
+        else:
+            events.append({"event": "field", "data": {"field": key, "value": value}})
+    return events
+
+
+async def stream_receipt_upload(
+    image_bytes: bytes,
+    user_id: str,
+    allow_duplicate: bool = False,
+    filename: Optional[str] = None
+) -> AsyncIterator[dict]:
+    """
+    Extracts and saves a receipt, reporting fields as soon as they are known.
+
+    The backend's response is streamed through an incremental JSON parser, so
+    store_name, total and each line item are yielded the moment they
+    complete rather than after the whole response arrives.
+
+    Args:
+        image_bytes: The uploaded image as bytes
+        user_id: ID of the user who owns the receipt
+        allow_duplicate: Skip the near-duplicate check
+        filename: Client filename, kept with the stored image
+
+    Yields:
+        dict: {"event": "field" | "item" | "error" | "done", "data": ...};
+        "done" carries the same result as process_receipt_upload
+    """
+    extraction = _new_extraction()
+
+    await _check_duplicate(extraction, image_bytes, user_id, allow_duplicate)
+
+    image_hash = await job_queue.run_blocking(hash_image, image_bytes)
+    receipt_data = await extraction_cache.get(image_hash)
+    source = "cache"
+    started = time.perf_counter()
+    fell_back = False
+
+    if receipt_data is None:
+        receipt_data = await _try_local_tier(extraction, image_bytes)
+        source = "ocr"
+
+    if receipt_data is not None:
+        for event in _field_events(receipt_data):
+            yield event
+    else:
+        source = extraction_backend.name
+        parser = IncrementalJSONParser(stream_arrays=STREAMED_ARRAYS)
+        chunks = []
+        try:
+            async for text in extraction_backend.stream(image_bytes):
+                chunks.append(text)
+                for event in parser.feed(text):
+                    if "element" in event:
+                        yield {"event": "item", "data": {"field": event["field"], "index": event["index"], "item": event["element"]}}
+                    elif event["field"] not in STREAMED_ARRAYS:
+                        yield {"event": "field", "data": event}
+
+            receipt_data = parse_response_text("".join(chunks))
+            source = result_source() or source
+            fell_back = source != extraction_backend.name
+            logger.info(f"{extraction_backend.name} streaming extraction completed: store={receipt_data.get('store_name')}, total={receipt_data.get('total')}")
+            _rescore_with_ocr(extraction, receipt_data)
+        except ServiceUnavailableError as e:
+            logger.error(f"{extraction_backend.name} unavailable: {str(e)}")
+            yield {"event": "error", "data": {"detail": "Extraction service unavailable", "retry_after": round(e.retry_after)}}
+            return
+        except Exception as e:
+            logger.error(f"{extraction_backend.name} streaming extraction failed: {str(e)}")
+            yield {"event": "error", "data": {"detail": "Extraction failed"}}
+            receipt_data = dict(EMPTY_RECEIPT, items=[])
+
+        if extraction_backend.cacheable and not fell_back and (receipt_data.get('store_name') or receipt_data.get('total')):
+            await extraction_cache.set(image_hash, receipt_data, extraction_seconds=time.perf_counter() - started)
+
+    _finalize_receipt_data(receipt_data)
+    extraction.update(receipt_data=receipt_data, source=source)
+    _confirm_duplicate(extraction)
+
+    if _suppressed(extraction):
+        yield {"event": "done", "data": _duplicate_result(extraction["duplicate"])}
+        return
+    yield {"event": "done", "data": await _save_extraction(extraction, user_id, image_bytes, filename)}
+
+
+async def _persist_batch(receipt_docs: List[dict], orphaned_image_ids: List[str]) -> Tuple[Set[str], Optional[str]]:
+    """
+    Inserts a batch's receipts and deletes the images of any that weren't saved.
+
+    Returns:
+        (IDs of the saved receipts, error message or None)
+    """
+    await _discard_images(orphaned_image_ids)
+    try:
+        saved_ids = set(await save_receipts(receipt_docs))
+        if receipt_docs:
+            logger.info(f"Batch saved {len(saved_ids)} receipts for user: {receipt_docs[0]['user_id']}")
+        return saved_ids, None
+    except BulkWriteError as e:
+        # Part of the unordered insert was written, and save_receipts indexed that part
+        saved_ids = set(inserted_receipt_ids(receipt_docs, e))
+        save_error = str(e)
+        logger.error(f"MongoDB batch save failed for {len(receipt_docs) - len(saved_ids)} of {len(receipt_docs)} receipts: {save_error}")
+    except Exception as e:
+        logger.error(f"MongoDB batch save failed: {str(e)}")
+        save_error = str(e)
+        # The insert may have succeeded before a later step failed
+        try:
+            db = await get_database()
+            inserted = await db.receipts.distinct("_id", {"_id": {"$in": [doc["_id"] for doc in receipt_docs]}})
+            saved_ids = {str(receipt_id) for receipt_id in inserted}
+        except Exception as e:
+            logger.error(f"Checking batch save failed: {str(e)}")
+            # Without knowing what was written, keep every image
+            return set(), save_error
+
+    await _discard_images(
+        doc["image_id"] for doc in receipt_docs
+        if doc.get("image_id") and str(doc["_id"]) not in saved_ids
+    )
+    return saved_ids, save_error
+
+
+async def process_receipt_batch(
+    files: List[Tuple[str, bytes]],
+    user_id: str,
+    allow_duplicate: bool = False,
+    concurrency: Optional[int] = None
+) -> AsyncIterator[dict]:
+    """
+    Extracts many receipt images concurrently and saves them in one insert.
+
+    Each file's result is yielded as soon as its extraction finishes, with
+    status "pending" and the ID its receipt will be saved under. Once every
+    file is done the receipts are written with a single insert_many, and a
+    "saved" (or "failed") event follows for each pending receipt. The insert
+    runs to completion even if the client disconnects, and images of
+    receipts that weren't saved are deleted.
+
+    Args:
+        files: (filename, image bytes) pairs
+        user_id: ID of the user who owns the receipts
+        allow_duplicate: Skip the near-duplicate check
+        concurrency: Maximum extractions in flight for this batch
+
+    Yields:
+        dict: One result per file in completion order, one save result per
+        pending receipt, then a summary
+    """
+    semaphore = asyncio.Semaphore(concurrency or settings.BATCH_UPLOAD_CONCURRENCY)
+
+    async def handle(index: int, filename: str, content: bytes):
+        async with semaphore:
+            try:
+                extraction = await extract_receipt(content, user_id, allow_duplicate)
+                if not _suppressed(extraction):
+                    extraction["image_id"] = await _store_image(content, user_id, filename)
+                return index, filename, extraction, None
+            except Exception as e:
+                logger.error(f"Batch extraction failed for {filename}: {str(e)}")
+                return index, filename, None, str(e)
+
+    tasks = [asyncio.create_task(handle(i, name, content)) for i, (name, content) in enumerate(files)]
+    pending = []
+    receipt_docs = []
+    duplicates = 0
+    failed = 0
+
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, filename, extraction, error = await next_done
+            tasks[index] = None
+
+            if error is not None:
+                failed += 1
+                yield {"index": index, "filename": filename, "status": "failed", "error": error}
+                continue
+
+            if _suppressed(extraction):
+                duplicates += 1
+                yield {"index": index, "filename": filename, **_duplicate_result(extraction["duplicate"])}
+                continue
+
+            receipt_data = extraction["receipt_data"]
+            receipt_doc = build_receipt_doc(
+                {**receipt_data, **image_hash_fields(extraction["image_phash"]), **_duplicate_fields(extraction), "image_id": extraction["image_id"]},
+                extraction["raw_ocr_text"],
+                extraction["confidence"],
+                user_id
+            )
+            receipt_doc["_id"] = ObjectId()
+            receipt_docs.append(receipt_doc)
+            pending.append((index, filename, str(receipt_doc["_id"])))
+
+            yield {
+                "index": index,
+                "filename": filename,
+                "extracted": receipt_data,
+                "confidence": extraction["confidence"],
+                "status": "pending",
+                "source": extraction["source"],
+                "receipt_id": str(receipt_doc["_id"]),
+                "image_id": extraction["image_id"],
+                **_duplicate_fields(extraction)
+            }
+    finally:
+        # Stop outstanding extractions if the client disconnects mid-stream
+        orphaned_image_ids = []
+        for task in tasks:
+            if task is None:
+                continue
+            if task.done() and not task.cancelled():
+                # Finished, but its result was never reported
+                extraction = task.result()[2]
+                if extraction and extraction.get("image_id"):
+                    orphaned_image_ids.append(extraction["image_id"])
+            task.cancel()
+
+        # A task of its own, so a disconnect doesn't cancel the insert of receipts already reported
+        save = asyncio.ensure_future(_persist_batch(receipt_docs, orphaned_image_ids))
+        _pending_saves.add(save)
+        save.add_done_callback(_pending_saves.discard)
+
+    saved_ids, save_error = await asyncio.shield(save)
+
+    for index, filename, receipt_id in pending:
+        if receipt_id in saved_ids:
+            yield {"index": index, "filename": filename, "status": "saved", "receipt_id": receipt_id}
+        else:
+            yield {"index": index, "filename": filename, "status": "failed", "receipt_id": receipt_id, "error": save_error}
+
+    yield {
+        "summary": {
+            "files": len(files),
+            "processed": len(receipt_docs),
+            "duplicates": duplicates,
+            "failed": failed,
+            "saved": len(saved_ids),
+            "save_error": save_error
+        }
+    }
@@ -1,13 +1,17 @@
-import google.generativeai as genai
 from app.utils.config import settings
+from app.services.model_registry import models
+from typing import Iterator, Optional
 import json
 import base64
 
-# Configure Gemini API
-genai.configure(api_key=settings.GEMINI_API_KEY)
+def _load_gemini_model():
+    # The SDK import alone is slow, so it happens on first use too
+    import google.generativeai as genai
 
-# Initialize the model
-model = genai.GenerativeModel('gemini-2.5-flash')
+    genai.configure(api_key=settings.GEMINI_API_KEY)
+    return genai.GenerativeModel('gemini-2.5-flash')
+
+models.register("gemini", _load_gemini_model)
 
 EXTRACTION_PROMPT = """
 Extract all visible information from the receipt image.
@@ -43,46 +47,75 @@ For "payment_method", extract the payment method if visible (e.g., "Cash", "Card
 
 """
 
-def extract_receipt_data(image_bytes: bytes) -> dict:
+EMPTY_RECEIPT = {
+    "store_name": None,
+    "date": None,
+    "total": None,
+    "items": []
+}
+
+def _image_part(image_bytes: bytes, mime_type: str) -> dict:
+    return {
+        "mime_type": mime_type,
+        "data": base64.b64encode(image_bytes).decode('utf-8')
+    }
+
+def parse_response_text(response_text: str) -> dict:
+    """Strips optional markdown fences from a model response and parses the JSON."""
+    response_text = response_text.strip()
+    
+    if response_text.startswith("```json"):
+        response_text = response_text[7:]
+    if response_text.startswith("```"):
+        response_text = response_text[3:]
+    if response_text.endswith("```"):
+        response_text = response_text[:-3]
+        
+    return json.loads(response_text.strip())
+
+def _request_options(timeout: Optional[float]) -> dict:
+    return {"timeout": timeout} if timeout else {}
+
+def extract_receipt_data(image_bytes: bytes, mime_type: str = "image/jpeg", timeout: Optional[float] = None) -> dict:
     """
     Extracts structured receipt data using Gemini 2.5 Flash.
     
     Args:
         image_bytes: The image as bytes
+        mime_type: MIME type of the encoded image
+        timeout: Request timeout in seconds
         
     Returns:
         dict: Parsed receipt data
-    """
-    try:
-        image_parts = [
-            {
-                "mime_type": "image/jpeg",
-                "data": base64.b64encode(image_bytes).decode('utf-8')
-            }
-        ]
-        
-        response = model.generate_content([EXTRACTION_PROMPT, image_parts[0]])
-        
-        response_text = response.text.strip()
         
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]
-        if response_text.startswith("```"):
-            response_text = response_text[3:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
-            
-        response_text = response_text.strip()
-        
-        receipt_data = json.loads(response_text)
-        
-        return receipt_data
+    Raises:
+        Exception: SDK errors (google.api_core exceptions) and unparseable
+            responses propagate so the caller can retry or fail fast
+    """
+    response = models.get("gemini").generate_content(
+        [EXTRACTION_PROMPT, _image_part(image_bytes, mime_type)],
+        request_options=_request_options(timeout)
+    )
+    
+    return parse_response_text(response.text)
+
+def stream_receipt_text(image_bytes: bytes, mime_type: str = "image/jpeg", timeout: Optional[float] = None) -> Iterator[str]:
+    """
+    Streams the raw Gemini response text for a receipt image chunk by chunk.
+    
+    Args:
+        image_bytes: The image as bytes
+        mime_type: MIME type of the encoded image
+        timeout: Request timeout in seconds
         
-    except Exception as e:
-        print(f"Gemini extraction error: {e}")
-        return {
-            "store_name": None,
-            "date": None,
-            "total": None,
-            "items": []
-        }
+    Yields:
+        str: Response text fragments in order; errors propagate to the caller
+    """
+    response = models.get("gemini").generate_content(
+        [EXTRACTION_PROMPT, _image_part(image_bytes, mime_type)],
+        stream=True,
+        request_options=_request_options(timeout)
+    )
+    for chunk in response:
+        if chunk.text:
+            yield chunk.text
@@ -0,0 +1,153 @@
+"""
+Receipt Image Store
+
+Keeps the original upload of every saved receipt in GridFS, plus a small
+WebP thumbnail for list views. Originals are written chunk by chunk
+straight from the ingested upload; thumbnails are rendered afterwards in
+a background task so they never delay the upload response.
+"""
+
+import asyncio
+import logging
+from typing import Optional, Set
+
+from bson import ObjectId
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket, AsyncIOMotorGridOut
+
+from app.services.job_queue import job_queue
+from app.utils.config import settings
+from app.utils.db import get_database
+from app.utils.preprocess import detect_mime_type, make_thumbnail
+
+logger = logging.getLogger(__name__)
+
+ORIGINALS_BUCKET = "receipt_images"
+THUMBNAILS_BUCKET = "receipt_thumbnails"
+
+stats = {"originals": 0, "original_bytes": 0, "thumbnails": 0, "thumbnail_bytes": 0, "thumbnail_failures": 0}
+
+# Strong references so pending thumbnail tasks aren't garbage collected
+_background_tasks: Set[asyncio.Task] = set()
+
+
+async def get_bucket(name: str) -> AsyncIOMotorGridFSBucket:
+    db = await get_database()
+    return AsyncIOMotorGridFSBucket(db, bucket_name=name)
+
+
+async def save_original(image_bytes: bytes, user_id: str, filename: Optional[str] = None) -> str:
+    """
+    Streams an upload into GridFS and schedules its thumbnail.
+
+    Args:
+        image_bytes: The upload (typically the ingested memoryview); it is
+            copied one GridFS chunk at a time, never as a whole
+        user_id: Owner, stored in the file's metadata
+        filename: Original filename, if the client sent one
+
+    Returns:
+        str: ID of the stored image; its thumbnail gets the same ID
+    """
+    bucket = await get_bucket(ORIGINALS_BUCKET)
+    content_type = detect_mime_type(image_bytes) or "application/octet-stream"
+    chunk_size = settings.IMAGE_CHUNK_SIZE
+
+    grid_in = bucket.open_upload_stream(
+        filename or "receipt",
+        chunk_size_bytes=chunk_size,
+        metadata={"user_id": user_id, "content_type": content_type}
+    )
+    try:
+        view = memoryview(image_bytes)
+        for start in range(0, len(view), chunk_size):
+            await grid_in.write(bytes(view[start:start + chunk_size]))
+    except BaseException:
+        await grid_in.abort()
+        raise
+    await grid_in.close()
+
+    stats["originals"] += 1
+    stats["original_bytes"] += len(image_bytes)
+
+    image_id = str(grid_in._id)
+    task = asyncio.create_task(save_thumbnail(image_id))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return image_id
+
+
+async def save_thumbnail(image_id: str) -> Optional[bytes]:
+    """
+    Renders and stores the thumbnail of a stored original.
+
+    Returns:
+        bytes: The thumbnail, or None if the original is missing or
+        can't be decoded
+    """
+    try:
+        original = await open_original(image_id)
+        if original is None:
+            return None
+        image_bytes = await original.read()
+
+        thumbnail = await job_queue.run_blocking(
+            make_thumbnail, image_bytes, settings.THUMBNAIL_MAX_EDGE, settings.THUMBNAIL_QUALITY
+        )
+        if thumbnail is None:
+            stats["thumbnail_failures"] += 1
+            return None
+
+        bucket = await get_bucket(THUMBNAILS_BUCKET)
+        await bucket.upload_from_stream_with_id(
+            ObjectId(image_id),
+            f"{image_id}.webp",
+            thumbnail,
+            metadata={"user_id": original.metadata.get("user_id"), "content_type": "image/webp"}
+        )
+        stats["thumbnails"] += 1
+        stats["thumbnail_bytes"] += len(thumbnail)
+        return thumbnail
+    except Exception as e:
+        stats["thumbnail_failures"] += 1
+        logger.error(f"Thumbnail generation failed for image {image_id}: {str(e)}")
+        return None
+
+
+async def _open(bucket_name: str, image_id: str) -> Optional[AsyncIOMotorGridOut]:
+    bucket = await get_bucket(bucket_name)
+    try:
+        return await bucket.open_download_stream(ObjectId(image_id))
+    except NoFile:
+        return None
+
+
+async def open_original(image_id: str) -> Optional[AsyncIOMotorGridOut]:
+    return await _open(ORIGINALS_BUCKET, image_id)
+
+
+async def open_thumbnail(image_id: str) -> Optional[AsyncIOMotorGridOut]:
+    """
+    Opens a thumbnail, rendering it now if the background task hasn't
+    finished (or failed) yet.
+    """
+    thumbnail = await _open(THUMBNAILS_BUCKET, image_id)
+    if thumbnail is None:
+        # If the background task wins the race our insert fails, but the file exists
+        await save_thumbnail(image_id)
+        thumbnail = await _open(THUMBNAILS_BUCKET, image_id)
+    return thumbnail
+
+
+async def delete_images(image_id: str):
+    """Deletes an original and its thumbnail; missing files are ignored."""
+    for bucket_name in (ORIGINALS_BUCKET, THUMBNAILS_BUCKET):
+        bucket = await get_bucket(bucket_name)
+        try:
+            await bucket.delete(ObjectId(image_id))
+        except NoFile:
+            pass
+
+
+def image_stats() -> dict:
+    return {**stats, "pending_thumbnails": len(_background_tasks)}
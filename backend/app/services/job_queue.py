@@ -0,0 +1,200 @@
+"""
+Extraction Job Queue
+
+Runs receipt extraction in a bounded background worker pool so that
+uploads return a job id immediately instead of holding the request open
+for the whole Gemini round trip.
+"""
+
+import asyncio
+import functools
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional
+
+from app.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus(str, Enum):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when the queue already holds the maximum number of unfinished jobs."""
+
+
+class ExtractionJob:
+    """A single upload tracked by the job queue."""
+
+    def __init__(self, user_id: str):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.status = JobStatus.PENDING
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.exception: Optional[Exception] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JobStatus.COMPLETED, JobStatus.FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status.value,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "receipt_id": (self.result or {}).get("receipt_id"),
+        }
+
+
+async def iterate_in_executor(executor: ThreadPoolExecutor, fn: Callable[..., Iterator[Any]], *args, **kwargs) -> AsyncIterator[Any]:
+    """
+    Consume a blocking iterator on `executor`, yielding its items on the
+    event loop as they are produced.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    def produce():
+        try:
+            for item in fn(*args, **kwargs):
+                loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, (None, e))
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, (done, None))
+
+    producer = loop.run_in_executor(executor, produce)
+    while True:
+        item, error = await queue.get()
+        if error is not None:
+            raise error
+        if item is done:
+            break
+        yield item
+    await producer
+
+
+class ExtractionJobQueue:
+    """
+    In-process job queue with a bounded worker pool.
+
+    At most `workers` jobs run at once; blocking calls made through
+    `run_blocking` execute on a thread pool of the same size so the event
+    loop stays free to serve other requests.
+    """
+
+    def __init__(self, workers: int, max_pending: int, ttl_seconds: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extraction")
+        self._semaphore = asyncio.Semaphore(workers)
+        self._jobs: Dict[str, ExtractionJob] = {}
+
+    def pending_count(self) -> int:
+        return sum(1 for job in self._jobs.values() if not job.finished)
+
+    def submit(self, user_id: str, handler: Callable[[], Awaitable[Dict[str, Any]]]) -> ExtractionJob:
+        """
+        Schedule a job and return immediately.
+
+        Args:
+            user_id: Owner of the job; only this user can read its status
+            handler: Coroutine function producing the job result
+
+        Returns:
+            ExtractionJob in PENDING state
+
+        Raises:
+            QueueFullError: If too many jobs are still unfinished
+        """
+        self._prune()
+
+        if self.pending_count() >= self.max_pending:
+            raise QueueFullError("Extraction queue is full")
+
+        job = ExtractionJob(user_id)
+        self._jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job, handler))
+        logger.info(f"Queued extraction job {job.id} for user {user_id}")
+        return job
+
+    async def _run(self, job: ExtractionJob, handler: Callable[[], Awaitable[Dict[str, Any]]]):
+        async with self._semaphore:
+            job.status = JobStatus.PROCESSING
+            job.started_at = datetime.utcnow()
+            try:
+                job.result = await handler()
+                job.status = JobStatus.COMPLETED
+            except Exception as e:
+                logger.error(f"Extraction job {job.id} failed: {str(e)}")
+                job.error = str(e)
+                job.exception = e
+                job.status = JobStatus.FAILED
+            finally:
+                job.finished_at = datetime.utcnow()
+
+        elapsed = (job.finished_at - job.created_at).total_seconds()
+        logger.info(f"Extraction job {job.id} {job.status.value} in {elapsed:.2f}s")
+
+    async def run_blocking(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking function on the worker thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def iterate_blocking(self, fn: Callable[..., Iterator[Any]], *args, **kwargs) -> AsyncIterator[Any]:
+        """
+        Consume a blocking iterator on the worker thread pool, yielding its
+        items on the event loop as they are produced.
+        """
+        async for item in iterate_in_executor(self._executor, fn, *args, **kwargs):
+            yield item
+
+    async def wait(self, job: ExtractionJob) -> ExtractionJob:
+        """Wait for a job to finish without cancelling it if the caller goes away."""
+        if job.task is not None:
+            await asyncio.shield(job.task)
+        return job
+
+    def get(self, job_id: str, user_id: str) -> Optional[ExtractionJob]:
+        """Return a job if it exists and belongs to the user."""
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def _prune(self):
+        cutoff = datetime.utcnow() - self.ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+job_queue = ExtractionJobQueue(
+    workers=settings.EXTRACTION_WORKERS,
+    max_pending=settings.EXTRACTION_MAX_PENDING,
+    ttl_seconds=settings.EXTRACTION_JOB_TTL_SECONDS,
+)
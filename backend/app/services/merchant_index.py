@@ -0,0 +1,308 @@
+"""
+Merchant and Item Index
+
+Store names and item names are free text ("DMART  Ghatkopar", "D-Mart",
+"Avenue Supermarts Ltd"). receipt_normalizer canonicalizes them into keys
+at write time, and this module indexes them outside the receipts:
+
+- `merchant_rollups`: per user x merchant spend and receipt count, kept
+  current with $inc like the spending rollups, so top merchants is one
+  index scan on (user_id, total).
+- `receipt_items`: one document per line item with its tokens, line
+  amount (price x quantity) and date, so item spend is a $match on
+  (user_id, tokens) instead of an $unwind over every receipt.
+
+Both are maintained by receipts_service on save, update and delete, and
+built on first read for users whose receipts predate them. Rebuilds of
+the same user are serialized, so concurrent first reads build it once.
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+
+from app.services.receipt_normalizer import canonical_key, canonical_merchant, from_minor_units, to_quantity
+from app.utils.db import get_database
+from app.utils.keyed_lock import KeyedLock
+
+logger = logging.getLogger(__name__)
+
+MERCHANT_ROLLUPS_COLLECTION = "merchant_rollups"
+ITEMS_COLLECTION = "receipt_items"
+INDEX_USERS_COLLECTION = "merchant_index_users"
+# Bumped when canonicalization or the item documents change, so existing indexes are rebuilt
+INDEX_SCHEMA = 3
+
+_merchant_index_ready = False
+_items_index_ready = False
+_indexed_users: Set[str] = set()
+_rebuild_locks = KeyedLock()
+
+
+def item_tokens(item_key: str) -> List[str]:
+    """Searchable words of an item key; bare numbers (sizes, codes) are skipped."""
+    return sorted({token for token in item_key.split() if not token.isdigit()})
+
+
+async def get_merchant_rollups_collection():
+    global _merchant_index_ready
+
+    db = await get_database()
+    collection = db[MERCHANT_ROLLUPS_COLLECTION]
+
+    if not _merchant_index_ready:
+        await collection.create_index([("user_id", 1), ("total", -1)])
+        _merchant_index_ready = True
+
+    return collection
+
+
+async def get_items_collection():
+    global _items_index_ready
+
+    db = await get_database()
+    collection = db[ITEMS_COLLECTION]
+
+    if not _items_index_ready:
+        await collection.create_index([("user_id", 1), ("tokens", 1), ("purchased_at", -1)])
+        await collection.create_index([("user_id", 1), ("purchased_at", -1)])
+        await collection.create_index("receipt_id")
+        _items_index_ready = True
+
+    return collection
+
+
+def _merchant(receipt: dict) -> Tuple[Optional[str], Optional[str]]:
+    # Derived from store_name rather than the stored merchant_key, so a
+    # rebuild after an alias change and later deletes agree on the key
+    return canonical_merchant(receipt.get("store_name"))
+
+
+def _line_amount(price_minor: int, quantity: float) -> int:
+    """Unit price times quantity in minor units; quantities may be fractional (1.5 kg)."""
+    return round(price_minor * quantity)
+
+
+def _item_docs(receipt: dict) -> List[dict]:
+    items = receipt.get("items")
+    if not isinstance(items, list):
+        return []
+
+    merchant_key, merchant_name = _merchant(receipt)
+    purchased_at = receipt.get("purchase_date") or receipt.get("created_at")
+    docs = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        key = canonical_key(item.get("name"))
+        if not key:
+            continue
+        price_minor = item.get("price_minor") or 0
+        # Receipts saved before quantities were normalized may still hold strings
+        quantity = to_quantity(item.get("quantity")) or 1
+        docs.append({
+            "user_id": receipt["user_id"],
+            "receipt_id": receipt["_id"],
+            "item_key": key,
+            "name": " ".join(str(item["name"]).split()),
+            "tokens": item_tokens(key),
+            "price_minor": price_minor,
+            "quantity": quantity,
+            "amount_minor": _line_amount(price_minor, quantity),
+            "merchant_key": merchant_key,
+            "merchant_name": merchant_name,
+            "purchased_at": purchased_at,
+        })
+    return docs
+
+
+async def index_receipts(receipts: Iterable[dict]):
+    """
+    Adds inserted receipts (with their `_id`) to the merchant and item index.
+    """
+    receipts = list(receipts)
+    deltas: Dict[Tuple[str, str], dict] = {}
+    for receipt in receipts:
+        merchant_key, merchant_name = _merchant(receipt)
+        if not merchant_key:
+            continue
+        delta = deltas.setdefault((receipt["user_id"], merchant_key), {"total": 0, "count": 0, "name": merchant_name})
+        delta["total"] += receipt.get("total_minor") or 0
+        delta["count"] += 1
+
+    if deltas:
+        merchants = await get_merchant_rollups_collection()
+        await merchants.bulk_write([
+            UpdateOne(
+                {"_id": f"{user_id}|{merchant_key}"},
+                {
+                    "$inc": {"total": delta["total"], "count": delta["count"]},
+                    "$set": {"user_id": user_id, "merchant_key": merchant_key, "merchant_name": delta["name"]},
+                },
+                upsert=True,
+            )
+            for (user_id, merchant_key), delta in deltas.items()
+        ], ordered=False)
+
+    item_docs = [doc for receipt in receipts for doc in _item_docs(receipt)]
+    if item_docs:
+        items = await get_items_collection()
+        await items.insert_many(item_docs, ordered=False)
+
+
+async def unindex_receipt(receipt: dict):
+    """Removes a receipt's contribution; needs its `_id`, user, store name and total."""
+    merchant_key, _ = _merchant(receipt)
+    if merchant_key:
+        merchants = await get_merchant_rollups_collection()
+        rollup = await merchants.find_one_and_update(
+            {"_id": f"{receipt['user_id']}|{merchant_key}"},
+            {"$inc": {"total": -(receipt.get("total_minor") or 0), "count": -1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if rollup is not None and rollup["count"] <= 0:
+            await merchants.delete_one({"_id": rollup["_id"], "count": {"$lte": 0}})
+
+    items = await get_items_collection()
+    await items.delete_many({"receipt_id": receipt["_id"]})
+
+
+INDEXED_FIELDS = ("store_name", "total_minor", "items", "purchase_date")
+
+
+async def reindex_receipt(before: dict, after: dict):
+    """Moves an updated receipt in the index if any indexed field changed."""
+    if all(before.get(field) == after.get(field) for field in INDEXED_FIELDS):
+        return
+    await unindex_receipt(before)
+    await index_receipts([after])
+
+
+async def rebuild_merchant_index(user_id: str) -> int:
+    """
+    Regenerates a user's merchant rollups and item index from their receipts.
+
+    Returns:
+        int: Number of receipts indexed
+    """
+    # Interleaved rebuilds would each $inc the rollups after the other's delete
+    async with _rebuild_locks.hold(user_id):
+        return await _rebuild(user_id)
+
+
+async def _rebuild(user_id: str) -> int:
+    merchants = await get_merchant_rollups_collection()
+    items = await get_items_collection()
+    await merchants.delete_many({"user_id": user_id})
+    await items.delete_many({"user_id": user_id})
+
+    db = await get_database()
+    cursor = db.receipts.find(
+        {"user_id": user_id},
+        {"user_id": 1, "store_name": 1, "total_minor": 1, "items": 1, "purchase_date": 1, "created_at": 1},
+        batch_size=500,
+    )
+    indexed = 0
+    batch = []
+    async for receipt in cursor:
+        batch.append(receipt)
+        if len(batch) == 500:
+            await index_receipts(batch)
+            indexed += len(batch)
+            batch = []
+    if batch:
+        await index_receipts(batch)
+        indexed += len(batch)
+
+    await db[INDEX_USERS_COLLECTION].update_one(
+        {"_id": user_id},
+        {"$set": {"rebuilt_at": datetime.utcnow(), "receipts": indexed, "schema": INDEX_SCHEMA}},
+        upsert=True,
+    )
+    _indexed_users.add(user_id)
+    return indexed
+
+
+async def ensure_merchant_index(user_id: str):
+    """Builds a user's index on first read if it is missing or outdated."""
+    if user_id in _indexed_users:
+        return
+    async with _rebuild_locks.hold(user_id):
+        if user_id in _indexed_users:
+            # Built by a request we waited for
+            return
+        db = await get_database()
+        marker = await db[INDEX_USERS_COLLECTION].find_one({"_id": user_id})
+        if marker is not None and marker.get("schema") == INDEX_SCHEMA:
+            _indexed_users.add(user_id)
+            return
+        logger.info(f"Building merchant and item index for user {user_id}")
+        await _rebuild(user_id)
+
+
+async def get_top_merchants(user_id: str, limit: int = 10) -> List[dict]:
+    """
+    Returns the user's merchants by total spend (highest first).
+    """
+    await ensure_merchant_index(user_id)
+    merchants = await get_merchant_rollups_collection()
+    cursor = merchants.find(
+        {"user_id": user_id, "count": {"$gt": 0}},
+        {"_id": 0, "merchant_key": 1, "merchant_name": 1, "total": 1, "count": 1},
+    ).sort("total", -1).limit(limit)
+
+    return [
+        {"merchant": rollup["merchant_name"], "merchant_key": rollup["merchant_key"], "total": from_minor_units(rollup["total"]), "count": rollup["count"]}
+        async for rollup in cursor
+    ]
+
+
+async def get_item_spending(
+    user_id: str,
+    query: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 20
+) -> List[dict]:
+    """
+    Returns spend per item (price x quantity, highest first), optionally only items whose
+    name contains every word of `query`.
+    """
+    await ensure_merchant_index(user_id)
+    match: dict = {"user_id": user_id}
+    tokens = item_tokens(canonical_key(query))
+    if tokens:
+        match["tokens"] = {"$all": tokens}
+    if start or end:
+        match["purchased_at"] = {**({"$gte": start} if start else {}), **({"$lte": end} if end else {})}
+
+    items = await get_items_collection()
+    groups = await items.aggregate([
+        {"$match": match},
+        # Oldest first, so $last takes the name from the most recent purchase
+        {"$sort": {"purchased_at": 1, "_id": 1}},
+        {"$group": {
+            "_id": "$item_key",
+            "name": {"$last": "$name"},
+            "total": {"$sum": "$amount_minor"},
+            "quantity": {"$sum": "$quantity"},
+            "count": {"$sum": 1},
+            "merchants": {"$addToSet": "$merchant_name"},
+        }},
+        {"$sort": {"total": -1}},
+        {"$limit": limit},
+    ]).to_list(length=limit)
+
+    return [
+        {
+            "item": group["name"],
+            "item_key": group["_id"],
+            "total": from_minor_units(group["total"]),
+            "quantity": group["quantity"],
+            "count": group["count"],
+            "merchants": sorted(name for name in group["merchants"] if name),
+        }
+        for group in groups
+    ]
@@ -0,0 +1,66 @@
+"""
+Model Registry
+
+Holds heavy clients (Gemini SDK model, PaddleOCR) behind lazy, thread-safe
+loaders. Nothing is constructed at import time: a model is built on first
+use or by an explicit warm-up, so API-only nodes and test imports never pay
+for models they don't use.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._load_seconds: Dict[str, float] = {}
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        """Register a zero-argument factory that builds the model."""
+        self._factories[name] = factory
+        self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name: str) -> Any:
+        """
+        Return the model, loading it on first use.
+
+        Concurrent first calls block on a per-model lock so the model is
+        built exactly once; later calls return without locking.
+        """
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        if name not in self._factories:
+            raise KeyError(f"Unknown model: {name}")
+
+        with self._locks[name]:
+            instance = self._instances.get(name)
+            if instance is None:
+                started = time.perf_counter()
+                instance = self._factories[name]()
+                self._load_seconds[name] = time.perf_counter() - started
+                self._instances[name] = instance
+                logger.info(f"Loaded model {name} in {self._load_seconds[name]:.2f}s")
+        return instance
+
+    def warm_up(self, names: Optional[Iterable[str]] = None):
+        """Load the named models (all registered models by default)."""
+        for name in (names if names is not None else list(self._factories)):
+            self.get(name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {"loaded": name in self._instances, "load_seconds": self._load_seconds.get(name)}
+            for name in self._factories
+        }
+
+
+models = ModelRegistry()
@@ -1,8 +1,13 @@
-from paddleocr import PaddleOCR
 import numpy as np
 import cv2
+from app.services.model_registry import models
 
-ocr = PaddleOCR(use_angle_cls=True, lang='en')
+def _load_paddleocr():
+    from paddleocr import PaddleOCR
+
+    return PaddleOCR(use_angle_cls=True, lang='en')
+
+models.register("paddleocr", _load_paddleocr)
 
 def extract_text(image_bytes: bytes) -> str:
     """
@@ -12,7 +17,7 @@ def extract_text(image_bytes: bytes) -> str:
     nparr = np.frombuffer(image_bytes, np.uint8)
     image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
     
-    result = ocr.ocr(image, cls=True)
+    result = models.get("paddleocr").ocr(image, cls=True)
     
     extracted_text = []
     if result and result[0]:
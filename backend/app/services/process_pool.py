@@ -0,0 +1,173 @@
+"""
+CPU Process Pool
+
+Runs CPU-bound image work (OpenCV preprocessing, PaddleOCR inference) in a
+managed pool of worker processes so it neither blocks the event loop nor
+contends for the GIL. Image buffers are handed to workers through shared
+memory instead of being pickled with every task.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, Optional
+
+from app.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _preprocess(buffer: memoryview, pipeline: str = "quality") -> bytes:
+    from app.utils.preprocess import preprocess_image
+    return preprocess_image(buffer, pipeline)
+
+
+def _ocr(buffer: memoryview, pipeline: Optional[str] = None) -> str:
+    from app.services.ocr import extract_text
+    if pipeline:
+        from app.utils.preprocess import preprocess_image
+        return extract_text(preprocess_image(buffer, pipeline))
+    return extract_text(buffer)
+
+
+# Functions workers may run, by name, so callers never pickle callables
+TASKS = {
+    "preprocess": _preprocess,
+    "ocr": _ocr,
+}
+
+
+def _init_worker(warmup: bool):
+    """Worker initializer: load heavy modules before the first task arrives."""
+    if warmup:
+        import app.utils.preprocess  # noqa: F401
+        from app.services.ocr import models
+        models.warm_up(["paddleocr"])
+
+
+def _warmup_task() -> int:
+    return os.getpid()
+
+
+def _run_task(task: str, shm_name: str, size: int, kwargs: Dict[str, Any]) -> Any:
+    shm = SharedMemory(name=shm_name)
+    try:
+        buffer = shm.buf[:size]
+        try:
+            return TASKS[task](buffer, **kwargs)
+        finally:
+            buffer.release()
+    finally:
+        shm.close()
+
+
+class ProcessPool:
+    """
+    Lazily started process pool for CPU-bound tasks.
+
+    Nothing is spawned until the first task (or an explicit warm-up), so
+    API-only nodes that never preprocess or OCR pay nothing for it.
+    """
+
+    def __init__(self, workers: int, max_tasks_per_child: Optional[int], warmup: bool):
+        self.workers = workers
+        self.max_tasks_per_child = max_tasks_per_child
+        self.warmup = warmup
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.bytes_shared = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # max_tasks_per_child requires a non-fork start method
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.warmup,),
+                    max_tasks_per_child=self.max_tasks_per_child,
+                )
+                logger.info(f"Started process pool with {self.workers} workers")
+            return self._executor
+
+    async def run(self, task: str, image_bytes: bytes, **kwargs) -> Any:
+        """
+        Run a named task on an image in a worker process.
+
+        Args:
+            task: Name of a function in TASKS
+            image_bytes: Encoded image, copied once into shared memory
+            **kwargs: Extra (small, picklable) arguments for the task
+
+        Returns:
+            The task's return value
+        """
+        if task not in TASKS:
+            raise ValueError(f"Unknown process pool task: {task}")
+
+        executor = self._get_executor()
+        size = len(image_bytes)
+        shm = SharedMemory(create=True, size=max(size, 1))
+        self.submitted += 1
+        try:
+            shm.buf[:size] = image_bytes
+            self.bytes_shared += size
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(executor, _run_task, task, shm.name, size, kwargs)
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            shm.close()
+            shm.unlink()
+
+    async def preprocess(self, image_bytes: bytes, pipeline: str = "quality") -> bytes:
+        return await self.run("preprocess", image_bytes, pipeline=pipeline)
+
+    async def ocr(self, image_bytes: bytes, pipeline: Optional[str] = None) -> str:
+        """OCR an image, optionally running a preprocessing pipeline first in the same worker."""
+        return await self.run("ocr", image_bytes, pipeline=pipeline)
+
+    async def warm_up(self):
+        """Spawn every worker now so the first requests don't pay process start-up."""
+        executor = self._get_executor()
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*[
+            loop.run_in_executor(executor, _warmup_task) for _ in range(self.workers)
+        ])
+        logger.info(f"Process pool warmed up: {len(set(pids))} workers ready")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "started": self._executor is not None,
+            "max_tasks_per_child": self.max_tasks_per_child,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "bytes_shared": self.bytes_shared,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+process_pool = ProcessPool(
+    workers=settings.PROCESS_POOL_WORKERS,
+    max_tasks_per_child=settings.PROCESS_POOL_MAX_TASKS_PER_CHILD or None,
+    warmup=settings.PROCESS_POOL_WARMUP,
+)
@@ -0,0 +1,222 @@
+"""
+Receipt Export
+
+Streams a user's receipts as CSV, NDJSON or Parquet. Receipts are read
+from a Motor cursor in batches of `EXPORT_BATCH_SIZE` and each batch is
+encoded and yielded before the next is fetched, so memory stays bounded
+by one batch however many receipts a user has. The CSV header goes out
+before the first batch is even requested.
+
+Parquet output gets one row group per batch; only the footer, written
+after the last batch, depends on the whole file.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.services.analytics_service import get_receipts_collection
+from app.services.receipt_normalizer import from_minor_units
+from app.utils.config import settings
+
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+COLUMNS = [
+    "id", "date", "store_name", "merchant", "category", "payment_method",
+    "subtotal", "tax", "total", "items", "created_at",
+]
+
+PROJECTION = {
+    "date": 1, "store_name": 1, "merchant_name": 1, "category": 1, "payment_method": 1,
+    "subtotal_minor": 1, "tax_minor": 1, "total_minor": 1, "items": 1, "created_at": 1,
+}
+
+ITEM_TYPE = pa.struct([("name", pa.string()), ("quantity", pa.float64()), ("price", pa.float64())])
+PARQUET_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("date", pa.string()),
+    ("store_name", pa.string()),
+    ("merchant", pa.string()),
+    ("category", pa.string()),
+    ("payment_method", pa.string()),
+    ("subtotal", pa.float64()),
+    ("tax", pa.float64()),
+    ("total", pa.float64()),
+    ("items", pa.list_(ITEM_TYPE)),
+    ("created_at", pa.timestamp("ms")),
+])
+
+
+def export_filter(
+    user_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    category: Optional[str] = None
+) -> dict:
+    """
+    Query for a user's receipts purchased within [start, end], falling back
+    to `created_at` for receipts whose date couldn't be parsed.
+    """
+    query: dict = {"user_id": user_id}
+    if category is not None:
+        query["category"] = category
+    if start or end:
+        bounds = {**({"$gte": start} if start else {}), **({"$lte": end} if end else {})}
+        query["$or"] = [
+            {"purchase_date": bounds},
+            {"purchase_date": None, "created_at": bounds},
+        ]
+    return query
+
+
+def _text(value) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def _number(value) -> Optional[float]:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _row(receipt: dict) -> dict:
+    items = receipt.get("items") if isinstance(receipt.get("items"), list) else []
+    return {
+        "id": str(receipt["_id"]),
+        "date": _text(receipt.get("date")),
+        "store_name": _text(receipt.get("store_name")),
+        "merchant": _text(receipt.get("merchant_name")),
+        "category": _text(receipt.get("category")),
+        "payment_method": _text(receipt.get("payment_method")),
+        "subtotal": from_minor_units(receipt.get("subtotal_minor")),
+        "tax": from_minor_units(receipt.get("tax_minor")),
+        "total": from_minor_units(receipt.get("total_minor")),
+        "items": [
+            {"name": _text(item.get("name")), "quantity": _number(item.get("quantity")), "price": from_minor_units(item.get("price_minor"))}
+            for item in items if isinstance(item, dict)
+        ],
+        "created_at": receipt.get("created_at"),
+    }
+
+
+def _text_row(row: dict) -> dict:
+    created_at = row["created_at"]
+    return {**row, "created_at": created_at.isoformat() if created_at else None}
+
+
+async def _batches(query: dict) -> AsyncIterator[List[dict]]:
+    receipts_collection = await get_receipts_collection()
+    batch_size = settings.EXPORT_BATCH_SIZE
+    # (user_id, created_at, ...) index order, so no blocking sort holds back the first batch
+    cursor = receipts_collection.find(query, PROJECTION, batch_size=batch_size).sort("created_at", 1)
+
+    batch = []
+    async for receipt in cursor:
+        batch.append(_row(receipt))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _csv_chunks(query: dict) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+    writer.writeheader()
+    yield buffer.getvalue().encode()
+
+    async for batch in _batches(query):
+        buffer.seek(0)
+        buffer.truncate()
+        for row in batch:
+            row = _text_row(row)
+            # Spreadsheets get the line items as one JSON cell
+            writer.writerow({**row, "items": json.dumps(row["items"], ensure_ascii=False)})
+        yield buffer.getvalue().encode()
+
+
+async def _ndjson_chunks(query: dict) -> AsyncIterator[bytes]:
+    async for batch in _batches(query):
+        yield "".join(json.dumps(_text_row(row), ensure_ascii=False) + "\n" for row in batch).encode()
+
+
+class _ChunkSink:
+    """Write-only file that hands written bytes out in chunks but keeps counting the offset."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        # Parquet records absolute offsets in the footer, so this must not reset on drain()
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+async def _parquet_chunks(query: dict) -> AsyncIterator[bytes]:
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), PARQUET_SCHEMA, compression="zstd")
+    try:
+        async for batch in _batches(query):
+            writer.write_table(pa.Table.from_pylist(batch, schema=PARQUET_SCHEMA))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+_ENCODERS = {"csv": _csv_chunks, "ndjson": _ndjson_chunks, "parquet": _parquet_chunks}
+
+
+def export_receipts(
+    user_id: str,
+    fmt: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    category: Optional[str] = None
+) -> AsyncIterator[bytes]:
+    """
+    Streams a user's receipts, oldest first.
+
+    Args:
+        user_id: Owner of the receipts
+        fmt: "csv", "ndjson" or "parquet"
+        start: Optional first purchase time
+        end: Optional last purchase time
+        category: Optional category to restrict to
+
+    Returns:
+        Async iterator of encoded chunks, one per batch
+    """
+    return _ENCODERS[fmt](export_filter(user_id, start, end, category))
+
+
+def export_headers(fmt: str) -> Dict[str, str]:
+    _, extension = FORMATS[fmt]
+    filename = f"receipts-{datetime.utcnow():%Y%m%d}.{extension}"
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
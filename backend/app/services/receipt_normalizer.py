@@ -0,0 +1,208 @@
+"""
+Receipt Normalization
+
+Coerces the loosely typed fields extraction produces ("1,234.50", "₹ 99",
+"05/03/2024") into canonical values before a receipt is written:
+
+- `total`, `subtotal`, `tax` and each item's `price` become numbers, with
+  exact integer copies in minor units (`total_minor`, ..., `price_minor`)
+  that analytics sum without per-document parsing. Item `quantity`
+  becomes a number too.
+- `date` is rewritten as YYYY-MM-DD and parsed into `purchase_date`, a
+  real datetime.
+- `store_name` is canonicalized into `merchant_key` (case, spacing,
+  punctuation, legal suffixes and known aliases folded) and a display
+  `merchant_name`, so "D-MART  Ghatkopar" and "Avenue Supermarts Ltd"
+  count as one merchant.
+
+Values that can't be parsed are stored as None rather than verbatim.
+"""
+
+import math
+import re
+import unicodedata
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Any, Dict, Optional, Tuple
+
+from app.services.receipt_parser import parse_date
+
+# Paise per rupee
+MINOR_UNITS = 100
+AMOUNT_FIELDS = ("total", "subtotal", "tax")
+# Fields normalize_receipt_fields derives from the amounts, date and store name
+DERIVED_FIELDS = tuple(f"{field}_minor" for field in AMOUNT_FIELDS) + ("purchase_date", "merchant_key", "merchant_name")
+
+# Currency symbols, codes and grouping separators around an amount
+AMOUNT_NOISE_RE = re.compile(r"(?i)(?:rs\.?|inr|₹|\$|,|\s)")
+
+LEGAL_SUFFIX_RE = re.compile(r"\b(?:pvt|private|ltd|limited|llp|inc|co)\b")
+NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+
+def to_minor_units(value: Any) -> Optional[int]:
+    """
+    Converts an amount to integer minor units, rounding half up.
+
+    Returns:
+        int, or None if the value isn't a finite amount
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return None
+        # repr() gives the shortest decimal that round-trips, so 0.1 stays 0.1
+        value = repr(value)
+    elif isinstance(value, str):
+        value = AMOUNT_NOISE_RE.sub("", value)
+        if not value:
+            return None
+    elif not isinstance(value, (int, Decimal)):
+        return None
+
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        return None
+    if not amount.is_finite():
+        return None
+    return int((amount * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def canonical_key(text: Optional[str]) -> str:
+    """Lowercase ASCII words separated by single spaces; apostrophes are dropped."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode().lower()
+    text = text.replace("'", "").replace("&", " and ")
+    return " ".join(NON_WORD_RE.sub(" ", text).split())
+
+
+def canonical_merchant(store_name: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Canonicalizes a store name.
+
+    Returns:
+        tuple: (merchant_key, display name), or (None, None) if the name
+        has no letters or digits
+    """
+    key = " ".join(LEGAL_SUFFIX_RE.sub(" ", canonical_key(store_name)).split())
+    if not key:
+        return None, None
+
+    words = key.split()
+    for candidate in [key] + [" ".join(words[:n]) for n in (3, 2, 1) if n < len(words)]:
+        alias = MERCHANT_ALIASES.get(candidate)
+        if alias:
+            return alias
+    return key, " ".join(store_name.split())
+
+
+# Known spellings of the same merchant, by canonical key, to (key, display name).
+# Keys are matched against the whole store name and then its first one to three words.
+MERCHANT_ALIASES: Dict[str, Tuple[str, str]] = {}
+for display, spellings in {
+    "DMart": ["dmart", "d mart", "avenue supermarts"],
+    "Big Bazaar": ["big bazaar", "bigbazaar"],
+    "Reliance Fresh": ["reliance fresh"],
+    "Reliance Smart": ["reliance smart", "reliance smart point"],
+    "Reliance Digital": ["reliance digital"],
+    "More": ["more supermarket", "more retail"],
+    "Star Bazaar": ["star bazaar"],
+    "McDonald's": ["mcdonalds", "mc donalds", "mcdonald"],
+    "Domino's": ["dominos", "domino s", "dominos pizza"],
+    "KFC": ["kfc", "kentucky fried chicken"],
+    "Starbucks": ["starbucks", "tata starbucks"],
+    "Swiggy": ["swiggy", "bundl technologies"],
+    "Zomato": ["zomato"],
+    "Apollo Pharmacy": ["apollo pharmacy", "apollo pharmacies"],
+    "Indian Oil": ["indian oil", "iocl", "indianoil"],
+    "Bharat Petroleum": ["bharat petroleum", "bpcl"],
+    "HP Petrol": ["hpcl", "hindustan petroleum"],
+    "Croma": ["croma", "infiniti retail"],
+}.items():
+    for spelling in spellings:
+        MERCHANT_ALIASES[spelling] = (canonical_key(display), display)
+
+
+def to_quantity(value: Any) -> Optional[float]:
+    """
+    Parses an item quantity ("2", "1.5", 3).
+
+    Returns:
+        int for whole quantities, float otherwise, or None if the value
+        isn't a positive finite number
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        try:
+            value = float(value.strip())
+        except ValueError:
+            return None
+    elif not isinstance(value, (int, float, Decimal)):
+        return None
+    value = float(value)
+    if not math.isfinite(value) or value <= 0:
+        return None
+    return int(value) if value.is_integer() else value
+
+
+def from_minor_units(minor: Optional[int]) -> Optional[float]:
+    return None if minor is None else minor / MINOR_UNITS
+
+
+def parse_purchase_date(value: Any) -> Optional[datetime]:
+    """Parses a receipt date (ISO, day-first or "5 Mar 2024" styles) to midnight of that day."""
+    if isinstance(value, datetime):
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if not isinstance(value, str) or not value.strip():
+        return None
+    parsed = parse_date(value)
+    return datetime.strptime(parsed, "%Y-%m-%d") if parsed else None
+
+
+def _normalize_item(item: Any) -> Any:
+    if not isinstance(item, dict):
+        return item
+    item = dict(item)
+    if "price" in item:
+        price_minor = to_minor_units(item["price"])
+        item.update(price=from_minor_units(price_minor), price_minor=price_minor)
+    if "quantity" in item:
+        item["quantity"] = to_quantity(item["quantity"])
+    return item
+
+
+def normalize_receipt_fields(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Normalizes the amount, date and store name fields present in `data`.
+
+    Works on whole receipts and on partial updates alike: only fields that
+    are present are rewritten, each with its derived field alongside.
+
+    Returns:
+        dict: A normalized copy of `data`
+    """
+    normalized = dict(data)
+
+    for field in AMOUNT_FIELDS:
+        if field in normalized:
+            minor = to_minor_units(normalized[field])
+            normalized[field] = from_minor_units(minor)
+            normalized[f"{field}_minor"] = minor
+
+    if isinstance(normalized.get("items"), list):
+        normalized["items"] = [_normalize_item(item) for item in normalized["items"]]
+
+    if "date" in normalized:
+        purchase_date = parse_purchase_date(normalized["date"])
+        if purchase_date is not None:
+            normalized["date"] = purchase_date.strftime("%Y-%m-%d")
+        normalized["purchase_date"] = purchase_date
+
+    if "store_name" in normalized:
+        normalized["merchant_key"], normalized["merchant_name"] = canonical_merchant(normalized["store_name"])
+
+    return normalized
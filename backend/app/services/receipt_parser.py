@@ -0,0 +1,180 @@
+"""
+Rule-Based Receipt Parser
+
+Pulls store name, date, total, line items and payment method out of raw
+OCR text with regular expressions. Used as the cheap first tier of
+extraction; anything it can't read confidently is escalated to Gemini.
+"""
+
+import re
+from datetime import datetime
+from typing import List, Optional
+
+NUMBER = r"\d{1,3}(?:,\d{2,3})+(?:\.\d{1,2})?|\d+(?:\.\d{1,2})?"
+NUMBER_RE = re.compile(NUMBER)
+ITEM_LINE_RE = re.compile(rf"^(?P<name>.*?[A-Za-z].*?)\s+(?P<numbers>(?:(?:{NUMBER})\s*(?:x|X|@|\*)?\s*)+)$")
+
+MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+YMD_RE = re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b")
+DMY_RE = re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{2,4})\b")
+D_MON_Y_RE = re.compile(r"\b(\d{1,2})[\s-]*(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*[\s,.-]*(\d{2,4})\b", re.I)
+
+# Highest priority first; "total" alone is the weakest signal
+TOTAL_KEYWORDS = [
+    "grand total", "net total", "total amount", "amount payable",
+    "net amount", "bill amount", "total",
+]
+SUBTOTAL_RE = re.compile(r"sub\s*-?\s*total", re.I)
+
+NON_ITEM_KEYWORDS = [
+    "total", "tax", "gst", "vat", "change", "cash", "card", "upi", "balance",
+    "discount", "round", "amount", "tender", "paid", "due", "invoice", "bill no",
+    "date", "time", "phone", "tel", "mobile", "gstin", "qty", "rate",
+]
+NON_STORE_KEYWORDS = [
+    "tax invoice", "invoice", "receipt", "bill", "gstin", "welcome", "original", "duplicate", "copy",
+]
+PAYMENT_METHODS = [
+    (re.compile(r"\bupi\b|\bgpay\b|\bphonepe\b|\bpaytm\b", re.I), "UPI"),
+    (re.compile(r"\bcredit\s*card\b", re.I), "Credit Card"),
+    (re.compile(r"\bdebit\s*card\b", re.I), "Debit Card"),
+    (re.compile(r"\bcard\b|\bvisa\b|\bmastercard\b|\brupay\b", re.I), "Card"),
+    (re.compile(r"\bcash\b", re.I), "Cash"),
+]
+
+
+def _to_amount(text: str) -> Optional[float]:
+    try:
+        return float(text.replace(",", ""))
+    except ValueError:
+        return None
+
+
+def _make_date(year: int, month: int, day: int) -> Optional[str]:
+    if year < 100:
+        year += 2000
+    try:
+        return datetime(year, month, day).strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def parse_date(text: str) -> Optional[str]:
+    """Find the first date in the text and return it as YYYY-MM-DD."""
+    for match in YMD_RE.finditer(text):
+        date = _make_date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        if date:
+            return date
+
+    for match in DMY_RE.finditer(text):
+        day, month, year = int(match.group(1)), int(match.group(2)), int(match.group(3))
+        # Day-first is the norm on our receipts; fall back to month-first when it can't be
+        date = _make_date(year, month, day) or _make_date(year, day, month)
+        if date:
+            return date
+
+    for match in D_MON_Y_RE.finditer(text):
+        date = _make_date(int(match.group(3)), MONTHS[match.group(2).lower()[:3]], int(match.group(1)))
+        if date:
+            return date
+
+    return None
+
+
+def parse_total(lines: List[str]) -> Optional[float]:
+    """Amount on the highest-priority total line (the last one on ties)."""
+    best_rank = None
+    best_amount = None
+
+    for index, line in enumerate(lines):
+        lowered = line.lower()
+        if SUBTOTAL_RE.search(lowered):
+            continue
+
+        rank = next((rank for rank, keyword in enumerate(TOTAL_KEYWORDS) if keyword in lowered), None)
+        if rank is None:
+            continue
+
+        numbers = NUMBER_RE.findall(line)
+        # OCR often splits the label and the value onto separate lines
+        if not numbers and index + 1 < len(lines):
+            numbers = NUMBER_RE.findall(lines[index + 1])
+        if not numbers:
+            continue
+
+        amount = _to_amount(numbers[-1])
+        if amount is not None and (best_rank is None or rank <= best_rank):
+            best_rank, best_amount = rank, amount
+
+    return best_amount
+
+
+def parse_items(lines: List[str]) -> List[dict]:
+    """Lines of the form `<name> [qty] [x|@] <price>`."""
+    items = []
+    for line in lines:
+        lowered = line.lower()
+        if any(keyword in lowered for keyword in NON_ITEM_KEYWORDS):
+            continue
+
+        match = ITEM_LINE_RE.match(line.strip())
+        if not match:
+            continue
+
+        numbers = NUMBER_RE.findall(match.group("numbers"))
+        price = _to_amount(numbers[-1])
+        if price is None or ("." not in numbers[-1] and len(numbers) == 1):
+            # A lone integer is more likely a code or quantity than a price
+            continue
+
+        quantity = 1.0
+        if len(numbers) >= 2 and "." not in numbers[0] and "," not in numbers[0]:
+            quantity = float(numbers[0])
+
+        items.append({"name": match.group("name").strip(" .:-"), "quantity": quantity, "price": price})
+    return items
+
+
+def parse_store_name(lines: List[str]) -> Optional[str]:
+    """First line near the top that reads like a name rather than a header or number."""
+    for line in lines[:5]:
+        lowered = line.lower()
+        if sum(ch.isalpha() for ch in line) < 3:
+            continue
+        if any(keyword in lowered for keyword in NON_STORE_KEYWORDS):
+            continue
+        return line.strip()
+    return None
+
+
+def parse_payment_method(text: str) -> Optional[str]:
+    for pattern, method in PAYMENT_METHODS:
+        if pattern.search(text):
+            return method
+    return None
+
+
+def parse_receipt_text(raw_text: str) -> dict:
+    """
+    Parses raw OCR text into the same shape Gemini returns.
+
+    Args:
+        raw_text: Newline-separated OCR output
+
+    Returns:
+        dict: store_name, date, total, payment_method and items; fields
+        that couldn't be found are None (items is an empty list)
+    """
+    lines = [line.strip() for line in raw_text.splitlines() if line.strip()]
+
+    return {
+        "store_name": parse_store_name(lines),
+        "date": parse_date(raw_text),
+        "total": parse_total(lines),
+        "category": None,
+        "payment_method": parse_payment_method(raw_text),
+        "items": parse_items(lines),
+    }
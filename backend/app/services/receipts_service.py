@@ -1,7 +1,83 @@
-from datetime import datetime
+import base64
+import binascii
+from datetime import datetime, timedelta
+from typing import List, Optional, Set, Tuple
 from app.utils.db import get_database
+from app.services import image_store
+from app.services.analytics_service import add_to_rollups, update_rollups
+from app.services.merchant_index import index_receipts, reindex_receipt, unindex_receipt
+from app.services.response_cache import bump_data_version
+from app.services.receipt_normalizer import normalize_receipt_fields
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
 from app.models.receipt import Receipt
 from bson import ObjectId
+from bson.errors import InvalidId
+
+# Newest first, with _id breaking ties between receipts saved in the same millisecond
+LISTING_SORT = [("created_at", -1), ("_id", -1)]
+
+_listing_index_ready = False
+
+
+async def get_listing_collection():
+    """Receipts collection, with the listing index created on first use."""
+    global _listing_index_ready
+    
+    db = await get_database()
+    receipts_collection = db.receipts
+    
+    if not _listing_index_ready:
+        await receipts_collection.create_index([("user_id", 1)] + LISTING_SORT)
+        _listing_index_ready = True
+    
+    return receipts_collection
+
+
+def encode_cursor(receipt: dict) -> str:
+    """
+    Opaque token for the position after `receipt` in the listing order.
+    """
+    millis = (receipt["created_at"] - datetime(1970, 1, 1)) // timedelta(milliseconds=1)
+    raw = f"{millis}:{receipt['_id']}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """
+    Raises:
+        ValueError: If the token wasn't made by encode_cursor
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        millis, receipt_id = raw.split(":")
+        return datetime(1970, 1, 1) + timedelta(milliseconds=int(millis)), ObjectId(receipt_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError, InvalidId, OverflowError):
+        raise ValueError("Invalid cursor")
+
+def build_receipt_doc(receipt_data: dict, raw_ocr_text: str, confidence_score: float, user_id: str) -> dict:
+    """
+    Builds the MongoDB document for a new receipt, with its amounts and
+    date normalized.
+    
+    Args:
+        receipt_data: Extracted receipt data
+        raw_ocr_text: Raw OCR text
+        confidence_score: Confidence score
+        user_id: ID of the user who owns this receipt
+        
+    Returns:
+        dict: Receipt document ready to insert
+    """
+    return {
+        **normalize_receipt_fields(receipt_data),
+        "user_id": user_id,
+        "raw_ocr_text": raw_ocr_text,
+        "confidence": confidence_score,
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow()
+    }
+
 
 async def save_receipt(receipt_data: dict, raw_ocr_text: str, confidence_score: float, user_id: str) -> dict:
     """
@@ -20,17 +96,13 @@ async def save_receipt(receipt_data: dict, raw_ocr_text: str, confidence_score:
     receipts_collection = db.receipts
     
     # Prepare document
-    receipt_doc = {
-        **receipt_data,
-        "user_id": user_id,
-        "raw_ocr_text": raw_ocr_text,
-        "confidence": confidence_score,
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
-    }
+    receipt_doc = build_receipt_doc(receipt_data, raw_ocr_text, confidence_score, user_id)
     
     # Insert into MongoDB
     result = await receipts_collection.insert_one(receipt_doc)
+    await add_to_rollups([receipt_doc])
+    await index_receipts([receipt_doc])
+    await bump_data_version(user_id)
     
     # Return the saved document with ID
     receipt_doc["_id"] = str(result.inserted_id)
@@ -38,6 +110,62 @@ async def save_receipt(receipt_data: dict, raw_ocr_text: str, confidence_score:
     return receipt_doc
 
 
+async def save_receipts(receipt_docs: List[dict]) -> List[str]:
+    """
+    Saves several receipt documents with a single insert_many.
+    
+    The insert is unordered, so some documents can be written even when
+    others fail. The rollups, merchant index and data version are updated
+    for the written ones before the error is re-raised.
+
+    Args:
+        receipt_docs: Documents from build_receipt_doc, optionally with
+            pre-assigned ObjectIds
+        
+    Returns:
+        list: IDs of the inserted receipts
+
+    Raises:
+        BulkWriteError: If any document wasn't inserted; pass it to
+            `inserted_receipt_ids` for the ones that were
+    """
+    if not receipt_docs:
+        return []
+    
+    db = await get_database()
+    receipts_collection = db.receipts
+    
+    error = None
+    try:
+        await receipts_collection.insert_many(receipt_docs, ordered=False)
+        inserted = receipt_docs
+    except BulkWriteError as e:
+        failed = _failed_indexes(e)
+        inserted = [doc for index, doc in enumerate(receipt_docs) if index not in failed]
+        error = e
+
+    if inserted:
+        await add_to_rollups(inserted)
+        await index_receipts(inserted)
+        await bump_data_version(*(doc["user_id"] for doc in inserted))
+
+    # insert_many sets _id on each document it was given
+    inserted_ids = [str(doc["_id"]) for doc in inserted]
+    if error is not None:
+        raise error
+    return inserted_ids
+
+
+def _failed_indexes(error: BulkWriteError) -> Set[int]:
+    return {write_error["index"] for write_error in error.details.get("writeErrors", [])}
+
+
+def inserted_receipt_ids(receipt_docs: List[dict], error: BulkWriteError) -> List[str]:
+    """IDs of the documents a failed `save_receipts` call still inserted."""
+    failed = _failed_indexes(error)
+    return [str(doc["_id"]) for index, doc in enumerate(receipt_docs) if index not in failed]
+
+
 async def get_receipt_by_id(receipt_id: str, user_id: str) -> dict:
     """
     Retrieves a receipt by ID for a specific user.
@@ -74,16 +202,55 @@ async def get_all_receipts(user_id: str, skip: int = 0, limit: int = 100) -> lis
     Returns:
         list: List of receipt documents
     """
-    db = await get_database()
-    receipts_collection = db.receipts
+    receipts, _ = await get_receipts_page(user_id, skip=skip, limit=limit)
+    return receipts
+
+
+async def get_receipts_page(
+    user_id: str,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100
+) -> Tuple[list, Optional[str]]:
+    """
+    Retrieves a page of a user's receipts, newest first.
     
-    cursor = receipts_collection.find({"user_id": user_id}).skip(skip).limit(limit).sort("created_at", -1)
-    receipts = await cursor.to_list(length=limit)
+    With a cursor the page starts right after the receipt it was made from,
+    which is a seek on the listing index and costs the same at any depth.
+    `skip` is still honoured for offset pages.
+    
+    Args:
+        user_id: ID of the user
+        cursor: `next_cursor` of the previous page
+        skip: Number of documents to skip (ignored with a cursor)
+        limit: Maximum number of documents to return
+        
+    Returns:
+        tuple: (receipt documents, cursor for the next page or None on the last page)
+        
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    receipts_collection = await get_listing_collection()
+    
+    query = {"user_id": user_id}
+    if cursor:
+        created_at, receipt_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": receipt_id}},
+        ]
+        skip = 0
+    
+    # One extra document tells whether there is a next page
+    receipts = await receipts_collection.find(query).sort(LISTING_SORT).skip(skip).limit(limit + 1).to_list(length=limit + 1)
+    next_cursor = encode_cursor(receipts[limit - 1]) if len(receipts) > limit else None
+    receipts = receipts[:limit]
     
     for receipt in receipts:
         receipt["_id"] = str(receipt["_id"])
         
-    return receipts
+    return receipts, next_cursor
 
 async def update_receipt(receipt_id: str, update_data: dict, user_id: str) -> dict:
     """
@@ -100,28 +267,40 @@ async def update_receipt(receipt_id: str, update_data: dict, user_id: str) -> di
     db = await get_database()
     receipts_collection = db.receipts
     
+    # Amounts and date are stored normalized, as on insert
+    update_data = normalize_receipt_fields(update_data)
+    
     # Add updated_at timestamp
     update_data["updated_at"] = datetime.utcnow()
     
-    # Update the document only if it belongs to the user
-    result = await receipts_collection.find_one_and_update(
+    # Update the document only if it belongs to the user. The previous
+    # version is returned so the rollups and merchant index can move it; update_data
+    # only sets top-level fields, so merging it gives the new version
+    before = await receipts_collection.find_one_and_update(
         {
             "_id": ObjectId(receipt_id),
             "user_id": user_id
         },
         {"$set": update_data},
-        return_document=True
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result:
-        result["_id"] = str(result["_id"])
-        
+    if not before:
+        return None
+    
+    result = {**before, **update_data}
+    await update_rollups(before, result)
+    await reindex_receipt(before, result)
+    await bump_data_version(user_id)
+    
+    result["_id"] = str(result["_id"])
     return result
 
 
 async def delete_receipt(receipt_id: str, user_id: str) -> bool:
     """
-    Deletes a receipt by ID for a specific user.
+    Deletes a receipt by ID for a specific user, along with its stored image,
+    and takes it out of the spending rollups and merchant index.
     
     Args:
         receipt_id: MongoDB ObjectId as string
@@ -133,9 +312,19 @@ async def delete_receipt(receipt_id: str, user_id: str) -> bool:
     db = await get_database()
     receipts_collection = db.receipts
     
-    result = await receipts_collection.delete_one({
-        "_id": ObjectId(receipt_id),
-        "user_id": user_id
-    })
+    deleted = await receipts_collection.find_one_and_delete(
+        {
+            "_id": ObjectId(receipt_id),
+            "user_id": user_id
+        },
+        projection={"image_id": 1, "user_id": 1, "total_minor": 1, "category": 1, "created_at": 1, "store_name": 1}
+    )
+    
+    if deleted:
+        await update_rollups(deleted, None)
+        await unindex_receipt(deleted)
+        await bump_data_version(user_id)
+    if deleted and deleted.get("image_id"):
+        await image_store.delete_images(deleted["image_id"])
     
-    return result.deleted_count > 0
+    return deleted is not None
@@ -0,0 +1,396 @@
+"""
+Resilient Remote Calls
+
+Wraps blocking calls to a remote model (Gemini, or the stub standing in
+for it) with per-attempt timeouts, jittered exponential retry, an AIMD
+adaptive concurrency limit and a circuit breaker, so a slow or failing
+upstream makes requests fail fast instead of piling up on the workers.
+
+Calls run on a thread pool of their own, so a call stuck past its deadline
+holds one of those threads rather than an extraction worker.
+"""
+
+import asyncio
+import functools
+import logging
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, Optional
+
+from app.services.job_queue import iterate_in_executor
+
+logger = logging.getLogger(__name__)
+
+# google.api_core exception classes (matched anywhere in the MRO) worth retrying:
+# 5xx server errors, including DeadlineExceeded, and 429 rate limiting
+RETRYABLE_ERROR_NAMES = {"ServerError", "TooManyRequests"}
+
+
+class TransientError(Exception):
+    """A failure worth retrying, such as an overloaded upstream."""
+
+
+class ServiceUnavailableError(Exception):
+    """Raised when a remote call was refused or gave up; `retry_after` is a hint in seconds."""
+
+    def __init__(self, message: str, retry_after: float = 5.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(ServiceUnavailableError):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+
+class LimiterTimeoutError(ServiceUnavailableError):
+    """Raised when no concurrency slot freed up in time."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (TransientError, TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit.
+
+    Every call that finishes under `latency_target` raises the limit by
+    1/limit (about +1 per round of calls); a timeout, retryable error or
+    slow call multiplies it by `backoff`. Callers beyond the limit wait in
+    FIFO order for up to `acquire` timeout seconds.
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, latency_target: float, backoff: float):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+        self.increases = 0
+        self.decreases = 0
+        self.rejected = 0
+
+    def _grant(self):
+        while self._waiters and self.inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.inflight += 1
+            waiter.set_result(None)
+
+    async def acquire(self, timeout: float):
+        """
+        Raises:
+            LimiterTimeoutError: If no slot became free within `timeout`
+        """
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise LimiterTimeoutError(f"No capacity within {timeout:.1f}s (limit {int(self.limit)})")
+        except BaseException:
+            # Cancelled after the slot was handed over: give it back
+            if waiter.done() and not waiter.cancelled():
+                self.inflight -= 1
+                self._grant()
+            raise
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+
+    def release(self, latency: float, dropped: bool):
+        """Frees a slot and adjusts the limit from the call's outcome."""
+        self.inflight -= 1
+        if dropped or latency > self.latency_target:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+            self.decreases += 1
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.increases += 1
+        self._grant()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": round(self.limit, 2),
+            "inflight": self.inflight,
+            "waiting": sum(1 for waiter in self._waiters if not waiter.done()),
+            "min": self.min_limit,
+            "max": self.max_limit,
+            "increases": self.increases,
+            "decreases": self.decreases,
+            "rejected": self.rejected,
+        }
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls
+    for `reset_timeout` seconds, then lets a single probe through
+    (half-open). A successful probe closes it; a failed one reopens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+
+        self.transitions: Dict[str, int] = {}
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=20)
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        key = f"{self.state}->{state}"
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        self.history.append({"transition": key, "at": datetime.utcnow().isoformat()})
+        logger.warning(f"Circuit breaker {key} after {self.consecutive_failures} consecutive failures")
+        self.state = state
+        if state == self.OPEN:
+            self._opened_at = time.monotonic()
+            self._probe_started = None
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker will let a probe through."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now - self._opened_at < self.reset_timeout:
+                return False
+            self._transition(self.HALF_OPEN)
+
+        if self.state == self.HALF_OPEN:
+            # One probe at a time; a probe that never reported back is replaced
+            if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+                return False
+            self._probe_started = now
+
+        return True
+
+    def record_success(self):
+        if self.state == self.OPEN:
+            # A call started before the breaker opened; wait for the probe
+            return
+        self.consecutive_failures = 0
+        self._transition(self.CLOSED)
+        self._probe_started = None
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self._transition(self.OPEN)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_after": round(self.retry_after(), 1),
+            "transitions": dict(self.transitions),
+            "history": list(self.history),
+        }
+
+
+class ResilientClient:
+    """
+    Runs blocking remote calls on a bounded thread pool of its own.
+
+    The wrapped function must accept a `timeout` keyword (seconds) and
+    enforce it itself, as a per-request transport timeout. A deadline
+    slightly longer backs it up on the event loop, for whole calls and
+    whole streams alike, so a call that ignores it still frees its slot;
+    its thread stays busy until upstream returns, but only in this pool.
+
+    Args:
+        name: Label used in logs
+        limiter: Concurrency limit shared by all calls
+        breaker: Circuit breaker shared by all calls
+        timeout: Per-attempt timeout in seconds
+        max_retries: Retries after the first attempt for retryable errors
+        retry_base: Base delay of the exponential backoff in seconds
+        retry_max: Cap on a single backoff delay in seconds
+        acquire_timeout: Longest wait for a concurrency slot in seconds
+        workers: Threads for remote calls; defaults to the limiter's maximum
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limiter: AdaptiveLimiter,
+        breaker: CircuitBreaker,
+        timeout: float,
+        max_retries: int,
+        retry_base: float,
+        retry_max: float,
+        acquire_timeout: float,
+        workers: Optional[int] = None
+    ):
+        self.name = name
+        self.limiter = limiter
+        self.breaker = breaker
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.acquire_timeout = acquire_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers or limiter.max_limit, thread_name_prefix=f"{name}-remote")
+
+        self.calls = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.short_circuited = 0
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: uniform over [0, min(cap, base * 2^attempt)]
+        return random.uniform(0, min(self.retry_max, self.retry_base * 2 ** attempt))
+
+    async def _start_attempt(self):
+        if not self.breaker.allow():
+            self.short_circuited += 1
+            raise CircuitOpenError(f"{self.name} circuit is open", retry_after=self.breaker.retry_after())
+        await self.limiter.acquire(self.acquire_timeout)
+
+    def _finish_attempt(self, started: float, error: Optional[BaseException]) -> bool:
+        """Records an attempt's outcome; returns True if it should be retried."""
+        retryable = error is not None and is_retryable(error)
+        self.limiter.release(time.perf_counter() - started, dropped=retryable)
+        if isinstance(error, TimeoutError):
+            self.timeouts += 1
+        if retryable:
+            self.breaker.record_failure()
+        else:
+            # A non-retryable error still means upstream answered
+            self.breaker.record_success()
+        return retryable
+
+    def _deadline(self) -> float:
+        # Grace over the transport timeout, so the transport normally fires first
+        return asyncio.get_running_loop().time() + self.timeout + 1
+
+    async def _iterate(self, fn: Callable[..., Iterator[Any]], *args) -> AsyncIterator[Any]:
+        """Items of `fn(*args, timeout=...)`, raising TimeoutError once the deadline passes."""
+        loop = asyncio.get_running_loop()
+        deadline = self._deadline()
+        items = iterate_in_executor(self._executor, fn, *args, timeout=self.timeout)
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(items.__anext__(), max(0.0, deadline - loop.time()))
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"{self.name} stream exceeded {self.timeout}s") from None
+                yield item
+        finally:
+            await items.aclose()
+
+    async def _retry_or_raise(self, attempt: int, error: BaseException):
+        if attempt >= self.max_retries:
+            raise ServiceUnavailableError(
+                f"{self.name} failed after {attempt + 1} attempts: {error}",
+                retry_after=self.breaker.retry_after() or 5.0
+            ) from error
+        self.retries += 1
+        delay = self._backoff(attempt)
+        logger.warning(f"{self.name} attempt {attempt + 1} failed ({error}), retrying in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+    async def call(self, fn: Callable[..., Any], *args) -> Any:
+        """
+        Calls `fn(*args, timeout=...)` with retry, limiting and circuit breaking.
+
+        Raises:
+            ServiceUnavailableError: If the breaker is open, no slot was free
+                or every attempt failed with a retryable error
+        """
+        self.calls += 1
+        for attempt in range(self.max_retries + 1):
+            await self._start_attempt()
+            started = time.perf_counter()
+            try:
+                loop = asyncio.get_running_loop()
+                result = await asyncio.wait_for(
+                    loop.run_in_executor(self._executor, functools.partial(fn, *args, timeout=self.timeout)),
+                    self._deadline() - loop.time()
+                )
+            except Exception as e:
+                error = e
+            except BaseException:
+                self.limiter.release(time.perf_counter() - started, dropped=False)
+                raise
+            else:
+                self._finish_attempt(started, None)
+                return result
+
+            if not self._finish_attempt(started, error):
+                raise error
+            await self._retry_or_raise(attempt, error)
+
+    async def stream(self, fn: Callable[..., Iterator[Any]], *args) -> AsyncIterator[Any]:
+        """
+        Streams `fn(*args, timeout=...)` through the same guards as `call`.
+
+        Only failures before the first item are retried; once output has
+        been yielded an error is recorded and re-raised.
+        """
+        self.calls += 1
+        for attempt in range(self.max_retries + 1):
+            await self._start_attempt()
+            started = time.perf_counter()
+            yielded = False
+            finished = False
+            try:
+                async for item in self._iterate(fn, *args):
+                    yielded = True
+                    yield item
+            except Exception as e:
+                finished = True
+                if not self._finish_attempt(started, e) or yielded:
+                    raise
+                error = e
+            else:
+                finished = True
+                self._finish_attempt(started, None)
+                return
+            finally:
+                if not finished:
+                    # The consumer stopped early; free the slot without judging upstream
+                    self.limiter.release(time.perf_counter() - started, dropped=False)
+
+            await self._retry_or_raise(attempt, error)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "short_circuited": self.short_circuited,
+            "limiter": self.limiter.stats(),
+            "breaker": self.breaker.stats(),
+        }
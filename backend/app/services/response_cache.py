@@ -0,0 +1,90 @@
+"""
+Analytics Response Cache
+
+In-process LRU of rendered analytics responses, keyed by (user, endpoint,
+params, data version). Every receipt write bumps the owner's
+`data_version`, so stale entries are never looked up again and simply
+age out of the LRU; nothing has to be invalidated explicitly.
+
+The same key yields a deterministic ETag, so a client that already has
+the current version gets a 304 without the cache or the database being
+touched beyond the user lookup every request already does.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from bson import ObjectId
+
+from app.utils.config import settings
+from app.utils.db import get_database
+
+CacheKey = Tuple[str, str, Tuple[Tuple[str, Any], ...], int]
+
+
+async def bump_data_version(*user_ids: str):
+    """Marks the users' receipt data as changed."""
+    db = await get_database()
+    object_ids = [ObjectId(user_id) for user_id in set(user_ids) if ObjectId.is_valid(user_id)]
+    if len(object_ids) == 1:
+        await db.users.update_one({"_id": object_ids[0]}, {"$inc": {"data_version": 1}})
+    elif object_ids:
+        await db.users.update_many({"_id": {"$in": object_ids}}, {"$inc": {"data_version": 1}})
+
+
+class ResponseCache:
+    """LRU of rendered response bodies with hit/miss/304 counters."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(user_id: str, endpoint: str, params: Dict[str, Hashable], version: int) -> CacheKey:
+        return user_id, endpoint, tuple(sorted(params.items())), version
+
+    @staticmethod
+    def etag(key: CacheKey) -> str:
+        digest = hashlib.sha1(repr(key[:3]).encode()).hexdigest()[:16]
+        return f'"{key[3]}-{digest}"'
+
+    def get(self, key: CacheKey) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def set(self, key: CacheKey, body: bytes):
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "not_modified": self.not_modified,
+            "evictions": self.evictions,
+        }
+
+
+response_cache = ResponseCache(max_entries=settings.ANALYTICS_CACHE_MAX_ENTRIES)
@@ -0,0 +1,276 @@
+"""
+Receipt Search
+
+Two ways to search a user's receipts by store, merchant, line item and
+payment method:
+
+- Word search with a MongoDB text index (`receipt_search`). The index is
+  prefixed with `user_id`, so a query only walks that user's entries, and
+  results are ranked by text score.
+- Prefix search for typeahead ("amu mil" finds "Amul Milk") with an
+  in-process inverted index per user. It is built from the receipts on
+  first use and tagged with the user's data version like the time-series
+  snapshots; any receipt write makes the next prefix query rebuild it.
+  Set `SEARCH_INDEX_MAX_USERS=0` to turn it off, and prefix queries fall
+  back to word search.
+
+Both rank by field weight (store and merchant names above line items
+above payment method), newest first on ties, and page with skip/limit
+over the ranked ids.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+from app.services.receipt_normalizer import canonical_key
+from app.utils.config import settings
+from app.utils.db import get_database
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX_NAME = "receipt_search"
+FIELD_WEIGHTS = {"store_name": 5, "merchant_name": 5, "items.name": 2, "payment_method": 1}
+
+# What a search result carries; the OCR text and image hashes stay behind
+RESULT_PROJECTION = {
+    "store_name": 1, "merchant_name": 1, "date": 1, "total": 1, "category": 1,
+    "payment_method": 1, "items": 1, "image_id": 1, "created_at": 1,
+}
+
+stats = {"text_queries": 0, "prefix_queries": 0, "builds": 0, "hits": 0, "build_seconds": 0.0, "query_seconds": 0.0}
+
+_search_index_ready = False
+
+
+async def get_search_collection():
+    """Receipts collection, with the text index created on first use."""
+    global _search_index_ready
+
+    db = await get_database()
+    receipts_collection = db.receipts
+
+    if not _search_index_ready:
+        await receipts_collection.create_index(
+            [("user_id", 1)] + [(field, "text") for field in FIELD_WEIGHTS],
+            name=SEARCH_INDEX_NAME,
+            weights=FIELD_WEIGHTS,
+            # No stemming or stop words: "More" and "Big Bazaar" are store names
+            default_language="none",
+        )
+        _search_index_ready = True
+
+    return receipts_collection
+
+
+def _field_values(receipt: dict) -> List[Tuple[str, Optional[str]]]:
+    values = [
+        ("store_name", receipt.get("store_name")),
+        ("merchant_name", receipt.get("merchant_name")),
+        ("payment_method", receipt.get("payment_method")),
+    ]
+    items = receipt.get("items")
+    if isinstance(items, list):
+        values.extend(("items.name", item.get("name")) for item in items if isinstance(item, dict))
+    return values
+
+
+class PrefixIndex:
+    """Sorted terms and per-term postings (receipt position -> best field weight) for one user."""
+
+    __slots__ = ("version", "ids", "created", "terms", "postings")
+
+    def __init__(self, version: int, receipts: List[dict]):
+        self.version = version
+        self.ids: List[ObjectId] = []
+        self.created: List[datetime] = []
+        self.postings: Dict[str, Dict[int, int]] = {}
+
+        for position, receipt in enumerate(receipts):
+            self.ids.append(receipt["_id"])
+            self.created.append(receipt.get("created_at") or datetime.min)
+            for field, value in _field_values(receipt):
+                weight = FIELD_WEIGHTS[field]
+                for term in canonical_key(str(value) if value is not None else None).split():
+                    postings = self.postings.setdefault(term, {})
+                    if postings.get(position, 0) < weight:
+                        postings[position] = weight
+
+        self.terms = sorted(self.postings)
+
+    def _matches(self, prefix: str) -> Dict[int, int]:
+        """Best weight per receipt over all terms starting with `prefix`; exact terms count double."""
+        matches: Dict[int, int] = {}
+        index = bisect_left(self.terms, prefix)
+        while index < len(self.terms) and self.terms[index].startswith(prefix):
+            term = self.terms[index]
+            boost = 2 if term == prefix else 1
+            for position, weight in self.postings[term].items():
+                if matches.get(position, 0) < weight * boost:
+                    matches[position] = weight * boost
+            index += 1
+        return matches
+
+    def search(self, tokens: List[str]) -> List[ObjectId]:
+        """Ids of receipts matching every token as a word prefix, best first."""
+        scores: Optional[Dict[int, int]] = None
+        # Rarest prefixes first, so the candidate set shrinks fastest
+        for matches in sorted((self._matches(token) for token in tokens), key=len):
+            if scores is None:
+                scores = matches
+            else:
+                scores = {position: score + matches[position] for position, score in scores.items() if position in matches}
+            if not scores:
+                return []
+
+        ranked = sorted(scores, key=lambda position: (scores[position], self.created[position]), reverse=True)
+        return [self.ids[position] for position in ranked]
+
+    def size(self) -> int:
+        return sum(len(postings) for postings in self.postings.values())
+
+
+class PrefixIndexCache:
+    """LRU of prefix indexes by user; an index is reused only while its version is current."""
+
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self._indexes: "OrderedDict[str, PrefixIndex]" = OrderedDict()
+        self._building: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_users > 0
+
+    async def get(self, user_id: str, version: int) -> PrefixIndex:
+        with self._lock:
+            index = self._indexes.get(user_id)
+            # Versions only grow, so a newer index than the caller saw is fine
+            if index is not None and index.version >= version:
+                self._indexes.move_to_end(user_id)
+                stats["hits"] += 1
+                return index
+
+        # Concurrent requests for the same user share one build
+        building = self._building.get(user_id)
+        if building is None:
+            building = asyncio.ensure_future(self._build(user_id, version))
+            self._building[user_id] = building
+            building.add_done_callback(lambda _: self._building.pop(user_id, None))
+        index = await asyncio.shield(building)
+        if index.version < version:
+            # A build for an older version was already running
+            return await self.get(user_id, version)
+        return index
+
+    async def _build(self, user_id: str, version: int) -> PrefixIndex:
+        started = time.perf_counter()
+        db = await get_database()
+        cursor = db.receipts.find(
+            {"user_id": user_id},
+            {"store_name": 1, "merchant_name": 1, "payment_method": 1, "items.name": 1, "created_at": 1},
+            batch_size=1000,
+        )
+        index = PrefixIndex(version, await cursor.to_list(length=None))
+
+        with self._lock:
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+
+        elapsed = time.perf_counter() - started
+        stats["builds"] += 1
+        stats["build_seconds"] += elapsed
+        logger.info(f"Built search index for user {user_id}: {len(index.ids)} receipts, {len(index.terms)} terms in {elapsed * 1000:.1f}ms")
+        return index
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            indexes = list(self._indexes.values())
+        queries = stats["text_queries"] + stats["prefix_queries"]
+        return {
+            **stats,
+            "users": len(indexes),
+            "max_users": self.max_users,
+            "postings": sum(index.size() for index in indexes),
+            "avg_query_ms": stats["query_seconds"] * 1000 / queries if queries else 0.0,
+        }
+
+
+prefix_index_cache = PrefixIndexCache(max_users=settings.SEARCH_INDEX_MAX_USERS)
+
+
+def _to_result(receipt: dict, score: Optional[float] = None) -> dict:
+    receipt["_id"] = str(receipt["_id"])
+    if score is not None:
+        receipt["score"] = score
+    return receipt
+
+
+async def _text_search(user_id: str, query: str, skip: int, limit: int) -> List[dict]:
+    receipts_collection = await get_search_collection()
+    cursor = receipts_collection.find(
+        {"user_id": user_id, "$text": {"$search": query}},
+        {**RESULT_PROJECTION, "score": {"$meta": "textScore"}},
+    ).sort([("score", {"$meta": "textScore"}), ("created_at", -1)]).skip(skip).limit(limit)
+    return [_to_result(receipt, round(receipt.pop("score"), 3)) async for receipt in cursor]
+
+
+async def _prefix_search(user_id: str, version: int, tokens: List[str], skip: int, limit: int) -> List[dict]:
+    index = await prefix_index_cache.get(user_id, version)
+    ids = index.search(tokens)[skip:skip + limit]
+    if not ids:
+        return []
+
+    db = await get_database()
+    found = await db.receipts.find({"_id": {"$in": ids}, "user_id": user_id}, RESULT_PROJECTION).to_list(length=len(ids))
+    by_id = {receipt["_id"]: receipt for receipt in found}
+    # Receipts deleted since the index was built are skipped
+    return [_to_result(by_id[receipt_id]) for receipt_id in ids if receipt_id in by_id]
+
+
+async def search_receipts(
+    user_id: str,
+    version: int,
+    query: str,
+    prefix: bool = False,
+    skip: int = 0,
+    limit: int = 20
+) -> List[dict]:
+    """
+    Searches a user's receipts, best match first.
+
+    Args:
+        user_id: Owner of the receipts
+        version: The user's current data version
+        query: Words to look for
+        prefix: Match words by prefix (typeahead) instead of whole words
+        skip: Number of results to skip
+        limit: Maximum number of results to return
+
+    Returns:
+        list: Receipt summaries; word search adds a text `score`
+    """
+    tokens = canonical_key(query).split()
+    if not tokens:
+        return []
+
+    started = time.perf_counter()
+    if prefix and prefix_index_cache.enabled:
+        results = await _prefix_search(user_id, version, tokens, skip, limit)
+        stats["prefix_queries"] += 1
+    else:
+        # MongoDB tokenizes the raw query the way it tokenized the fields
+        results = await _text_search(user_id, query, skip, limit)
+        stats["text_queries"] += 1
+    stats["query_seconds"] += time.perf_counter() - started
+    return results
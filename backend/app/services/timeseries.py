@@ -0,0 +1,303 @@
+"""
+Spending Time Series
+
+Per-user columnar snapshot of spending, held as NumPy arrays sorted by
+day: `days` (days since 1970-01-01), `amounts` (minor units) and
+`categories` (codes into `category_names`). A snapshot is built from the
+receipts collection on first use and tagged with the user's data version;
+any receipt write bumps that version, so the next request rebuilds it.
+
+Daily, weekly and monthly totals, rolling windows and year-over-year
+comparisons are then computed with vectorized NumPy operations over the
+snapshot, without touching the database.
+
+Receipts are placed on the time axis by `purchase_date`, falling back to
+`created_at` for receipts whose date couldn't be parsed.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.receipt_normalizer import MINOR_UNITS
+from app.utils.config import settings
+from app.utils.db import get_database
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ("day", "week", "month", "rolling", "yoy")
+
+
+class DateRangeTooLong(ValueError):
+    """Raised when a series would cover more than ANALYTICS_MAX_SPAN_DAYS days."""
+
+
+stats = {"builds": 0, "hits": 0, "build_seconds": 0.0, "compute_seconds": 0.0, "computes": 0}
+
+
+class SpendingSnapshot:
+    """Column arrays of one user's receipts with a non-zero total, sorted by day."""
+
+    __slots__ = ("version", "days", "amounts", "categories", "category_names")
+
+    def __init__(self, version: int, days: np.ndarray, amounts: np.ndarray, categories: np.ndarray, category_names: List[Optional[str]]):
+        self.version = version
+        self.days = days
+        self.amounts = amounts
+        self.categories = categories
+        self.category_names = category_names
+
+    @classmethod
+    def from_receipts(cls, version: int, receipts: List[dict]) -> "SpendingSnapshot":
+        codes: Dict[Optional[str], int] = {}
+        dates = []
+        amounts = []
+        categories = []
+        for receipt in receipts:
+            when = receipt.get("purchase_date") or receipt.get("created_at")
+            if when is None:
+                continue
+            dates.append(when)
+            amounts.append(receipt["total_minor"])
+            categories.append(codes.setdefault(receipt.get("category") or None, len(codes)))
+
+        days = np.array(dates, dtype="datetime64[D]").astype(np.int64)
+        order = np.argsort(days, kind="stable")
+        return cls(
+            version,
+            days[order],
+            np.array(amounts, dtype=np.int64)[order],
+            np.array(categories, dtype=np.int32)[order],
+            list(codes),
+        )
+
+    def select(self, start_day: Optional[int], end_day: Optional[int], category: Optional[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Days and amounts within [start_day, end_day], optionally for one category."""
+        lo = 0 if start_day is None else np.searchsorted(self.days, start_day, side="left")
+        hi = len(self.days) if end_day is None else np.searchsorted(self.days, end_day, side="right")
+        days = self.days[lo:hi]
+        amounts = self.amounts[lo:hi]
+        if category is not None:
+            if category not in self.category_names:
+                return days[:0], amounts[:0]
+            mask = self.categories[lo:hi] == self.category_names.index(category)
+            days, amounts = days[mask], amounts[mask]
+        return days, amounts
+
+    def nbytes(self) -> int:
+        return self.days.nbytes + self.amounts.nbytes + self.categories.nbytes
+
+
+class SnapshotCache:
+    """LRU of snapshots by user; a snapshot is reused only while its version is current."""
+
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self._snapshots: "OrderedDict[str, SpendingSnapshot]" = OrderedDict()
+        self._building: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    async def get(self, user_id: str, version: int) -> SpendingSnapshot:
+        with self._lock:
+            snapshot = self._snapshots.get(user_id)
+            # Versions only grow, so a newer snapshot than the caller saw is fine
+            if snapshot is not None and snapshot.version >= version:
+                self._snapshots.move_to_end(user_id)
+                stats["hits"] += 1
+                return snapshot
+
+        # Concurrent requests for the same user share one build
+        building = self._building.get(user_id)
+        if building is None:
+            building = asyncio.ensure_future(self._build(user_id, version))
+            self._building[user_id] = building
+            building.add_done_callback(lambda _: self._building.pop(user_id, None))
+        snapshot = await asyncio.shield(building)
+        if snapshot.version < version:
+            # A build for an older version was already running
+            return await self.get(user_id, version)
+        return snapshot
+
+    async def _build(self, user_id: str, version: int) -> SpendingSnapshot:
+        started = time.perf_counter()
+        db = await get_database()
+        cursor = db.receipts.find(
+            {"user_id": user_id, "total_minor": {"$nin": [None, 0]}},
+            {"_id": 0, "purchase_date": 1, "created_at": 1, "category": 1, "total_minor": 1},
+            batch_size=1000,
+        )
+        snapshot = SpendingSnapshot.from_receipts(version, await cursor.to_list(length=None))
+
+        with self._lock:
+            self._snapshots[user_id] = snapshot
+            self._snapshots.move_to_end(user_id)
+            while len(self._snapshots) > self.max_users:
+                self._snapshots.popitem(last=False)
+
+        elapsed = time.perf_counter() - started
+        stats["builds"] += 1
+        stats["build_seconds"] += elapsed
+        logger.info(f"Built spending snapshot for user {user_id}: {len(snapshot.days)} receipts in {elapsed * 1000:.1f}ms")
+        return snapshot
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            snapshots = list(self._snapshots.values())
+        return {
+            **stats,
+            "users": len(snapshots),
+            "max_users": self.max_users,
+            "bytes": sum(snapshot.nbytes() for snapshot in snapshots),
+            "avg_compute_ms": stats["compute_seconds"] * 1000 / stats["computes"] if stats["computes"] else 0.0,
+        }
+
+
+snapshot_cache = SnapshotCache(max_users=settings.TIMESERIES_MAX_USERS)
+
+
+def to_day(value: Optional[str]) -> Optional[int]:
+    """Days since 1970-01-01 of a YYYY-MM-DD date; raises ValueError if malformed."""
+    if not value:
+        return None
+    return int(np.datetime64(value, "D").astype(np.int64))
+
+
+def _labels(keys: np.ndarray, unit: str) -> List[str]:
+    return np.datetime_as_string(keys.astype(f"datetime64[{unit}]")).tolist()
+
+
+def _amounts(minor: np.ndarray) -> List[float]:
+    return (minor / MINOR_UNITS).round(2).tolist()
+
+
+def _bucket_keys(days: np.ndarray, granularity: str) -> Tuple[np.ndarray, str]:
+    """Bucket of each day, as a value of the returned datetime64 unit."""
+    if granularity == "week":
+        # 1970-01-01 was a Thursday; weeks start on Monday
+        return (days + 3) // 7 * 7 - 3, "D"
+    if granularity == "month":
+        return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64), "M"
+    return days, "D"
+
+
+def grouped_totals(days: np.ndarray, amounts: np.ndarray, granularity: str) -> List[dict]:
+    """Totals per day, week (by Monday) or month over sorted days; empty periods are omitted."""
+    if len(days) == 0:
+        return []
+    keys, unit = _bucket_keys(days, granularity)
+    # Days are sorted, so each bucket is one contiguous run
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+    totals = np.add.reduceat(amounts, starts)
+    counts = np.diff(np.append(starts, len(keys)))
+    return [
+        {"period": period, "total": total, "count": count}
+        for period, total, count in zip(_labels(keys[starts], unit), _amounts(totals), counts.tolist())
+    ]
+
+
+def rolling_totals(days: np.ndarray, amounts: np.ndarray, start_day: int, end_day: int, window: int) -> List[dict]:
+    """Trailing `window`-day spending for every day in [start_day, end_day]."""
+    if end_day < start_day:
+        return []
+    if end_day - start_day + 1 > settings.ANALYTICS_MAX_SPAN_DAYS:
+        # One value per day, so the span bounds the work and the response
+        raise DateRangeTooLong(f"Date range can't be longer than {settings.ANALYTICS_MAX_SPAN_DAYS} days")
+    # Days before start_day still count towards the first windows
+    origin = start_day - window + 1
+    mask = days >= origin
+    daily = np.bincount(days[mask] - origin, weights=amounts[mask], minlength=end_day - origin + 1)
+    cumulative = np.concatenate(([0.0], np.cumsum(daily)))
+    rolling = cumulative[window:] - cumulative[:-window]
+    return [
+        {"period": period, "total": total}
+        for period, total in zip(_labels(np.arange(start_day, end_day + 1), "D"), _amounts(rolling))
+    ]
+
+
+def year_over_year(days: np.ndarray, amounts: np.ndarray, start_day: Optional[int], end_day: Optional[int]) -> List[dict]:
+    """Monthly totals next to the same month a year earlier."""
+    if len(days) == 0:
+        return []
+    months, _ = _bucket_keys(days, "month")
+    first = int(months[0])
+    monthly = np.bincount(months - first, weights=amounts)
+    previous = np.concatenate((np.zeros(12), monthly))[:len(monthly)]
+
+    present = np.flatnonzero(monthly)
+    if start_day is not None:
+        present = present[present + first >= _bucket_keys(np.array([start_day]), "month")[0][0]]
+    if end_day is not None:
+        present = present[present + first <= _bucket_keys(np.array([end_day]), "month")[0][0]]
+
+    current, before = monthly[present], previous[present]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = np.where(before > 0, (current - before) / before * 100, np.nan)
+    return [
+        {
+            "period": period,
+            "total": total,
+            "previous_total": previous_total,
+            "change_pct": None if np.isnan(pct) else round(float(pct), 1),
+        }
+        for period, total, previous_total, pct in zip(
+            _labels(present + first, "M"), _amounts(current), _amounts(before), change
+        )
+    ]
+
+
+async def get_timeseries(
+    user_id: str,
+    version: int,
+    granularity: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    category: Optional[str] = None,
+    window: int = 30
+) -> List[dict]:
+    """
+    Computes a spending time series from the user's snapshot.
+
+    Args:
+        user_id: Owner of the receipts
+        version: The user's current data version
+        granularity: "day", "week", "month", "rolling" (trailing `window`
+            days for every day) or "yoy" (months against a year earlier)
+        start_date: Optional first day (YYYY-MM-DD)
+        end_date: Optional last day (YYYY-MM-DD)
+        category: Optional category to restrict to
+        window: Rolling window length in days
+
+    Returns:
+        List of dicts with period, total and per-view fields
+
+    Raises:
+        DateRangeTooLong: If a rolling series would cover more than
+            ANALYTICS_MAX_SPAN_DAYS days
+    """
+    snapshot = await snapshot_cache.get(user_id, version)
+
+    started = time.perf_counter()
+    start_day, end_day = to_day(start_date), to_day(end_date)
+    if granularity == "yoy":
+        days, amounts = snapshot.select(None, end_day, category)
+        result = year_over_year(days, amounts, start_day, end_day)
+    elif granularity == "rolling":
+        days, amounts = snapshot.select(None, end_day, category)
+        if end_day is None:
+            end_day = int(days[-1]) if len(days) else -1
+        if start_day is None:
+            # Without a start, cover the most recent days up to the cap
+            start_day = max(int(days[0]) if len(days) else 0, end_day - settings.ANALYTICS_MAX_SPAN_DAYS + 1)
+        result = rolling_totals(days, amounts, start_day, end_day, window)
+    else:
+        days, amounts = snapshot.select(start_day, end_day, category)
+        result = grouped_totals(days, amounts, granularity)
+
+    stats["computes"] += 1
+    stats["compute_seconds"] += time.perf_counter() - started
+    return result
@@ -11,5 +11,106 @@ class Settings:
     ALGORITHM = "HS256"
     ACCESS_TOKEN_EXPIRE_DAYS = 7
 
-settings = Settings()
+    # Emails allowed to read /metrics; empty lets any signed-in user
+    METRICS_USERS = [email.strip().lower() for email in os.getenv("METRICS_USERS", "").split(",") if email.strip()]
+
+    # Background extraction job queue
+    EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "4"))
+    EXTRACTION_MAX_PENDING = int(os.getenv("EXTRACTION_MAX_PENDING", "100"))
+    EXTRACTION_JOB_TTL_SECONDS = int(os.getenv("EXTRACTION_JOB_TTL_SECONDS", "3600"))
+
+    # Content-addressed extraction cache
+    EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "512"))
+    EXTRACTION_CACHE_TTL_SECONDS = int(os.getenv("EXTRACTION_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+    # Perceptual near-duplicate detection
+    # Hamming distance between image hashes; at most 7, which the 8-band index is guaranteed to find
+    DUPLICATE_MAX_DISTANCE = int(os.getenv("DUPLICATE_MAX_DISTANCE", "6"))
+    DUPLICATE_LOOKBACK_DAYS = int(os.getenv("DUPLICATE_LOOKBACK_DAYS", "30"))
+    # "flag" saves duplicates with possible_duplicate_of; "skip" drops uploads whose image and content both match
+    DUPLICATE_ACTION = os.getenv("DUPLICATE_ACTION", "flag")
+
+    # Multi-file batch uploads
+    BATCH_UPLOAD_MAX_FILES = int(os.getenv("BATCH_UPLOAD_MAX_FILES", "50"))
+    BATCH_UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", "4"))
+
+    # Image payload sent to Gemini
+    GEMINI_IMAGE_MAX_EDGE = int(os.getenv("GEMINI_IMAGE_MAX_EDGE", "1600"))
+    GEMINI_IMAGE_MAX_BYTES = int(os.getenv("GEMINI_IMAGE_MAX_BYTES", "500000"))
+    GEMINI_IMAGE_FORMAT = os.getenv("GEMINI_IMAGE_FORMAT", "jpeg")
+
+    # Process pool for CPU-bound image / OCR work
+    PROCESS_POOL_WORKERS = int(os.getenv("PROCESS_POOL_WORKERS", str(os.cpu_count() or 1)))
+    PROCESS_POOL_MAX_TASKS_PER_CHILD = int(os.getenv("PROCESS_POOL_MAX_TASKS_PER_CHILD", "200"))
+    PROCESS_POOL_WARMUP = os.getenv("PROCESS_POOL_WARMUP", "false").lower() == "true"
+
+    # Models loaded at startup instead of on first use, e.g. "gemini,paddleocr"
+    MODEL_WARMUP = [name.strip() for name in os.getenv("MODEL_WARMUP", "").split(",") if name.strip()]
+
+    # "gemini" sends every image to Gemini; "tiered" tries local OCR first
+    EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "gemini")
+    OCR_CONFIDENCE_THRESHOLD = float(os.getenv("OCR_CONFIDENCE_THRESHOLD", "80"))
+    OCR_PREPROCESS_PIPELINE = os.getenv("OCR_PREPROCESS_PIPELINE", "fast")
+
+    # Upload ingestion
+    UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+    UPLOAD_SPOOL_THRESHOLD = int(os.getenv("UPLOAD_SPOOL_THRESHOLD", str(2 * 1024 * 1024)))
+    UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(256 * 1024)))
 
+    # Extraction backend: "gemini", "ocr" (local PaddleOCR) or "stub" (offline benchmarking)
+    EXTRACTION_BACKEND = os.getenv("EXTRACTION_BACKEND", "gemini")
+    STUB_LATENCY_DISTRIBUTION = os.getenv("STUB_LATENCY_DISTRIBUTION", "lognormal")
+    STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "1500"))
+    STUB_LATENCY_SPREAD = float(os.getenv("STUB_LATENCY_SPREAD", "0.5"))
+    STUB_FAILURE_RATE = float(os.getenv("STUB_FAILURE_RATE", "0"))
+    STUB_STALL_RATE = float(os.getenv("STUB_STALL_RATE", "0"))
+    STUB_STALL_MS = float(os.getenv("STUB_STALL_MS", "30000"))
+    STUB_SEED = int(os.environ["STUB_SEED"]) if os.getenv("STUB_SEED") else None
+
+    # Guards around remote extraction calls (Gemini, or the stub standing in for it)
+    GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "30"))
+    GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "2"))
+    GEMINI_RETRY_BASE_SECONDS = float(os.getenv("GEMINI_RETRY_BASE_SECONDS", "0.5"))
+    GEMINI_RETRY_MAX_SECONDS = float(os.getenv("GEMINI_RETRY_MAX_SECONDS", "8"))
+    GEMINI_LIMIT_INITIAL = int(os.getenv("GEMINI_LIMIT_INITIAL", str(EXTRACTION_WORKERS)))
+    GEMINI_LIMIT_MIN = int(os.getenv("GEMINI_LIMIT_MIN", "1"))
+    GEMINI_LIMIT_MAX = int(os.getenv("GEMINI_LIMIT_MAX", str(EXTRACTION_WORKERS)))
+    GEMINI_LIMIT_LATENCY_SECONDS = float(os.getenv("GEMINI_LIMIT_LATENCY_SECONDS", "15"))
+    GEMINI_LIMIT_BACKOFF = float(os.getenv("GEMINI_LIMIT_BACKOFF", "0.75"))
+    GEMINI_ACQUIRE_TIMEOUT_SECONDS = float(os.getenv("GEMINI_ACQUIRE_TIMEOUT_SECONDS", "10"))
+    GEMINI_BREAKER_FAILURES = int(os.getenv("GEMINI_BREAKER_FAILURES", "5"))
+    GEMINI_BREAKER_RESET_SECONDS = float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", "30"))
+    # "none" fails fast while Gemini is unavailable; "ocr" falls back to local OCR
+    GEMINI_FALLBACK = os.getenv("GEMINI_FALLBACK", "none")
+
+    # Per-user token buckets as "route=capacity/seconds"; routes not listed are unlimited
+    RATE_LIMITS = dict(
+        pair.strip().split("=", 1)
+        for pair in os.getenv("RATE_LIMITS", "upload=30/60,batch_upload=5/60,analytics=60/60,export=5/60").split(",")
+        if pair.strip()
+    )
+    # "memory" limits each worker separately; "mongo" shares buckets across workers
+    RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+
+    # Original receipt images and thumbnails in GridFS
+    STORE_RECEIPT_IMAGES = os.getenv("STORE_RECEIPT_IMAGES", "true").lower() == "true"
+    IMAGE_CHUNK_SIZE = int(os.getenv("IMAGE_CHUNK_SIZE", str(255 * 1024)))
+    THUMBNAIL_MAX_EDGE = int(os.getenv("THUMBNAIL_MAX_EDGE", "256"))
+    THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "60"))
+
+    # Rendered analytics responses kept per (user, endpoint, params, data version)
+    ANALYTICS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "2048"))
+
+    # Users whose columnar spending snapshot is kept in memory
+    TIMESERIES_MAX_USERS = int(os.getenv("TIMESERIES_MAX_USERS", "256"))
+
+    # Longest date range, in days, an analytics query may cover (5 years)
+    ANALYTICS_MAX_SPAN_DAYS = int(os.getenv("ANALYTICS_MAX_SPAN_DAYS", "1827"))
+
+    # Receipts fetched and encoded per chunk of a streamed export
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+
+    # Users whose in-process prefix search index is kept; 0 turns prefix search off
+    SEARCH_INDEX_MAX_USERS = int(os.getenv("SEARCH_INDEX_MAX_USERS", "256"))
+
+settings = Settings()
@@ -0,0 +1,105 @@
+"""
+Upload Ingestion
+
+Reads an upload in fixed-size chunks, enforcing a size limit as it goes.
+Small uploads stay in one in-memory buffer; larger ones are spooled to a
+temporary file and memory-mapped. Either way the rest of the pipeline gets
+a single zero-copy memoryview instead of a fresh `bytes` object.
+"""
+
+import mmap
+import tempfile
+from typing import Optional
+
+from fastapi import UploadFile
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the configured maximum size."""
+
+
+class IngestedUpload:
+    """An upload's bytes, exposed as `view` until `close()` is called."""
+
+    def __init__(self, filename: Optional[str], view: memoryview, spool=None, mapped: Optional[mmap.mmap] = None):
+        self.filename = filename
+        self.view = view
+        self.size = len(view)
+        self._spool = spool
+        self._mapped = mapped
+
+    @property
+    def spooled(self) -> bool:
+        return self._mapped is not None
+
+    def close(self):
+        try:
+            self.view.release()
+            if self._mapped is not None:
+                self._mapped.close()
+        except BufferError:
+            # A cancelled task still holds an array over the buffer; it is freed when collected
+            pass
+        if self._spool is not None:
+            self._spool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+async def ingest_upload(file: UploadFile, max_bytes: int, spool_threshold: int, chunk_size: int) -> IngestedUpload:
+    """
+    Read an UploadFile into a bounded buffer.
+
+    Args:
+        file: The incoming upload
+        max_bytes: Reject uploads larger than this
+        spool_threshold: Uploads larger than this go to a temp file + mmap
+        chunk_size: Bytes read per chunk
+
+    Returns:
+        IngestedUpload; the caller must close it when processing is done
+
+    Raises:
+        UploadTooLargeError: If the upload exceeds max_bytes
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLargeError(f"Upload is {file.size} bytes, maximum is {max_bytes}")
+
+    buffer = bytearray()
+    spool = None
+    total = 0
+
+    try:
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+
+            total += len(chunk)
+            if total > max_bytes:
+                raise UploadTooLargeError(f"Upload exceeds maximum of {max_bytes} bytes")
+
+            if spool is None and total > spool_threshold:
+                spool = tempfile.TemporaryFile()
+                spool.write(buffer)
+                buffer = bytearray()
+
+            if spool is not None:
+                spool.write(chunk)
+            else:
+                buffer += chunk
+    except BaseException:
+        if spool is not None:
+            spool.close()
+        raise
+
+    if spool is None:
+        return IngestedUpload(file.filename, memoryview(buffer))
+
+    spool.flush()
+    mapped = mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ)
+    return IngestedUpload(file.filename, memoryview(mapped), spool=spool, mapped=mapped)
@@ -0,0 +1,132 @@
+"""
+Incremental JSON Parser
+
+Consumes a JSON object as text fragments arrive (e.g. a streamed model
+response) and reports each top-level field as soon as its value is
+complete, plus each element of selected array fields as it closes. Text
+before the opening brace, such as a markdown fence, is ignored.
+"""
+
+import json
+from typing import Any, Dict, Iterable, List
+
+
+class IncrementalJSONParser:
+    def __init__(self, stream_arrays: Iterable[str] = ()):
+        self.stream_arrays = set(stream_arrays)
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+        self._element_start = None
+        self._element_index = 0
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Add a fragment of text.
+
+        Returns:
+            list: Events completed by this fragment, in order. Either
+            {"field": key, "value": value} for a top-level field or
+            {"field": key, "index": i, "element": value} for an element of
+            a streamed array field.
+        """
+        self._buffer += text
+        events = []
+
+        while self._pos < len(self._buffer):
+            pos = self._pos
+            ch = self._buffer[pos]
+            self._pos += 1
+
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                    self._expect_key = True
+                continue
+
+            if self._depth == 0:
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect_key and self._key_start is not None:
+                        self._key = json.loads(self._buffer[self._key_start:pos + 1])
+                        self._key_start = None
+                continue
+
+            if ch.isspace():
+                continue
+
+            in_streamed_array = self._depth == 2 and self._key in self.stream_arrays and not self._expect_key
+
+            if ch in ",}]":
+                if in_streamed_array and self._element_start is not None:
+                    self._emit_element(events, pos)
+                if self._depth == 1 and self._value_start is not None:
+                    self._emit_field(events, pos)
+                if ch == ",":
+                    if self._depth == 1:
+                        self._expect_key = True
+                    continue
+
+                self._depth -= 1
+                if self._depth == 2 and self._element_start is not None and self._key in self.stream_arrays:
+                    self._emit_element(events, pos + 1)
+                elif self._depth == 1 and self._value_start is not None:
+                    self._emit_field(events, pos + 1)
+                continue
+
+            if ch == ":":
+                if self._depth == 1:
+                    self._expect_key = False
+                continue
+
+            if self._depth == 1:
+                if self._expect_key:
+                    if ch == '"':
+                        self._key_start = pos
+                        self._in_string = True
+                    continue
+                if self._value_start is None:
+                    self._value_start = pos
+                    if self._key in self.stream_arrays:
+                        self._element_index = 0
+            elif in_streamed_array and self._element_start is None:
+                self._element_start = pos
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+
+        return events
+
+    def _emit_field(self, events: List[Dict[str, Any]], end: int):
+        raw = self._buffer[self._value_start:end].strip()
+        self._value_start = None
+        try:
+            events.append({"field": self._key, "value": json.loads(raw)})
+        except ValueError:
+            pass
+
+    def _emit_element(self, events: List[Dict[str, Any]], end: int):
+        raw = self._buffer[self._element_start:end].strip()
+        self._element_start = None
+        try:
+            events.append({"field": self._key, "index": self._element_index, "element": json.loads(raw)})
+        except ValueError:
+            pass
+        self._element_index += 1
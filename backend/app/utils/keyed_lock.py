@@ -0,0 +1,35 @@
+"""
+Keyed Locks
+
+One asyncio lock per key (e.g. a user ID), created on first use and
+dropped as soon as nothing holds or waits on it, so a long-running worker
+only keeps locks for work in progress.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Hashable, List
+
+
+class KeyedLock:
+    def __init__(self):
+        # key -> [lock, number of holders and waiters]
+        self._locks: Dict[Hashable, List] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncIterator[None]:
+        """Holds the lock for `key` for the duration of the block."""
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    def __len__(self) -> int:
+        return len(self._locks)
@@ -1,33 +1,36 @@
+import threading
+import time
+
 import cv2
 import numpy as np
 
+UPLOAD_ENCODERS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, "image/jpeg"),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, "image/webp"),
+}
+UPLOAD_QUALITIES = (90, 80, 70, 60, 50)
+UPLOAD_MIN_EDGE = 640
+
 def grayscale(image):
+    if len(image.shape) == 2:
+        return image
     return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
 def auto_brightness_contrast(image, clip_hist_percent=1):
-    gray = image
-    if len(image.shape) == 3:
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray = grayscale(image)
         
-    hist = cv2.calcHist([gray], [0], None, [256], [0, 256])
-    hist_size = len(hist)
-    
-    accumulator = []
-    accumulator.append(float(hist[0]))
-    for index in range(1, hist_size):
-        accumulator.append(accumulator[index - 1] + float(hist[index]))
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+    accumulator = np.cumsum(hist)
         
     maximum = accumulator[-1]
-    clip_hist_percent *= (maximum / 100.0)
-    clip_hist_percent /= 2.0
+    clip = clip_hist_percent * maximum / 100.0 / 2.0
     
-    minimum_gray = 0
-    while accumulator[minimum_gray] < clip_hist_percent:
-        minimum_gray += 1
-        
-    maximum_gray = hist_size - 1
-    while accumulator[maximum_gray] >= (maximum - clip_hist_percent):
-        maximum_gray -= 1
+    # First bin whose cumulative count reaches the low clip, last bin still below the high clip
+    minimum_gray = int(np.searchsorted(accumulator, clip, side="left"))
+    maximum_gray = int(np.searchsorted(accumulator, maximum - clip, side="left")) - 1
+    
+    if maximum_gray <= minimum_gray:
+        return image
         
     alpha = 255 / (maximum_gray - minimum_gray)
     beta = -minimum_gray * alpha
@@ -44,6 +47,12 @@ def sharpen(image):
                        [0, -1, 0]])
     return cv2.filter2D(image, -1, kernel)
 
+def rotate(image, angle):
+    (h, w) = image.shape[:2]
+    center = (w // 2, h // 2)
+    M = cv2.getRotationMatrix2D(center, angle, 1.0)
+    return cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+
 def deskew(image):
     coords = np.column_stack(np.where(image > 0))
     angle = cv2.minAreaRect(coords)[-1]
@@ -53,11 +62,34 @@ def deskew(image):
     else:
         angle = -angle
         
-    (h, w) = image.shape[:2]
-    center = (w // 2, h // 2)
-    M = cv2.getRotationMatrix2D(center, angle, 1.0)
-    rotated = cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
-    return rotated
+    return rotate(image, angle)
+
+def estimate_skew_angle(image, proxy_edge=800):
+    """
+    Estimates the rotation in degrees that straightens the text, working on
+    a downsampled copy of the image.
+    Only the dark (text) pixels of the proxy are collected, via
+    cv2.findNonZero, so memory stays small however large the photo is.
+    """
+    proxy = fit_long_edge(grayscale(image), proxy_edge)
+    _, mask = cv2.threshold(proxy, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    coords = cv2.findNonZero(mask)
+    if coords is None:
+        return 0.0
+
+    angle = cv2.minAreaRect(coords)[-1]
+    # OpenCV reports [0, 90) since 4.5 and [-90, 0) before; fold into [-45, 45]
+    if angle > 45:
+        angle -= 90
+    elif angle < -45:
+        angle += 90
+    return angle
+
+def deskew_proxy(image, proxy_edge=800):
+    angle = estimate_skew_angle(image, proxy_edge)
+    if abs(angle) < 0.1:
+        return image
+    return rotate(image, angle)
 
 def resize(image, width=None, height=None, inter=cv2.INTER_AREA):
     dim = None
@@ -75,21 +107,185 @@ def resize(image, width=None, height=None, inter=cv2.INTER_AREA):
 
     return cv2.resize(image, dim, interpolation=inter)
 
-def preprocess_image(image_bytes: bytes) -> bytes:
+def decode_image(image_bytes: bytes, flags=cv2.IMREAD_COLOR):
     nparr = np.frombuffer(image_bytes, np.uint8)
-    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    
-    image = auto_brightness_contrast(image)
-    
-    gray = grayscale(image)
-    
-    denoised = denoise(gray)
-    
-    sharpened = sharpen(denoised)
-   
-    deskewed = deskew(sharpened)
-    
-    resized = resize(deskewed, width=1200)
-    
-    _, encoded_img = cv2.imencode('.jpg', resized)
-    return encoded_img.tobytes()
+    return cv2.imdecode(nparr, flags)
+
+def dhash(image, hash_size=8) -> str:
+    """
+    Difference hash of an image as a hex string of hash_size * hash_size bits.
+    Each bit records whether a pixel is brighter than its right neighbour on a
+    (hash_size + 1) x hash_size thumbnail, so it survives rescaling,
+    recompression and small shifts in framing.
+    """
+    if len(image.shape) == 3:
+        image = grayscale(image)
+    small = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    diff = small[:, 1:] > small[:, :-1]
+    return np.packbits(diff.flatten()).tobytes().hex()
+
+def detect_mime_type(image_bytes: bytes):
+    if image_bytes[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if image_bytes[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "image/webp"
+    if image_bytes[4:8] == b"ftyp" and image_bytes[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "image/heic"
+    return None
+
+def fit_long_edge(image, long_edge):
+    (h, w) = image.shape[:2]
+    if max(h, w) <= long_edge:
+        return image
+    if h >= w:
+        return resize(image, height=long_edge)
+    return resize(image, width=long_edge)
+
+def compress_for_upload(image_bytes: bytes, max_edge=1600, max_bytes=500_000, fmt="jpeg"):
+    """
+    Shrinks an image to fit a byte budget before sending it to a vision model.
+
+    Downsamples to `max_edge` on the long side, then re-encodes at falling
+    quality until the result fits in `max_bytes`, shrinking the image further
+    if even the lowest quality is too big. Images that already fit, or that
+    OpenCV cannot decode (e.g. HEIC), are returned unchanged.
+
+    Returns:
+        tuple: (encoded bytes, MIME type)
+    """
+    mime_type = detect_mime_type(image_bytes)
+    image = decode_image(image_bytes)
+    if image is None:
+        return image_bytes, mime_type or "image/jpeg"
+
+    long_edge = max(image.shape[:2])
+    if len(image_bytes) <= max_bytes and long_edge <= max_edge and mime_type in ("image/jpeg", "image/png", "image/webp"):
+        return image_bytes, mime_type
+
+    ext, quality_flag, out_mime = UPLOAD_ENCODERS[fmt]
+    edge = min(long_edge, max_edge)
+    while True:
+        scaled = fit_long_edge(image, edge)
+        for quality in UPLOAD_QUALITIES:
+            ok, encoded = cv2.imencode(ext, scaled, [quality_flag, quality])
+            if ok and encoded.nbytes <= max_bytes:
+                return encoded.tobytes(), out_mime
+        if edge <= UPLOAD_MIN_EDGE:
+            return encoded.tobytes(), out_mime
+        edge = max(int(edge * 0.75), UPLOAD_MIN_EDGE)
+
+def make_thumbnail(image_bytes: bytes, max_edge=256, quality=60):
+    """
+    Renders a small WebP preview for list views.
+
+    Decodes at quarter scale first, which is several times faster than a
+    full decode of a phone photo, and only falls back to a full decode
+    when that is already smaller than the thumbnail.
+
+    Returns:
+        bytes: WebP-encoded thumbnail, or None if the image can't be decoded
+    """
+    image = decode_image(image_bytes, cv2.IMREAD_REDUCED_COLOR_4)
+    if image is None or max(image.shape[:2]) < max_edge:
+        image = decode_image(image_bytes)
+    if image is None:
+        return None
+
+    ok, encoded = cv2.imencode(".webp", fit_long_edge(image, max_edge), [cv2.IMWRITE_WEBP_QUALITY, quality])
+    return encoded.tobytes() if ok else None
+
+PREPROCESS_STAGES = {
+    "brightness": auto_brightness_contrast,
+    "grayscale": grayscale,
+    "denoise": denoise,
+    "sharpen": sharpen,
+    "deskew": deskew,
+    "deskew_proxy": deskew_proxy,
+    "resize": lambda image: resize(image, width=1200),
+}
+
+PREPROCESS_PIPELINES = {
+    # Full chain for hard photos (shadows, noise, skew)
+    "quality": ["brightness", "grayscale", "denoise", "sharpen", "deskew", "resize"],
+    # Same cleanup on large photos: shrink to output size before denoising and
+    # estimate skew on a small proxy, rotating once at output resolution
+    "lowmem": ["grayscale", "resize", "brightness", "denoise", "sharpen", "deskew_proxy"],
+    # Clean scans: shrink first so the remaining stages touch fewer pixels
+    "fast": ["grayscale", "resize", "brightness", "sharpen"],
+}
+
+class PreprocessPipeline:
+    """
+    A named sequence of preprocessing stages.
+
+    Every run records how long each stage took; totals per stage are kept on
+    the pipeline so the expensive stages on real traffic can be found and
+    switched off.
+    """
+
+    def __init__(self, name, stage_names):
+        unknown = [stage for stage in stage_names if stage not in PREPROCESS_STAGES]
+        if unknown:
+            raise ValueError(f"Unknown preprocessing stages: {unknown}")
+        self.name = name
+        self.stage_names = list(stage_names)
+        self.runs = 0
+        self.stage_seconds = {stage: 0.0 for stage in ["decode", *self.stage_names, "encode"]}
+        self._lock = threading.Lock()
+
+    def run(self, image):
+        """Apply the stages to a decoded image and return (image, timings)."""
+        timings = {}
+        for stage in self.stage_names:
+            started = time.perf_counter()
+            image = PREPROCESS_STAGES[stage](image)
+            timings[stage] = time.perf_counter() - started
+        return image, timings
+
+    def process(self, image_bytes: bytes):
+        """Decode, run every stage and re-encode as JPEG. Returns (bytes, timings)."""
+        started = time.perf_counter()
+        image = decode_image(image_bytes)
+        decode_seconds = time.perf_counter() - started
+
+        image, timings = self.run(image)
+
+        started = time.perf_counter()
+        _, encoded_img = cv2.imencode('.jpg', image)
+        timings = {"decode": decode_seconds, **timings, "encode": time.perf_counter() - started}
+
+        self._record(timings)
+        return encoded_img.tobytes(), timings
+
+    def _record(self, timings):
+        with self._lock:
+            self.runs += 1
+            for stage, seconds in timings.items():
+                self.stage_seconds[stage] += seconds
+
+    def stats(self):
+        with self._lock:
+            return {
+                "stages": self.stage_names,
+                "runs": self.runs,
+                "avg_stage_ms": {
+                    stage: (seconds / self.runs * 1000 if self.runs else 0.0)
+                    for stage, seconds in self.stage_seconds.items()
+                },
+            }
+
+_pipelines = {name: PreprocessPipeline(name, stages) for name, stages in PREPROCESS_PIPELINES.items()}
+
+def get_pipeline(name="quality") -> PreprocessPipeline:
+    if name not in _pipelines:
+        raise ValueError(f"Unknown preprocessing pipeline: {name}. Must be one of: {list(_pipelines)}")
+    return _pipelines[name]
+
+def pipeline_stats():
+    return {name: pipeline.stats() for name, pipeline in _pipelines.items()}
+
+def preprocess_image(image_bytes: bytes, pipeline="quality") -> bytes:
+    processed, _ = get_pipeline(pipeline).process(image_bytes)
+    return processed
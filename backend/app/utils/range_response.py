@@ -0,0 +1,138 @@
+"""
+Ranged File Responses
+
+Serves a stored GridFS file with the HTTP caching and byte-range headers
+clients need to cache images and resume partial downloads: ETag and
+Last-Modified for revalidation, and a single `Range: bytes=` range
+answered with 206 Partial Content.
+"""
+
+from datetime import timezone
+from email.utils import format_datetime
+from typing import Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorGridOut
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when a requested byte range lies outside the file."""
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single `bytes=` range into inclusive (start, end) offsets.
+
+    Returns:
+        tuple, or None when the whole file should be sent (no header, a
+        different unit or several ranges, which may be ignored per RFC 9110)
+
+    Raises:
+        RangeNotSatisfiable: If the range starts beyond the end of the file
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+
+    start_text, _, end_text = header[6:].strip().partition("-")
+    try:
+        if not start_text:
+            # Suffix range: the last N bytes
+            length = int(end_text)
+            if length <= 0:
+                raise RangeNotSatisfiable(header)
+            return max(size - length, 0), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+def _opaque_tag(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches `etag`.
+
+    Uses the weak comparison RFC 9110 requires for If-None-Match, so
+    `W/"x"` matches `"x"`; `*` matches any current representation.
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    if "*" in tags:
+        return True
+    return _opaque_tag(etag) in {_opaque_tag(tag) for tag in tags}
+
+
+async def _stream(grid_out: AsyncIOMotorGridOut, start: int, length: int):
+    grid_out.seek(start)
+    remaining = length
+    while remaining > 0:
+        chunk = await grid_out.readchunk()
+        if not chunk:
+            break
+        chunk = chunk[:remaining]
+        remaining -= len(chunk)
+        yield chunk
+
+
+async def gridfs_response(
+    request: Request,
+    grid_out: AsyncIOMotorGridOut,
+    media_type: str,
+    cache_control: str = "private, max-age=31536000, immutable"
+) -> Response:
+    """
+    Builds a 200, 206, 304 or 416 response for a GridFS file.
+
+    Stored files never change, so the file ID is a strong ETag and the
+    default Cache-Control lets clients keep them indefinitely.
+    """
+    size = grid_out.length
+    # PyMongo returns naive UTC datetimes unless the client is tz_aware
+    uploaded = grid_out.upload_date
+    if uploaded.tzinfo is None:
+        uploaded = uploaded.replace(tzinfo=timezone.utc)
+    headers = {
+        "ETag": f'"{grid_out._id}"',
+        "Last-Modified": format_datetime(uploaded, usegmt=True),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range != headers["ETag"]:
+        # The client's partial copy is stale; send the whole file
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    headers["Content-Length"] = str(end - start + 1 if size else 0)
+    return StreamingResponse(
+        _stream(grid_out, start, end - start + 1),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers
+    )
@@ -0,0 +1,229 @@
+"""
+Per-User Rate Limiting
+
+Token buckets keyed by route and JWT subject. Each route has a capacity
+(the burst it allows) and a refill period; a request spends one token and
+is rejected with 429 and Retry-After when the bucket is empty.
+
+The default backend keeps buckets in process memory, which costs about a
+microsecond per request but only limits each worker separately. The
+"mongo" backend keeps them in a shared collection so limits hold across
+workers, at the price of one round trip per request.
+"""
+
+import logging
+import math
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Depends, HTTPException
+from pymongo import ReturnDocument
+
+from app.models.user import TokenData
+from app.utils.auth import get_current_user
+from app.utils.config import settings
+from app.utils.db import get_database
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimit:
+    """`capacity` requests at once, refilled evenly over `period` seconds."""
+
+    __slots__ = ("capacity", "period", "rate")
+
+    def __init__(self, capacity: int, period: float):
+        self.capacity = capacity
+        self.period = period
+        self.rate = capacity / period
+
+    @classmethod
+    def parse(cls, spec: str) -> "RateLimit":
+        """Parses "capacity/seconds", e.g. "10/60"."""
+        capacity, period = spec.split("/")
+        return cls(int(capacity), float(period))
+
+    def __repr__(self):
+        return f"{self.capacity}/{self.period:g}s"
+
+
+class MemoryBuckets:
+    """
+    Token buckets in a dict of [tokens, last refill time] lists.
+
+    Buckets idle long enough to have refilled completely are equivalent to
+    missing ones, so they are swept every `sweep_every` hits to keep memory
+    bounded by the number of recently active users.
+    """
+
+    def __init__(self, sweep_every: int = 10000):
+        self._buckets: Dict[str, List[float]] = {}
+        self._hits = 0
+        self._sweep_every = sweep_every
+        self._max_period = 0.0
+
+    async def hit(self, key: str, limit: RateLimit) -> float:
+        return self.take(key, limit)
+
+    def take(self, key: str, limit: RateLimit) -> float:
+        """
+        Spends a token.
+
+        Returns:
+            0.0 if the request is allowed, else seconds until a token is free
+        """
+        now = time.monotonic()
+        self._hits += 1
+        if self._hits % self._sweep_every == 0:
+            self._sweep(now)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if limit.period > self._max_period:
+                self._max_period = limit.period
+            self._buckets[key] = [limit.capacity - 1.0, now]
+            return 0.0
+
+        tokens = bucket[0] + (now - bucket[1]) * limit.rate
+        if tokens > limit.capacity:
+            tokens = limit.capacity
+        bucket[1] = now
+        if tokens >= 1.0:
+            bucket[0] = tokens - 1.0
+            return 0.0
+        bucket[0] = tokens
+        return (1.0 - tokens) / limit.rate
+
+    def _sweep(self, now: float):
+        cutoff = now - self._max_period
+        idle = [key for key, bucket in self._buckets.items() if bucket[1] < cutoff]
+        for key in idle:
+            del self._buckets[key]
+
+    def size(self) -> int:
+        return len(self._buckets)
+
+
+class MongoBuckets:
+    """
+    Token buckets shared across workers in the `rate_limits` collection.
+
+    Refill and spend happen in one atomic pipeline update, so concurrent
+    workers can't double-spend a token. Timestamps come from each worker's
+    clock, so hosts should be NTP-synced. Idle buckets expire through a
+    TTL index.
+    """
+
+    def __init__(self, collection: str = "rate_limits", idle_ttl_seconds: int = 24 * 3600):
+        self.collection = collection
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._indexed = False
+
+    async def hit(self, key: str, limit: RateLimit) -> float:
+        db = await get_database()
+        buckets = db[self.collection]
+        if not self._indexed:
+            await buckets.create_index("updated_at", expireAfterSeconds=self.idle_ttl_seconds)
+            self._indexed = True
+
+        now = datetime.utcnow()
+        elapsed_seconds = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}
+        refilled = {"$min": [
+            limit.capacity,
+            {"$add": [{"$ifNull": ["$tokens", limit.capacity]}, {"$multiply": [elapsed_seconds, limit.rate]}]},
+        ]}
+        bucket = await buckets.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated_at": now}},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]}}},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if bucket["allowed"]:
+            return 0.0
+        return (1.0 - bucket["tokens"]) / limit.rate
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+class RateLimiter:
+    """
+    Applies the per-route limits in RATE_LIMITS.
+
+    Args:
+        limits: Route name to RateLimit; routes not listed are unlimited
+        backend: MemoryBuckets or MongoBuckets
+    """
+
+    def __init__(self, limits: Dict[str, RateLimit], backend):
+        self.limits = limits
+        self.backend = backend
+        self.allowed = 0
+        self.limited = 0
+        self.errors = 0
+
+    async def check(self, route: str, subject: str) -> Tuple[bool, float]:
+        """
+        Returns:
+            tuple: (allowed, seconds to wait before retrying)
+        """
+        limit = self.limits.get(route)
+        if limit is None:
+            return True, 0.0
+
+        try:
+            retry_after = await self.backend.hit(f"{route}:{subject}", limit)
+        except Exception as e:
+            # A broken shared store must not take the API down with it
+            self.errors += 1
+            logger.error(f"Rate limit check failed, allowing request: {str(e)}")
+            return True, 0.0
+
+        if retry_after:
+            self.limited += 1
+            return False, retry_after
+        self.allowed += 1
+        return True, 0.0
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "backend": type(self.backend).__name__,
+            "limits": {route: repr(limit) for route, limit in self.limits.items()},
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "errors": self.errors,
+            "buckets": self.backend.size(),
+        }
+
+
+def create_rate_limiter() -> RateLimiter:
+    limits = {route: RateLimit.parse(spec) for route, spec in settings.RATE_LIMITS.items()}
+    backend = MongoBuckets() if settings.RATE_LIMIT_BACKEND == "mongo" else MemoryBuckets()
+    return RateLimiter(limits, backend)
+
+
+rate_limiter = create_rate_limiter()
+
+
+def rate_limit(route: str):
+    """
+    Dependency enforcing the `route` bucket for the authenticated user.
+
+    Usage:
+        @router.post("/upload", dependencies=[Depends(rate_limit("upload"))])
+    """
+    async def dependency(token_data: TokenData = Depends(get_current_user)):
+        allowed, retry_after = await rate_limiter.check(route, token_data.email)
+        if not allowed:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests, please slow down",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
+
+    return dependency
@@ -0,0 +1,91 @@
+"""
+Analytics Aggregation Benchmark
+
+Seeds a throwaway user with growing receipt histories and times the
+analytics pipelines at each size. It also reports how many documents
+MongoDB fetched per query; 0 means the covering index answered it.
+
+Needs a reachable MongoDB; point it at a scratch database:
+
+    MONGO_URI=mongodb://localhost:27017 MONGO_DB_NAME=bills_bench python -m benchmarks.bench_analytics
+
+Usage (from backend/):
+    python -m benchmarks.bench_analytics --sizes 100,1000,10000 --repeat 20
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from app.services import analytics_service
+from app.utils.db import get_database
+
+CATEGORIES = ["groceries", "dining", "travel", "utilities", "shopping", None]
+
+
+def fake_receipt(user_id: str, rng: random.Random) -> dict:
+    # Includes the bulky fields the old find()-based code dragged into Python
+    items = [{"name": f"item {i}", "quantity": 1, "price": round(rng.uniform(1, 50), 2)} for i in range(rng.randint(3, 15))]
+    return {
+        "user_id": user_id,
+        "store_name": "Benchmark Mart",
+        "total": round(sum(item["price"] for item in items), 2),
+        "category": rng.choice(CATEGORIES),
+        "items": items,
+        "raw_ocr_text": "x" * 2000,
+        "created_at": datetime.utcnow() - timedelta(days=rng.uniform(0, 730)),
+    }
+
+
+async def time_call(fn, *args, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await fn(*args)
+    return (time.perf_counter() - started) / repeat
+
+
+async def docs_examined(user_id: str) -> int:
+    db = await get_database()
+    pipeline = analytics_service._totals_pipeline({"user_id": user_id}, "$category", {"total": -1})
+    plan = await db.command("explain", {"aggregate": "receipts", "pipeline": pipeline, "cursor": {}}, verbosity="executionStats")
+    stats = plan.get("executionStats") or plan.get("stages", [{}])[0].get("$cursor", {}).get("executionStats", {})
+    return stats.get("totalDocsExamined", -1)
+
+
+async def run(sizes, repeat: int):
+    db = await get_database()
+    user_id = f"bench-{uuid.uuid4().hex[:8]}"
+    rng = random.Random(0)
+    seeded = 0
+    try:
+        print(f"{'receipts':>9} {'monthly':>10} {'category':>10} {'by_category':>12} {'docs fetched':>13}")
+        for size in sizes:
+            batch = [fake_receipt(user_id, rng) for _ in range(size - seeded)]
+            if batch:
+                await db.receipts.insert_many(batch)
+            seeded = size
+
+            monthly = await time_call(analytics_service.get_monthly_analytics, user_id, repeat=repeat)
+            category = await time_call(analytics_service.get_category_analytics, user_id, repeat=repeat)
+            by_category = await time_call(analytics_service.get_spending_by_category, user_id, repeat=repeat)
+            examined = await docs_examined(user_id)
+            print(f"{size:>9} {monthly * 1000:>8.1f}ms {category * 1000:>8.1f}ms {by_category * 1000:>10.1f}ms {examined:>13}")
+    finally:
+        await db.receipts.delete_many({"user_id": user_id})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,1000,10000", help="Comma-separated history sizes, ascending")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    asyncio.run(run(sizes, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
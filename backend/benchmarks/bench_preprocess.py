@@ -0,0 +1,94 @@
+"""
+Preprocessing Benchmark
+
+Compares latency and peak memory of the preprocessing pipelines on
+synthetic receipt photos. Each pipeline runs in a fresh child process so
+its peak RSS is not polluted by earlier runs.
+
+Usage (from backend/):
+    python -m benchmarks.bench_preprocess
+    python -m benchmarks.bench_preprocess --sizes 3000x4000 --pipelines quality lowmem --runs 5
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time
+
+import cv2
+import numpy as np
+
+from app.utils.preprocess import get_pipeline, rotate
+
+
+def synthetic_receipt(width: int, height: int, angle: float = 4.0, seed: int = 0) -> bytes:
+    """Render a noisy, slightly rotated receipt photo as JPEG bytes."""
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 235, np.uint8)
+    scale = width / 800
+    line_height = int(40 * scale)
+    for i, y in enumerate(range(line_height * 2, height - line_height, line_height)):
+        text = f"ITEM {i:03d} ........ {rng.integers(1, 999)}.{rng.integers(0, 99):02d}"
+        cv2.putText(image, text, (int(60 * scale), y), cv2.FONT_HERSHEY_SIMPLEX, scale, (30, 30, 30), max(1, int(2 * scale)))
+    noise = rng.normal(0, 12, image.shape)
+    image = np.clip(image + noise, 0, 255).astype(np.uint8)
+    image = rotate(image, angle)
+    _, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 92])
+    return encoded.tobytes()
+
+
+def _max_rss_mb() -> float:
+    # VmHWM starts fresh in the child, while ru_maxrss can carry the parent's
+    # peak across fork/exec; both are KiB on Linux
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run(pipeline_name: str, image_bytes: bytes, runs: int, queue):
+    pipeline = get_pipeline(pipeline_name)
+    baseline = _max_rss_mb()
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        pipeline.process(image_bytes)
+        latencies.append(time.perf_counter() - started)
+    queue.put({
+        "latency_ms": sorted(latencies)[len(latencies) // 2] * 1000,
+        "peak_rss_delta_mb": _max_rss_mb() - baseline,
+        "stats": pipeline.stats()["avg_stage_ms"],
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["1200x1600", "3000x4000"], help="WIDTHxHEIGHT of synthetic photos")
+    parser.add_argument("--pipelines", nargs="+", default=["quality", "lowmem", "fast"])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split("x"))
+        image_bytes = synthetic_receipt(width, height)
+        print(f"\n{size} ({width * height / 1e6:.1f} MP, {len(image_bytes) / 1024:.0f} KiB JPEG)")
+        print(f"{'pipeline':<10} {'median ms':>10} {'peak RSS +MB':>13}  slowest stage")
+
+        for name in args.pipelines:
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_run, args=(name, image_bytes, args.runs, queue))
+            proc.start()
+            result = queue.get()
+            proc.join()
+
+            stage, stage_ms = max(result["stats"].items(), key=lambda item: item[1])
+            print(f"{name:<10} {result['latency_ms']:>10.1f} {result['peak_rss_delta_mb']:>13.1f}  {stage} ({stage_ms:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Rate Limiter Overhead Benchmark
+
+Measures the per-request cost of the in-memory token-bucket check, both
+the raw bucket update and the full async `RateLimiter.check` path, across
+a configurable number of distinct users.
+
+Usage (from backend/):
+    python -m benchmarks.bench_rate_limit
+    python -m benchmarks.bench_rate_limit --users 100000 --checks 1000000
+"""
+
+import argparse
+import asyncio
+import time
+
+from app.utils.rate_limit import MemoryBuckets, RateLimit, RateLimiter
+
+
+def bench_take(users: int, checks: int, limit: RateLimit) -> float:
+    buckets = MemoryBuckets()
+    keys = [f"upload:user{i}@example.com" for i in range(users)]
+    started = time.perf_counter()
+    for i in range(checks):
+        buckets.take(keys[i % users], limit)
+    return (time.perf_counter() - started) / checks
+
+
+async def bench_check(users: int, checks: int, limit: RateLimit) -> float:
+    limiter = RateLimiter({"upload": limit}, MemoryBuckets())
+    subjects = [f"user{i}@example.com" for i in range(users)]
+    started = time.perf_counter()
+    for i in range(checks):
+        await limiter.check("upload", subjects[i % users])
+    return (time.perf_counter() - started) / checks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--checks", type=int, default=500000)
+    parser.add_argument("--limit", default="30/60", help="Bucket as capacity/seconds")
+    args = parser.parse_args()
+
+    limit = RateLimit.parse(args.limit)
+    take = bench_take(args.users, args.checks, limit)
+    check = asyncio.run(bench_check(args.users, args.checks, limit))
+    print(f"{args.checks} checks over {args.users} users, limit {limit}")
+    print(f"bucket update:        {take * 1e6:.2f} us/check")
+    print(f"RateLimiter.check:    {check * 1e6:.2f} us/check")
+
+
+if __name__ == "__main__":
+    main()
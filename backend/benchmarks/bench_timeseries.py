@@ -0,0 +1,68 @@
+"""
+Time-Series Compute Benchmark
+
+Builds a synthetic spending snapshot and times each `/analytics/timeseries`
+view computed over it. No database is needed; this measures only the
+vectorized NumPy work done per request once a snapshot is in memory.
+
+Usage (from backend/):
+    python -m benchmarks.bench_timeseries
+    python -m benchmarks.bench_timeseries --receipts 50000 --years 5
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from app.services.timeseries import SpendingSnapshot, grouped_totals, rolling_totals, year_over_year
+
+CATEGORIES = ["grocery", "restaurant", "petrol", "pharmacy", "general", None]
+
+
+def synthetic_snapshot(receipts: int, years: int) -> SpendingSnapshot:
+    rng = random.Random(0)
+    today = datetime(2024, 12, 31)
+    rows = [
+        {
+            "purchase_date": today - timedelta(days=rng.randrange(365 * years)),
+            "total_minor": rng.randint(1000, 500000),
+            "category": rng.choice(CATEGORIES),
+        }
+        for _ in range(receipts)
+    ]
+    started = time.perf_counter()
+    snapshot = SpendingSnapshot.from_receipts(1, rows)
+    print(f"snapshot of {receipts} receipts built in {(time.perf_counter() - started) * 1000:.1f}ms, {snapshot.nbytes() / 1024:.0f} KiB")
+    return snapshot
+
+
+def time_view(label: str, fn, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        points = fn()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"{label:<22} {elapsed * 1000:>8.3f}ms  ({len(points)} points)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--receipts", type=int, default=5000)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    snapshot = synthetic_snapshot(args.receipts, args.years)
+    days, amounts = snapshot.select(None, None, None)
+    last = int(days[-1])
+
+    time_view("day", lambda: grouped_totals(days, amounts, "day"), args.repeat)
+    time_view("week", lambda: grouped_totals(days, amounts, "week"), args.repeat)
+    time_view("month", lambda: grouped_totals(days, amounts, "month"), args.repeat)
+    time_view("rolling 30d (1 year)", lambda: rolling_totals(days, amounts, last - 364, last, 30), args.repeat)
+    time_view("yoy", lambda: year_over_year(days, amounts, None, None), args.repeat)
+    time_view("month, one category", lambda: grouped_totals(*snapshot.select(None, None, "grocery"), "month"), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
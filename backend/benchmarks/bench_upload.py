@@ -0,0 +1,108 @@
+"""
+Upload Throughput Benchmark
+
+Drives `POST /receipts/upload_receipt?wait=true` on a running server with
+a fixed number of concurrent clients and reports throughput and latency
+percentiles. Start the server with the stub backend to benchmark offline:
+
+    EXTRACTION_BACKEND=stub STUB_LATENCY_MS=1500 STUB_FAILURE_RATE=0.02 uvicorn app.main:app
+
+Usage (from backend/):
+    python -m benchmarks.bench_upload
+    python -m benchmarks.bench_upload --url http://localhost:8000 --requests 500 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+from benchmarks.bench_preprocess import synthetic_receipt
+
+
+async def get_token(client: httpx.AsyncClient, email: str, password: str) -> str:
+    """Register (if needed) and log in a benchmark user."""
+    await client.post("/auth/register", json={"email": email, "password": password})
+    response = await client.post("/auth/login", json={"email": email, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run(url: str, total: int, concurrency: int, images: int, size: str, email: str, password: str):
+    width, height = (int(v) for v in size.split("x"))
+    # Distinct images so neither the extraction cache nor duplicate detection short-circuits
+    payloads = [synthetic_receipt(width, height, seed=seed) for seed in range(images)]
+
+    async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+        token = await get_token(client, email, password)
+        headers = {"Authorization": f"Bearer {token}"}
+        latencies = []
+        statuses = Counter()
+        sources = Counter()
+        queue: asyncio.Queue = asyncio.Queue()
+        for i in range(total):
+            queue.put_nowait(i)
+
+        async def worker():
+            while True:
+                try:
+                    i = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                started = time.perf_counter()
+                try:
+                    response = await client.post(
+                        "/receipts/upload_receipt",
+                        params={"wait": "true", "allow_duplicate": "true"},
+                        files={"file": (f"bench-{i}.jpg", payloads[i % len(payloads)], "image/jpeg")},
+                        headers=headers,
+                    )
+                    statuses[response.status_code] += 1
+                    if response.status_code == 200:
+                        sources[response.json().get("source")] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+
+        metrics = (await client.get("/metrics/extraction", headers=headers)).json()
+
+    latencies.sort()
+    print(f"{total} uploads, {concurrency} concurrent, {elapsed:.1f}s: {total / elapsed:.2f} req/s")
+    print("latency ms: " + "  ".join(
+        f"p{p}={percentile(latencies, p) * 1000:.0f}" for p in (50, 90, 95, 99)
+    ) + f"  max={latencies[-1] * 1000:.0f}")
+    print(f"status: {dict(statuses)}")
+    print(f"source: {dict(sources)}")
+    print(f"backend: {metrics.get('backend')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--images", type=int, default=50, help="Distinct synthetic images to cycle through")
+    parser.add_argument("--size", default="800x1200", help="Synthetic image size, WIDTHxHEIGHT")
+    parser.add_argument("--email", default=f"bench-{uuid.uuid4().hex[:8]}@example.com")
+    parser.add_argument("--password", default="benchmark")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.url, args.requests, args.concurrency, args.images, args.size, args.email, args.password))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Import-Time Budget Report
+
+Imports a module in a fresh interpreter with `-X importtime` and reports
+the total cold-import time plus the slowest modules. Exits non-zero when
+the total exceeds the budget, so it can gate CI or a container build.
+
+Usage (from backend/):
+    python -m benchmarks.import_budget
+    python -m benchmarks.import_budget --module app.main --budget-ms 1500 --top 15
+"""
+
+import argparse
+import subprocess
+import sys
+from collections import defaultdict
+
+
+def measure(module: str):
+    """Return (total_us, {top-level package: self_us}, [(self_us, cumulative_us, module)])."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"Importing {module} failed:\n{proc.stderr}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name))
+
+    by_package = defaultdict(int)
+    for self_us, _, name in rows:
+        by_package[name.strip().split(".")[0]] += self_us
+
+    total = sum(self_us for self_us, _, _ in rows)
+    return total, by_package, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--budget-ms", type=float, default=2000.0)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    total, by_package, rows = measure(args.module)
+
+    print(f"Cold import of {args.module}: {total / 1000:.1f} ms (budget {args.budget_ms:.0f} ms)\n")
+    print(f"{'package':<30} {'ms':>8}")
+    for package, us in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{package:<30} {us / 1000:>8.1f}")
+
+    print(f"\n{'slowest modules (self)':<50} {'ms':>8}")
+    for self_us, _, name in sorted(rows, reverse=True)[:args.top]:
+        print(f"{name.strip():<50} {self_us / 1000:>8.1f}")
+
+    if total / 1000 > args.budget_ms:
+        print(f"\nOver budget by {total / 1000 - args.budget_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Normalize Stored Receipts
+
+Backfills the write-time normalization onto receipts saved before it
+existed: amounts get numeric values and `*_minor` copies, and `date` gets
+a parsed `purchase_date`, and `store_name` gets a canonical
+`merchant_key`. Receipts are walked in `_id` order in batches,
+and the last processed `_id` is checkpointed in the `migrations`
+collection, so an interrupted run resumes where it stopped. Re-running
+over normalized receipts changes nothing.
+
+When the walk completes, spending rollups and the merchant index are
+rebuilt from the normalized receipts and every user's data version is bumped so cached
+analytics responses are recomputed.
+
+Usage (from backend/):
+    python -m scripts.normalize_receipts
+    python -m scripts.normalize_receipts --batch-size 1000 --restart
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from app.services.analytics_service import rebuild_rollups
+from app.services.merchant_index import rebuild_merchant_index
+from app.services.receipt_normalizer import AMOUNT_FIELDS, DERIVED_FIELDS, normalize_receipt_fields
+from app.utils.db import close_mongo_connection, get_database
+
+MIGRATION_ID = "normalize_receipts"
+FIELDS = AMOUNT_FIELDS + ("items", "date", "store_name")
+# Derived fields are read too, so an already normalized receipt compares equal
+PROJECTION = {field: 1 for field in FIELDS + DERIVED_FIELDS}
+
+
+async def run(batch_size: int, restart: bool):
+    try:
+        await migrate(batch_size, restart)
+    finally:
+        await close_mongo_connection()
+
+
+async def migrate(batch_size: int, restart: bool):
+    db = await get_database()
+    receipts_collection = db.receipts
+
+    if restart:
+        await db.migrations.delete_one({"_id": MIGRATION_ID})
+    checkpoint = await db.migrations.find_one({"_id": MIGRATION_ID}) or {}
+    if checkpoint.get("completed_at"):
+        print(f"Already completed at {checkpoint['completed_at']}; pass --restart to run again")
+        return
+
+    last_id = checkpoint.get("last_id")
+    scanned = checkpoint.get("scanned", 0)
+    updated = checkpoint.get("updated", 0)
+    if last_id is not None:
+        print(f"Resuming after {last_id} ({scanned} scanned, {updated} updated)")
+
+    started = time.perf_counter()
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        cursor = receipts_collection.find(query, PROJECTION).sort("_id", 1).limit(batch_size)
+        batch = await cursor.to_list(length=batch_size)
+        if not batch:
+            break
+
+        updates = []
+        for receipt in batch:
+            present = {field: receipt[field] for field in FIELDS if field in receipt}
+            normalized = normalize_receipt_fields(present)
+            changes = {field: value for field, value in normalized.items() if receipt.get(field, ...) != value}
+            if changes:
+                updates.append(UpdateOne({"_id": receipt["_id"]}, {"$set": changes}))
+        if updates:
+            await receipts_collection.bulk_write(updates, ordered=False)
+
+        last_id = batch[-1]["_id"]
+        scanned += len(batch)
+        updated += len(updates)
+        await db.migrations.update_one(
+            {"_id": MIGRATION_ID},
+            {"$set": {"last_id": last_id, "scanned": scanned, "updated": updated}},
+            upsert=True
+        )
+        print(f"{scanned} scanned, {updated} updated ({scanned / (time.perf_counter() - started):.0f} receipts/s)")
+
+    user_ids = await receipts_collection.distinct("user_id")
+    for user_id in user_ids:
+        await rebuild_rollups(user_id)
+        await rebuild_merchant_index(user_id)
+    await db.users.update_many({}, {"$inc": {"data_version": 1}})
+
+    await db.migrations.update_one(
+        {"_id": MIGRATION_ID}, {"$set": {"completed_at": datetime.utcnow()}}
+    )
+    print(f"Done: {scanned} scanned, {updated} updated, rollups and merchant index rebuilt for {len(user_ids)} users")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the first receipt")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.batch_size, args.restart))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Rebuild Spending Rollups
+
+Regenerates the per user x month x category rollups and the merchant and
+item index behind the analytics endpoints from the raw receipts. Run it after restoring or bulk-editing
+receipts outside the API, or if rollups ever drift from the receipts.
+
+Usage (from backend/):
+    python -m scripts.rebuild_rollups
+    python -m scripts.rebuild_rollups --user 65f0c0ffee0000000000abcd
+"""
+
+import argparse
+import asyncio
+import time
+
+from app.services.analytics_service import rebuild_rollups
+from app.services.merchant_index import rebuild_merchant_index
+from app.utils.db import close_mongo_connection, get_database
+
+
+async def run(user_ids):
+    db = await get_database()
+    if not user_ids:
+        user_ids = await db.receipts.distinct("user_id")
+
+    started = time.perf_counter()
+    written = 0
+    for user_id in user_ids:
+        count = await rebuild_rollups(user_id)
+        indexed = await rebuild_merchant_index(user_id)
+        written += count
+        print(f"{user_id}: {count} rollups, {indexed} receipts indexed")
+
+    print(f"Rebuilt {written} rollups for {len(user_ids)} users in {time.perf_counter() - started:.1f}s")
+    await close_mongo_connection()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", action="append", dest="users", help="Only rebuild this user ID (repeatable)")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.users or []))
+
+
+if __name__ == "__main__":
+    main()
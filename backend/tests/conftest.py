@@ -0,0 +1,103 @@
+"""
+Test fixtures.
+
+Tests run against an in-memory MongoDB (mongomock-motor) and the offline
+stub extraction backend, so they need no services. Run from backend/:
+
+    pip install -r requirements-dev.txt
+    python -m pytest
+
+Tests marked `mongodb` need features mongomock lacks (text search) and
+run only when TEST_MONGO_URI points at a real server; they use a scratch
+database that is dropped afterwards.
+"""
+
+import os
+import uuid
+
+# Settings are read at import time, so these must be set before the app loads
+os.environ.update(
+    EXTRACTION_BACKEND="stub",
+    STUB_LATENCY_MS="1",
+    STORE_RECEIPT_IMAGES="false",
+    RATE_LIMITS="",
+    MODEL_WARMUP="",
+    PROCESS_POOL_WARMUP="false",
+)
+
+import httpx
+import mongomock.collection
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReplaceOne
+from mongomock_motor import AsyncMongoMockClient
+
+from app.utils import db as db_module
+from app.utils.config import settings
+
+
+def _bulk_write(self, requests, ordered=True, **kwargs):
+    # mongomock's bulk_write doesn't accept current pymongo request objects
+    for request in requests:
+        if isinstance(request, ReplaceOne):
+            self.replace_one(request._filter, request._doc, upsert=request._upsert)
+        else:
+            self.update_one(request._filter, request._doc, upsert=request._upsert)
+
+
+mongomock.collection.Collection.bulk_write = _bulk_write
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "mongodb: needs a real MongoDB at TEST_MONGO_URI")
+
+
+@pytest.fixture
+async def mongo(request, monkeypatch):
+    """A fresh database for each test: in-memory, or scratch on TEST_MONGO_URI for `mongodb` tests."""
+    if request.node.get_closest_marker("mongodb") is None:
+        db_module.db.client = AsyncMongoMockClient()
+        yield db_module.db.client
+        db_module.db.client = None
+        return
+
+    uri = os.getenv("TEST_MONGO_URI")
+    if not uri:
+        pytest.skip("TEST_MONGO_URI is not set")
+    monkeypatch.setattr(settings, "MONGO_DB_NAME", f"bills_test_{uuid.uuid4().hex[:8]}")
+    db_module.db.client = AsyncIOMotorClient(uri)
+    try:
+        yield db_module.db.client
+    finally:
+        await db_module.db.client.drop_database(settings.MONGO_DB_NAME)
+        db_module.db.client.close()
+        db_module.db.client = None
+
+
+@pytest.fixture
+async def client(mongo):
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        yield client
+
+
+@pytest.fixture
+async def auth_headers(client):
+    await client.post("/auth/register", json={"email": "test@example.com", "password": "pw123456"})
+    response = await client.post("/auth/login", json={"email": "test@example.com", "password": "pw123456"})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+async def user(auth_headers):
+    from app.services.auth_service import get_user_by_email
+
+    return await get_user_by_email("test@example.com")
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from app.services.receipts_service import save_receipt
+from app.services.timeseries import DateRangeTooLong, rolling_totals, to_day
+from app.utils.config import settings
+
+pytestmark = pytest.mark.anyio
+
+
+def test_rolling_totals():
+    days = np.array([to_day("2024-03-01"), to_day("2024-03-03")])
+    amounts = np.array([1000.0, 250.0])
+    result = rolling_totals(days, amounts, to_day("2024-03-02"), to_day("2024-03-04"), window=2)
+    assert result == [
+        {"period": "2024-03-02", "total": 10.0},
+        {"period": "2024-03-03", "total": 2.5},
+        {"period": "2024-03-04", "total": 2.5},
+    ]
+
+
+def test_rolling_totals_rejects_long_spans():
+    days, amounts = np.array([], dtype=np.int64), np.array([])
+    start = to_day("2000-01-01")
+    assert len(rolling_totals(days, amounts, start, start + settings.ANALYTICS_MAX_SPAN_DAYS - 1, window=30)) == settings.ANALYTICS_MAX_SPAN_DAYS
+    with pytest.raises(DateRangeTooLong):
+        rolling_totals(days, amounts, start, start + settings.ANALYTICS_MAX_SPAN_DAYS, window=30)
+
+
+@pytest.mark.parametrize("path", [
+    "/analytics/timeseries?granularity=rolling",
+    "/analytics/timeseries?granularity=day",
+    "/analytics/items",
+    "/analytics/spending_by_category",
+])
+async def test_long_or_malformed_ranges_are_rejected(client, auth_headers, path):
+    separator = "&" if "?" in path else "?"
+    too_long = await client.get(f"{path}{separator}start_date=2000-01-01&end_date=2024-12-31", headers=auth_headers)
+    assert too_long.status_code == 400
+    assert "longer than" in too_long.json()["detail"]
+
+    malformed = await client.get(f"{path}{separator}start_date=2024-13-01", headers=auth_headers)
+    assert malformed.status_code == 400
+
+    within = await client.get(f"{path}{separator}start_date=2020-01-01&end_date=2024-12-31", headers=auth_headers)
+    assert within.status_code == 200
+
+
+async def test_rolling_without_start_covers_the_most_recent_days(client, auth_headers, user):
+    for date, total in (("2010-06-01", 100.0), ("2024-06-01", 40.0)):
+        await save_receipt({"store_name": "Fresh Mart", "date": date, "total": total}, "", 90.0, str(user.id))
+
+    response = await client.get("/analytics/timeseries?granularity=rolling&window=7", headers=auth_headers)
+    assert response.status_code == 200
+    series = response.json()["data"]
+    assert len(series) == settings.ANALYTICS_MAX_SPAN_DAYS
+    assert series[-1]["period"] == "2024-06-01"
+    assert series[-1]["total"] == 40.0
+
+    # An explicit start that is too early for the data is refused rather than clamped
+    explicit = await client.get("/analytics/timeseries?granularity=rolling&start_date=2010-01-01", headers=auth_headers)
+    assert explicit.status_code == 400
@@ -0,0 +1,135 @@
+import asyncio
+
+import cv2
+import numpy as np
+import pytest
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from app.services import extraction_service
+from app.services.extraction_service import process_receipt_batch
+from app.services.receipts_service import build_receipt_doc, inserted_receipt_ids, save_receipts
+from app.utils.db import get_database
+
+pytestmark = pytest.mark.anyio
+
+
+def _photos(count: int):
+    """Distinct synthetic images, so none is taken for a duplicate of another."""
+    files = []
+    for i in range(count):
+        rng = np.random.default_rng(i)
+        image = rng.integers(0, 256, (64, 72), dtype=np.uint8)
+        ok, encoded = cv2.imencode(".png", image)
+        assert ok
+        files.append((f"receipt-{i}.png", encoded.tobytes()))
+    return files
+
+
+@pytest.fixture
+def stored_images(monkeypatch):
+    """Fakes GridFS: records stored and deleted image ids."""
+    images = {"stored": [], "deleted": []}
+
+    async def store_image(image_bytes, user_id, filename):
+        image_id = f"image-{filename}"
+        images["stored"].append(image_id)
+        return image_id
+
+    async def delete_images(image_id):
+        images["deleted"].append(image_id)
+
+    monkeypatch.setattr(extraction_service, "_store_image", store_image)
+    monkeypatch.setattr(extraction_service.image_store, "delete_images", delete_images)
+    return images
+
+
+async def _collect(files, user_id, **kwargs):
+    return [event async for event in process_receipt_batch(files, user_id, **kwargs)]
+
+
+async def test_pending_then_saved(mongo, user, stored_images):
+    events = await _collect(_photos(4), str(user.id))
+
+    pending = [event for event in events if event.get("status") == "pending"]
+    saved = [event for event in events if event.get("status") == "saved"]
+    assert len(pending) == len(saved) == 4
+    # Every receipt is reported pending before any is reported saved
+    assert events.index(saved[0]) > events.index(pending[-1])
+    assert {event["receipt_id"] for event in pending} == {event["receipt_id"] for event in saved}
+    assert events[-1]["summary"]["saved"] == 4
+
+    db = await get_database()
+    assert await db.receipts.count_documents({"user_id": str(user.id)}) == 4
+    assert stored_images["deleted"] == []
+
+
+async def test_failed_save_deletes_images(mongo, user, stored_images, monkeypatch):
+    async def fail(receipt_docs):
+        raise RuntimeError("insert failed")
+
+    monkeypatch.setattr(extraction_service, "save_receipts", fail)
+    events = await _collect(_photos(3), str(user.id))
+
+    failed = [event for event in events if event.get("status") == "failed"]
+    assert len(failed) == 3
+    assert all(event["error"] == "insert failed" for event in failed)
+    assert events[-1]["summary"]["saved"] == 0
+    assert sorted(stored_images["deleted"]) == sorted(stored_images["stored"])
+
+
+async def test_disconnect_still_saves_pending_receipts(mongo, user, stored_images):
+    batch = process_receipt_batch(_photos(3), str(user.id), concurrency=1)
+    first = await batch.__anext__()
+    assert first["status"] == "pending"
+
+    # The client goes away before the batch finishes
+    await batch.aclose()
+    await asyncio.gather(*extraction_service._pending_saves)
+
+    db = await get_database()
+    receipts = await db.receipts.find({"user_id": str(user.id)}).to_list(length=None)
+    assert [str(receipt["_id"]) for receipt in receipts] == [first["receipt_id"]]
+
+
+def _receipt_docs(user_id: str):
+    docs = []
+    for i, store in enumerate(["Fresh Mart", "Gadget Hub", "City Fuel Station"]):
+        doc = build_receipt_doc(
+            {"store_name": store, "date": "2024-03-05", "total": 100.0 * (i + 1), "category": "grocery",
+             "items": [{"name": f"Item {i}", "quantity": 1, "price": 100.0 * (i + 1)}]},
+            "", 90.0, user_id
+        )
+        doc.update(_id=ObjectId(), image_id=f"image-{i}")
+        docs.append(doc)
+    return docs
+
+
+async def test_partial_insert_still_updates_rollups_index_and_version(mongo, user):
+    user_id = str(user.id)
+    docs = _receipt_docs(user_id)
+    db = await get_database()
+    # The middle receipt collides with one already stored
+    await db.receipts.insert_one({"_id": docs[1]["_id"], "user_id": user_id})
+
+    with pytest.raises(BulkWriteError) as raised:
+        await save_receipts(docs)
+    saved = inserted_receipt_ids(docs, raised.value)
+    assert saved == [str(docs[0]["_id"]), str(docs[2]["_id"])]
+
+    rollup = await db.spending_rollups.find_one({"user_id": user_id})
+    assert (rollup["total"], rollup["count"]) == (40000, 2)
+    items = await db.receipt_items.find({"user_id": user_id}).to_list(length=None)
+    assert sorted(item["item_key"] for item in items) == ["item 0", "item 2"]
+    assert (await db.users.find_one({"_id": ObjectId(user_id)}))["data_version"] == user.data_version + 1
+
+
+async def test_partial_batch_save_deletes_only_unsaved_images(mongo, user, stored_images):
+    docs = _receipt_docs(str(user.id))
+    db = await get_database()
+    await db.receipts.insert_one({"_id": docs[1]["_id"], "user_id": str(user.id)})
+
+    saved_ids, save_error = await extraction_service._persist_batch(docs, [])
+    assert saved_ids == {str(docs[0]["_id"]), str(docs[2]["_id"])}
+    assert save_error
+    assert stored_images["deleted"] == ["image-1"]
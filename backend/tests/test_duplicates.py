@@ -0,0 +1,98 @@
+import os
+import subprocess
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+from app.services import duplicate_service
+from app.services.duplicate_service import BANDS, MAX_GUARANTEED_DISTANCE, hamming_distance, hash_bands, same_content
+from app.services.extraction_service import process_receipt_upload
+from app.utils.config import settings
+from app.utils.db import get_database
+
+pytestmark = pytest.mark.anyio
+
+
+def _photo(noise: int = 0) -> bytes:
+    """A synthetic receipt-like gradient; `noise` changes the bytes but not the hash."""
+    image = np.tile(np.linspace(40, 220, 640, dtype=np.uint8), (800, 1))
+    image[100:110, 50:590] = 0
+    image[0, 0] = noise
+    ok, encoded = cv2.imencode(".png", image)
+    assert ok
+    return encoded.tobytes()
+
+
+def _flip(image_hash: str, bits) -> str:
+    value = int(image_hash, 16)
+    for bit in bits:
+        value ^= 1 << bit
+    return f"{value:016x}"
+
+
+def test_bands_find_every_hash_within_guaranteed_distance():
+    base = "0123456789abcdef"
+    assert len(hash_bands(base)) == BANDS
+    # Worst case: one flipped bit in each of seven bands
+    near = _flip(base, [band * 8 for band in range(MAX_GUARANTEED_DISTANCE)])
+    assert hamming_distance(base, near) == MAX_GUARANTEED_DISTANCE
+    assert set(hash_bands(base)) & set(hash_bands(near))
+    # One more bit can leave no band in common
+    far = _flip(base, [band * 8 for band in range(BANDS)])
+    assert not set(hash_bands(base)) & set(hash_bands(far))
+
+
+def test_same_content_needs_store_total_and_date():
+    existing = {"store_name": "D-Mart", "total": 250.0, "date": "2024-03-05"}
+    assert same_content({"store_name": "DMART", "total": "250.00", "date": "05/03/2024"}, existing)
+    assert not same_content({"store_name": "D-Mart", "total": 251.0, "date": "2024-03-05"}, existing)
+    assert not same_content({"store_name": "D-Mart", "total": 250.0, "date": "2024-03-06"}, existing)
+    assert not same_content({"store_name": None, "total": None, "date": None}, {"store_name": None, "total": None, "date": None})
+
+
+async def test_matching_image_is_saved_and_flagged(mongo, user):
+    first = await process_receipt_upload(_photo(), str(user.id))
+    second = await process_receipt_upload(_photo(), str(user.id))
+
+    assert "possible_duplicate_of" not in first
+    assert second["status"] == "processed"
+    assert second["possible_duplicate_of"] == first["receipt_id"]
+
+    db = await get_database()
+    assert await db.receipts.count_documents({"user_id": str(user.id)}) == 2
+    saved = await db.receipts.find_one({"possible_duplicate_of": first["receipt_id"]})
+    assert str(saved["_id"]) == second["receipt_id"]
+
+
+async def test_skip_only_suppresses_confirmed_duplicates(mongo, user, monkeypatch):
+    monkeypatch.setattr(settings, "DUPLICATE_ACTION", "skip")
+    first = await process_receipt_upload(_photo(), str(user.id))
+
+    # Same image hash, but the stub extracts a different receipt from different bytes
+    other = await process_receipt_upload(_photo(noise=1), str(user.id))
+    assert other["status"] == "processed"
+    assert other["possible_duplicate_of"] == first["receipt_id"]
+
+    confirmed = duplicate_service.stats["confirmed"]
+    again = await process_receipt_upload(_photo(), str(user.id))
+    assert again["status"] == "duplicate"
+    assert again["duplicate_of"] in (first["receipt_id"], other["receipt_id"])
+    assert duplicate_service.stats["confirmed"] == confirmed + 1
+
+    db = await get_database()
+    assert await db.receipts.count_documents({"user_id": str(user.id)}) == 2
+
+
+@pytest.mark.parametrize("env", ["DUPLICATE_MAX_DISTANCE=8", "DUPLICATE_ACTION=drop"])
+def test_rejects_unsafe_config(env):
+    name, value = env.split("=")
+    result = subprocess.run(
+        [sys.executable, "-c", "import app.services.duplicate_service"],
+        env={**os.environ, name: value},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode != 0
+    assert "ValueError" in result.stderr
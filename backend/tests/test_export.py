@@ -0,0 +1,81 @@
+import csv
+import io
+import json
+
+import pyarrow.parquet as pq
+import pytest
+
+from app.services import receipts_service
+from app.services.receipt_export import COLUMNS
+from app.utils.config import settings
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def receipts(user, monkeypatch):
+    # Small batches, so the 12 receipts span several chunks and row groups
+    monkeypatch.setattr(settings, "EXPORT_BATCH_SIZE", 5)
+    for day in range(1, 13):
+        await receipts_service.save_receipt(
+            {
+                "store_name": "D-Mart",
+                "total": f"Rs 1,0{day:02d}.50",
+                "date": f"2024-03-{day:02d}",
+                "category": "groceries" if day % 2 else "dining",
+                "items": [{"name": 'Milk, "full cream"', "quantity": 2, "price": 12.5}],
+            },
+            "",
+            1.0,
+            user.id,
+        )
+
+
+async def _export(client, auth_headers, **params):
+    async with client.stream("GET", "/receipts/export", params=params, headers=auth_headers) as response:
+        assert response.status_code == 200, await response.aread()
+        body = b"".join([chunk async for chunk in response.aiter_raw()])
+    return response, body
+
+
+async def test_csv_export(client, auth_headers, receipts):
+    response, body = await _export(client, auth_headers, format="csv")
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.headers["content-disposition"].endswith('.csv"')
+
+    rows = list(csv.DictReader(io.StringIO(body.decode())))
+    assert list(rows[0]) == COLUMNS
+    assert len(rows) == 12
+    assert rows[0]["merchant"] == "DMart"
+    assert float(rows[0]["total"]) == 1001.5
+    assert json.loads(rows[0]["items"]) == [{"name": 'Milk, "full cream"', "quantity": 2.0, "price": 12.5}]
+
+
+async def test_ndjson_export_with_filters(client, auth_headers, receipts):
+    response, body = await _export(client, auth_headers, format="ndjson", start_date="2024-03-05", end_date="2024-03-10", category="dining")
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    rows = [json.loads(line) for line in body.decode().splitlines()]
+    assert [row["date"] for row in rows] == ["2024-03-06", "2024-03-08", "2024-03-10"]
+
+
+async def test_parquet_export(client, auth_headers, receipts):
+    response, body = await _export(client, auth_headers, format="parquet")
+    assert response.headers["content-type"] == "application/vnd.apache.parquet"
+
+    parquet = pq.ParquetFile(io.BytesIO(body))
+    assert parquet.metadata.num_rows == 12
+    assert parquet.num_row_groups == 3
+    row = parquet.read().slice(0, 1).to_pylist()[0]
+    assert row["date"] == "2024-03-01"
+    assert row["items"] == [{"name": 'Milk, "full cream"', "quantity": 2.0, "price": 12.5}]
+
+
+async def test_empty_parquet_export_is_readable(client, auth_headers, user):
+    _, body = await _export(client, auth_headers, format="parquet")
+    assert pq.read_table(io.BytesIO(body)).num_rows == 0
+
+
+async def test_export_rejects_bad_input(client, auth_headers, user):
+    assert (await client.get("/receipts/export", params={"format": "xml"}, headers=auth_headers)).status_code == 422
+    assert (await client.get("/receipts/export", params={"end_date": "2024-02-30"}, headers=auth_headers)).status_code == 400
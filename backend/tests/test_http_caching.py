@@ -0,0 +1,55 @@
+import pytest
+
+from app.utils.range_response import RangeNotSatisfiable, etag_matches, parse_range
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=900-", (900, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-2000", (990, 999)),
+    ("bytes=0-1,5-9", None),
+    ("items=0-9", None),
+    ("bytes=a-b", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=-0", "bytes=20-10"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 1000)
+
+
+@pytest.mark.parametrize("header, matches", [
+    (None, False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"xyz", W/"abc"', True),
+    ("*", True),
+    ('"xyz"', False),
+    ('"*"', False),
+])
+def test_etag_matches(header, matches):
+    assert etag_matches(header, '"abc"') is matches
+    # A weak current tag matches its strong form too
+    assert etag_matches(header, 'W/"abc"') is matches
+
+
+async def test_analytics_revalidation(client, auth_headers):
+    response = await client.get("/analytics/monthly", headers=auth_headers)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    for if_none_match in (etag, f"W/{etag}", f'"stale", W/{etag}', "*"):
+        revalidated = await client.get("/analytics/monthly", headers={**auth_headers, "If-None-Match": if_none_match})
+        assert revalidated.status_code == 304, if_none_match
+        assert revalidated.headers["etag"] == etag
+
+    changed = await client.get("/analytics/monthly", headers={**auth_headers, "If-None-Match": '"stale"'})
+    assert changed.status_code == 200
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from app.utils.json_stream import IncrementalJSONParser
+
+RECEIPT = {
+    "store_name": "Chai \"Point\", Koramangala {outlet}",
+    "date": "2024-03-05",
+    "total": 245.5,
+    "items": [
+        {"name": "Masala Chai", "quantity": 2, "price": 40},
+        {"name": "Bun [butter]", "quantity": 1, "price": None},
+        ["nested", {"deep": [1, 2]}],
+    ],
+    "tags": [],
+    "meta": {"currency": "INR", "paid": True},
+}
+
+
+def _feed(fragments, stream_arrays=("items",)):
+    parser = IncrementalJSONParser(stream_arrays)
+    events = []
+    for fragment in fragments:
+        events.extend(parser.feed(fragment))
+    return events
+
+
+def _expected():
+    events = []
+    for key, value in RECEIPT.items():
+        if key == "items":
+            events.extend({"field": key, "index": i, "element": element} for i, element in enumerate(value))
+        events.append({"field": key, "value": value})
+    return events
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 64, 10_000])
+def test_fragment_boundaries_do_not_change_events(size):
+    text = "```json\n" + json.dumps(RECEIPT, indent=2) + "\n```"
+    assert _feed(text[i:i + size] for i in range(0, len(text), size)) == _expected()
+
+
+def test_fields_are_reported_as_soon_as_they_close():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"store_name": "DMart", "to') == [{"field": "store_name", "value": "DMart"}]
+    assert parser.feed('tal": 99') == []
+    assert parser.feed(", ") == [{"field": "total", "value": 99}]
+    assert parser.feed('"items": [{"name": "Milk"}]}') == [{"field": "items", "value": [{"name": "Milk"}]}]
+
+
+def test_array_elements_stream_before_the_array_closes():
+    parser = IncrementalJSONParser(["items"])
+    assert parser.feed('{"items": [{"name": "Milk"}, ') == [{"field": "items", "index": 0, "element": {"name": "Milk"}}]
+    assert parser.feed('"Bread"') == []
+    assert parser.feed("]") == [
+        {"field": "items", "index": 1, "element": "Bread"},
+        {"field": "items", "value": [{"name": "Milk"}, "Bread"]},
+    ]
+
+
+def test_malformed_values_are_skipped():
+    assert _feed(['{"total": 12.3.4, "date": "2024-03-05"}']) == [{"field": "date", "value": "2024-03-05"}]
@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from app.utils.keyed_lock import KeyedLock
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_serializes_per_key_and_forgets_idle_keys():
+    locks = KeyedLock()
+    order = []
+
+    async def work(key, name):
+        async with locks.hold(key):
+            order.append(f"{name} start")
+            await asyncio.sleep(0.01)
+            order.append(f"{name} end")
+
+    first = asyncio.ensure_future(work("u1", "a"))
+    second = asyncio.ensure_future(work("u1", "b"))
+    other = asyncio.ensure_future(work("u2", "c"))
+    await asyncio.sleep(0.001)
+    assert len(locks) == 2
+    await asyncio.gather(first, second, other)
+
+    # Same key waits its turn; another key runs alongside
+    assert order.index("a end") < order.index("b start")
+    assert order.index("c start") < order.index("a end")
+    assert len(locks) == 0
+
+
+async def test_lock_is_released_on_error():
+    locks = KeyedLock()
+    with pytest.raises(RuntimeError):
+        async with locks.hold("u1"):
+            raise RuntimeError("rebuild failed")
+    assert len(locks) == 0
+    async with locks.hold("u1"):
+        pass
@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.services import merchant_index
+from app.services.merchant_index import get_item_spending, get_top_merchants
+from app.services.receipts_service import build_receipt_doc
+from app.utils.db import get_database
+
+pytestmark = pytest.mark.anyio
+
+RECEIPTS = [
+    {"store_name": "D-Mart", "date": "2024-03-05", "total": 130.0,
+     "items": [{"name": "Amul Milk", "quantity": 2, "price": 30.0}, {"name": "Bread", "quantity": 1, "price": 70.0}]},
+    {"store_name": "DMART Ghatkopar", "date": "2023-01-10", "total": 56.0,
+     "items": [{"name": "AMUL  MILK", "quantity": 2, "price": 28.0}]},
+    {"store_name": "Fresh Mart", "date": "2024-02-01", "total": 45.0,
+     "items": [{"name": "amul milk", "quantity": 1.5, "price": 30.0}]},
+]
+
+
+@pytest.fixture
+async def unindexed_user(mongo):
+    """A user whose receipts predate the index, so the first read builds it."""
+    user_id = "user-1"
+    merchant_index._indexed_users.discard(user_id)
+    db = await get_database()
+    # Newest purchase inserted first, so insertion order can't pick the name
+    await db.receipts.insert_many([build_receipt_doc(receipt, "", 90.0, user_id) for receipt in RECEIPTS])
+    return user_id
+
+
+async def test_item_spend_is_price_times_quantity(unindexed_user):
+    [milk, bread] = await get_item_spending(unindexed_user)
+
+    assert milk["item_key"] == "amul milk"
+    assert milk["total"] == 60.0 + 56.0 + 45.0
+    assert milk["quantity"] == 5.5
+    assert milk["count"] == 3
+    assert milk["merchants"] == ["DMart", "Fresh Mart"]
+    # The most recent spelling wins
+    assert milk["item"] == "Amul Milk"
+    assert bread["total"] == 70.0
+
+
+async def test_string_quantities_count_in_spend_and_quantity(mongo):
+    db = await get_database()
+    # Stored as extracted, before quantities were normalized
+    await db.receipts.insert_one({
+        "user_id": "user-2", "store_name": "Fresh Mart", "total_minor": 9000, "created_at": datetime(2024, 3, 5),
+        "items": [{"name": "Eggs", "quantity": "3", "price": 30.0, "price_minor": 3000}],
+    })
+    merchant_index._indexed_users.discard("user-2")
+
+    [eggs] = await get_item_spending("user-2")
+    assert eggs["total"] == 90.0
+    assert eggs["quantity"] == 3
+
+
+async def test_item_spend_date_range(unindexed_user):
+    [milk] = await get_item_spending(unindexed_user, "milk", start=datetime(2023, 1, 1), end=datetime(2023, 12, 31))
+    assert milk["total"] == 56.0
+    assert milk["item"] == "AMUL MILK"
+
+
+async def test_concurrent_first_reads_build_once(unindexed_user, monkeypatch):
+    rebuild = merchant_index._rebuild
+    rebuilds = []
+
+    async def slow_rebuild(user_id):
+        rebuilds.append(user_id)
+        # Give the other readers a chance to interleave
+        await asyncio.sleep(0.01)
+        return await rebuild(user_id)
+
+    monkeypatch.setattr(merchant_index, "_rebuild", slow_rebuild)
+    results = await asyncio.gather(*(get_top_merchants(unindexed_user) for _ in range(5)))
+
+    for merchants in results:
+        assert [(m["merchant"], m["total"], m["count"]) for m in merchants] == [("DMart", 186.0, 2), ("Fresh Mart", 45.0, 1)]
+
+    assert rebuilds == [unindexed_user]
+    # Locks are dropped once no one holds or waits on them
+    assert len(merchant_index._rebuild_locks) == 0
+    db = await get_database()
+    assert await db.receipt_items.count_documents({"user_id": unindexed_user}) == 4
+    marker = await db.merchant_index_users.find_one({"_id": unindexed_user})
+    assert marker["schema"] == merchant_index.INDEX_SCHEMA and marker["receipts"] == 3
@@ -0,0 +1,24 @@
+import pytest
+
+from app.utils.config import settings
+
+pytestmark = pytest.mark.anyio
+
+ENDPOINTS = ["/metrics/extraction", "/metrics/rate_limits", "/metrics/analytics_cache", "/metrics/search"]
+
+
+@pytest.mark.parametrize("path", ENDPOINTS)
+async def test_metrics_need_a_signed_in_user(client, auth_headers, path):
+    anonymous = await client.get(path)
+    assert anonymous.status_code in (401, 403)
+
+    signed_in = await client.get(path, headers=auth_headers)
+    assert signed_in.status_code == 200
+
+
+async def test_metrics_users_allowlist(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_USERS", ["ops@example.com"])
+    assert (await client.get("/metrics/search", headers=auth_headers)).status_code == 403
+
+    monkeypatch.setattr(settings, "METRICS_USERS", ["ops@example.com", "test@example.com"])
+    assert (await client.get("/metrics/search", headers=auth_headers)).status_code == 200
@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+from app.utils import rate_limit as rate_limit_module
+from app.utils.rate_limit import MemoryBuckets, MongoBuckets, RateLimit, RateLimiter
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_parse():
+    limit = RateLimit.parse("10/60")
+    assert (limit.capacity, limit.period, limit.rate) == (10, 60.0, 10 / 60)
+    assert repr(limit) == "10/60s"
+
+
+def test_bucket_allows_a_burst_then_refills(clock):
+    buckets = MemoryBuckets()
+    limit = RateLimit(3, 30)  # one token every 10s
+
+    assert [buckets.take("u", limit) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert buckets.take("u", limit) == pytest.approx(10.0)
+
+    clock[0] += 4
+    assert buckets.take("u", limit) == pytest.approx(6.0)
+    clock[0] += 6
+    assert buckets.take("u", limit) == 0.0
+
+    # Refill stops at capacity however long the bucket sits idle
+    clock[0] += 3600
+    assert [buckets.take("u", limit) for _ in range(4)][-1] == pytest.approx(10.0)
+    # Other keys have buckets of their own
+    assert buckets.take("v", limit) == 0.0
+
+
+def test_idle_buckets_are_swept(clock):
+    buckets = MemoryBuckets(sweep_every=4)
+    limit = RateLimit(5, 60)
+    buckets.take("a", limit)
+    buckets.take("b", limit)
+    clock[0] += 61
+    buckets.take("c", limit)
+    buckets.take("c", limit)
+    assert buckets.size() == 1
+
+
+async def test_limiter_counts_and_fails_open(clock):
+    limiter = RateLimiter({"upload": RateLimit(1, 60)}, MemoryBuckets())
+    assert await limiter.check("upload", "a@example.com") == (True, 0.0)
+    allowed, retry_after = await limiter.check("upload", "a@example.com")
+    assert not allowed and retry_after == pytest.approx(60.0)
+    assert await limiter.check("analytics", "a@example.com") == (True, 0.0)
+
+    class Broken:
+        async def hit(self, key, limit):
+            raise ConnectionError("store down")
+
+    limiter.backend = Broken()
+    assert await limiter.check("upload", "a@example.com") == (True, 0.0)
+    assert (limiter.allowed, limiter.limited, limiter.errors) == (1, 1, 1)
+
+
+async def test_route_returns_429_with_retry_after(client, auth_headers, monkeypatch):
+    limiter = RateLimiter({"analytics": RateLimit(2, 60)}, MemoryBuckets())
+    monkeypatch.setattr(rate_limit_module, "rate_limiter", limiter)
+
+    for _ in range(2):
+        assert (await client.get("/analytics/monthly", headers=auth_headers)).status_code == 200
+    limited = await client.get("/analytics/monthly", headers=auth_headers)
+    assert limited.status_code == 429
+    assert 1 <= int(limited.headers["retry-after"]) <= 30
+
+
+@pytest.mark.mongodb
+async def test_mongo_buckets_share_tokens(mongo):
+    limit = RateLimit(2, 60)
+    first, second = MongoBuckets(), MongoBuckets()
+    assert await first.hit("upload:a", limit) == 0.0
+    assert await second.hit("upload:a", limit) == 0.0
+    assert await first.hit("upload:a", limit) > 0
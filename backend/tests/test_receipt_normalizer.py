@@ -0,0 +1,98 @@
+from datetime import datetime
+
+import pytest
+
+from app.services.receipt_normalizer import DERIVED_FIELDS, canonical_merchant, normalize_receipt_fields, to_minor_units, to_quantity
+from app.utils.db import get_database
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("value, minor", [
+    ("1,234.50", 123450),
+    ("₹ 99", 9900),
+    ("Rs. 0.005", 1),
+    (0.1, 10),
+    (12, 1200),
+    ("", None),
+    ("abc", None),
+    (float("nan"), None),
+    (True, None),
+])
+def test_to_minor_units(value, minor):
+    assert to_minor_units(value) == minor
+
+
+@pytest.mark.parametrize("value, quantity", [
+    (2, 2),
+    ("2", 2),
+    (" 1.5 ", 1.5),
+    (2.0, 2),
+    ("two", None),
+    (0, None),
+    (-1, None),
+    (float("inf"), None),
+    (True, None),
+    (None, None),
+])
+def test_to_quantity(value, quantity):
+    result = to_quantity(value)
+    assert result == quantity and type(result) is type(quantity)
+
+
+def test_canonical_merchant_folds_spellings():
+    assert canonical_merchant("D-MART  Ghatkopar") == ("dmart", "DMart")
+    assert canonical_merchant("Avenue Supermarts Ltd") == ("dmart", "DMart")
+    assert canonical_merchant("Sharma Sweets Pvt. Ltd.") == ("sharma sweets", "Sharma Sweets Pvt. Ltd.")
+    assert canonical_merchant("!!!") == (None, None)
+
+
+def test_normalize_receipt_fields():
+    normalized = normalize_receipt_fields({
+        "store_name": "Domino's Pizza",
+        "total": "₹1,050.00",
+        "date": "05/03/2024",
+        "items": [{"name": "Pizza", "price": "525", "quantity": "2"}, "not an item"],
+    })
+
+    assert normalized["total"] == 1050.0
+    assert normalized["total_minor"] == 105000
+    assert normalized["date"] == "2024-03-05"
+    assert normalized["purchase_date"] == datetime(2024, 3, 5)
+    assert normalized["merchant_key"] == "dominos"
+    assert normalized["items"] == [{"name": "Pizza", "price": 525.0, "price_minor": 52500, "quantity": 2}, "not an item"]
+    # Partial updates only get the fields they carry
+    assert "subtotal" not in normalized and "subtotal_minor" not in normalized
+    assert set(normalized) - {"store_name", "total", "date", "items"} <= set(DERIVED_FIELDS)
+
+
+def test_normalize_is_idempotent():
+    once = normalize_receipt_fields({"total": "99.999", "date": "5 Mar 2024", "store_name": "kfc"})
+    assert normalize_receipt_fields(once) == once
+
+
+def test_unparseable_values_become_none():
+    normalized = normalize_receipt_fields({"total": "n/a", "date": "someday"})
+    assert normalized["total"] is None and normalized["total_minor"] is None
+    assert normalized["date"] == "someday"
+    assert normalized["purchase_date"] is None
+
+
+async def test_migration_rerun_changes_nothing(mongo):
+    from scripts.normalize_receipts import MIGRATION_ID, migrate
+
+    db = await get_database()
+    await db.receipts.insert_many([
+        {"user_id": "u1", "store_name": "D-Mart", "total": "1,250.00", "date": "05/03/2024", "created_at": datetime(2024, 3, 5)},
+        {"user_id": "u1", "store_name": "KFC", "total": 99.5, "tax": "4.50", "date": "2024-03-06", "created_at": datetime(2024, 3, 6)},
+        {"user_id": "u1", "store_name": None, "total": None, "date": None, "created_at": datetime(2024, 3, 7)},
+    ])
+
+    await migrate(batch_size=2, restart=True)
+    first = await db.migrations.find_one({"_id": MIGRATION_ID})
+    assert first["updated"] == 3
+
+    await migrate(batch_size=2, restart=True)
+    second = await db.migrations.find_one({"_id": MIGRATION_ID})
+    assert second["scanned"] == 3
+    assert second["updated"] == 0
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.services import receipts_service
+from app.services.receipts_service import decode_cursor, encode_cursor
+
+pytestmark = pytest.mark.anyio
+
+
+def test_cursor_round_trip():
+    receipt = {"created_at": datetime(2024, 3, 5, 10, 30, 15, 123000), "_id": ObjectId()}
+    assert decode_cursor(encode_cursor(receipt)) == (receipt["created_at"], receipt["_id"])
+
+
+@pytest.mark.parametrize("token", ["", "garbage!", "MTI6eHg", "bm90LWEtY3Vyc29y"])
+def test_malformed_cursor_is_rejected(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token)
+
+
+async def _seed(user_id, count):
+    docs = [receipts_service.build_receipt_doc({"store_name": f"Store {i}", "total": i}, "", 1.0, user_id) for i in range(count)]
+    tied = datetime(2024, 1, 1, 12, 0, 0, 123000)
+    for i, doc in enumerate(docs):
+        # Every third receipt shares a timestamp, so _id has to break ties
+        doc["created_at"] = tied if i % 3 == 0 else datetime(2024, 1, 1) + timedelta(minutes=i)
+    await receipts_service.save_receipts(docs)
+
+
+async def test_cursor_pages_match_offset_pages(client, auth_headers, user):
+    await _seed(user.id, 23)
+
+    by_cursor, cursor = [], None
+    while True:
+        params = {"limit": 5, **({"cursor": cursor} if cursor else {})}
+        page = (await client.get("/receipts/receipts", params=params, headers=auth_headers)).json()
+        by_cursor += [receipt["_id"] for receipt in page["receipts"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    by_offset = []
+    for number in range(1, 6):
+        page = (await client.get("/receipts/receipts", params={"limit": 5, "page": number}, headers=auth_headers)).json()
+        by_offset += [receipt["_id"] for receipt in page["receipts"]]
+
+    assert len(set(by_cursor)) == 23
+    assert by_cursor == by_offset
+
+
+async def test_invalid_cursor_is_400(client, auth_headers):
+    response = await client.get("/receipts/receipts", params={"cursor": "garbage!"}, headers=auth_headers)
+    assert response.status_code == 400
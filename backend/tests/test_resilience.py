@@ -0,0 +1,184 @@
+import asyncio
+import threading
+import time
+import uuid
+
+import pytest
+
+from app.services import extraction_service
+from app.services.extraction_backends import ExtractionBackend, StubBackend
+from app.services.extraction_cache import extraction_cache, hash_image
+from app.services.extraction_service import process_receipt_upload, stream_receipt_upload
+from app.services.resilience import (
+    AdaptiveLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    LimiterTimeoutError,
+    ResilientClient,
+    ServiceUnavailableError,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def _client(timeout: float = 0.05, max_retries: int = 0, failures: int = 3) -> ResilientClient:
+    return ResilientClient(
+        "test",
+        AdaptiveLimiter(initial=2, min_limit=1, max_limit=4, latency_target=1.0, backoff=0.5),
+        CircuitBreaker(failure_threshold=failures, reset_timeout=60),
+        timeout=timeout,
+        max_retries=max_retries,
+        retry_base=0.001,
+        retry_max=0.001,
+        acquire_timeout=0.1,
+    )
+
+
+def test_breaker_opens_and_probes(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+
+    breaker.record_failure()
+    assert breaker.allow() and breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() == 10
+
+    now[0] += 10
+    # One probe at a time while half-open
+    assert breaker.allow() and breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    now[0] += 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.consecutive_failures == 0
+    assert breaker.transitions == {"closed->open": 1, "open->half_open": 2, "half_open->open": 1, "half_open->closed": 1}
+
+
+async def test_limiter_is_aimd_and_fifo():
+    limiter = AdaptiveLimiter(initial=2, min_limit=1, max_limit=3, latency_target=1.0, backoff=0.5)
+    await limiter.acquire(0.1)
+    await limiter.acquire(0.1)
+
+    waiters = [asyncio.ensure_future(limiter.acquire(1)) for _ in range(2)]
+    await asyncio.sleep(0)
+    assert limiter.stats()["waiting"] == 2
+
+    # A fast call grows the limit by 1/limit and hands the freed slot to the first waiter
+    limiter.release(0.01, dropped=False)
+    assert limiter.limit == 2.5
+    await asyncio.sleep(0.01)
+    assert waiters[0].done() and not waiters[1].done()
+
+    # A dropped call halves it
+    limiter.release(0.01, dropped=True)
+    assert limiter.limit == 1.25
+    assert not waiters[1].done()
+    with pytest.raises(LimiterTimeoutError):
+        await waiters[1]
+    assert limiter.rejected == 1
+
+    limiter.release(0.01, dropped=True)
+    assert limiter.limit == 1
+    assert limiter.inflight == 0
+
+
+async def test_call_retries_then_opens_breaker():
+    client = _client(max_retries=1, failures=2)
+    attempts = []
+
+    def flaky(timeout):
+        attempts.append(threading.current_thread().name)
+        raise ConnectionError("reset")
+
+    with pytest.raises(ServiceUnavailableError):
+        await client.call(flaky)
+    assert len(attempts) == 2 and client.retries == 1
+    # Calls run on the client's own threads, not the extraction workers
+    assert all(name.startswith("test-remote") for name in attempts)
+
+    with pytest.raises(CircuitOpenError):
+        await client.call(flaky)
+    assert client.short_circuited == 1
+
+
+async def test_call_that_ignores_its_timeout_is_abandoned():
+    client = _client(timeout=0.05)
+    release = threading.Event()
+
+    started = time.monotonic()
+    with pytest.raises(ServiceUnavailableError):
+        await client.call(lambda timeout: release.wait(5))
+    assert time.monotonic() - started < 2
+    assert client.timeouts == 1
+    assert client.limiter.inflight == 0
+    release.set()
+
+
+async def test_stream_deadline_covers_the_whole_stream():
+    client = _client(timeout=0.05)
+    release = threading.Event()
+
+    def trickle(timeout):
+        # Each fragment is quick, but the stream never ends
+        while not release.wait(0.1):
+            yield "{"
+
+    received = []
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        async for fragment in client.stream(trickle):
+            received.append(fragment)
+    assert time.monotonic() - started < 2
+    assert received and client.timeouts == 1
+    assert client.limiter.inflight == 0
+    release.set()
+
+
+def test_stub_stream_times_out_when_the_consumer_is_slow():
+    stub = StubBackend(client=None, distribution="constant", latency_ms=8, seed=1)
+    fragments = stub.request_stream(b"image", "image/png", timeout=0.05, chunks=8)
+    next(fragments)
+    # The deadline passes while the consumer holds the stream
+    time.sleep(0.1)
+    with pytest.raises(TimeoutError):
+        next(fragments)
+
+
+class _FallbackBackend(ExtractionBackend):
+    name = "fallback"
+
+    async def extract(self, image_bytes: bytes):
+        self.calls += 1
+        return StubBackend.fake_receipt(image_bytes), ""
+
+
+@pytest.mark.parametrize("streamed", [False, True])
+async def test_fallback_results_are_not_cached(mongo, user, monkeypatch, streamed):
+    fallback = _FallbackBackend()
+    backend = StubBackend(_client(failures=1), fallback, distribution="constant", latency_ms=1)
+    backend.cacheable = True
+    backend.client.breaker.record_failure()
+    monkeypatch.setattr(extraction_service, "extraction_backend", backend)
+    image = uuid.uuid4().bytes
+
+    async def upload():
+        if streamed:
+            events = [event async for event in stream_receipt_upload(image, str(user.id))]
+            return events[-1]["data"]
+        return await process_receipt_upload(image, str(user.id))
+
+    # While the circuit is open every upload goes to the fallback
+    for _ in range(2):
+        assert (await upload())["source"] == "fallback"
+    assert fallback.calls == 2
+    assert await extraction_cache.get(hash_image(image)) is None
+
+    backend.client.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    assert (await upload())["source"] == "stub"
+    assert await extraction_cache.get(hash_image(image)) is not None
@@ -0,0 +1,69 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.services import analytics_service
+from app.services.analytics_service import get_category_analytics, get_monthly_analytics, rebuild_rollups
+from app.services.receipts_service import build_receipt_doc
+from app.utils.db import get_database
+
+pytestmark = pytest.mark.anyio
+
+RECEIPTS = [
+    ({"store_name": "Fresh Mart", "total": 120.0, "category": "grocery"}, datetime(2024, 3, 5)),
+    ({"store_name": "Fresh Mart", "total": 80.0, "category": "grocery"}, datetime(2024, 3, 9)),
+    ({"store_name": "Spice Route", "total": 450.0, "category": "restaurant"}, datetime(2024, 4, 1)),
+]
+
+
+@pytest.fixture
+async def user_without_rollups(mongo):
+    """A user whose receipts predate the rollups, so the first read builds them."""
+    user_id = "user-1"
+    analytics_service._rollup_users.discard(user_id)
+    docs = []
+    for receipt, created_at in RECEIPTS:
+        doc = build_receipt_doc(receipt, "", 90.0, user_id)
+        doc["created_at"] = created_at
+        docs.append(doc)
+    db = await get_database()
+    await db.receipts.insert_many(docs)
+    return user_id
+
+
+async def test_concurrent_first_reads_build_once(user_without_rollups, monkeypatch):
+    rebuild = analytics_service._rebuild
+    rebuilds = []
+
+    async def slow_rebuild(user_id):
+        rebuilds.append(user_id)
+        # Give the other readers a chance to interleave
+        await asyncio.sleep(0.01)
+        return await rebuild(user_id)
+
+    monkeypatch.setattr(analytics_service, "_rebuild", slow_rebuild)
+    results = await asyncio.gather(
+        *(get_monthly_analytics(user_without_rollups) for _ in range(3)),
+        *(get_category_analytics(user_without_rollups) for _ in range(3)),
+    )
+
+    assert rebuilds == [user_without_rollups]
+    assert len(analytics_service._rebuild_locks) == 0
+    for monthly in results[:3]:
+        assert [(row["month"], row["total"]) for row in monthly] == [("2024-04", 450.0), ("2024-03", 200.0)]
+    for categories in results[3:]:
+        assert {row["category"]: row["total"] for row in categories} == {"restaurant": 450.0, "grocery": 200.0}
+
+
+async def test_rebuild_replaces_rollups_in_place(user_without_rollups):
+    assert await rebuild_rollups(user_without_rollups) == 2
+
+    db = await get_database()
+    # A rollup with no receipts behind it any more, and drift on a live one
+    await db.spending_rollups.insert_one({"_id": "user-1|2023-01|grocery", "user_id": "user-1", "month": "2023-01", "category": "grocery", "total": 999, "count": 1})
+    await db.spending_rollups.update_one({"_id": "user-1|2024-03|grocery"}, {"$inc": {"total": 5000}})
+
+    assert await rebuild_rollups(user_without_rollups) == 2
+    rollups = {doc["_id"]: doc["total"] async for doc in db.spending_rollups.find({"user_id": "user-1"})}
+    assert rollups == {"user-1|2024-03|grocery": 20000, "user-1|2024-04|restaurant": 45000}
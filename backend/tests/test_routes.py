@@ -0,0 +1,19 @@
+import re
+from pathlib import Path
+
+from app.main import app
+
+README = Path(__file__).resolve().parents[2] / "README.md"
+DOCUMENTED_ROUTE_RE = re.compile(r"`(GET|POST|PUT|PATCH|DELETE) (/[^`?\s]*)")
+
+
+def test_every_documented_route_is_served():
+    documented = DOCUMENTED_ROUTE_RE.findall(README.read_text())
+    assert documented
+
+    paths = app.openapi()["paths"]
+    missing = [
+        f"{method} {path}" for method, path in documented
+        if method.lower() not in paths.get(path, {})
+    ]
+    assert missing == []
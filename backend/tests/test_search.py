@@ -0,0 +1,89 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from app.services import receipts_service, search_service
+from app.services.search_service import PrefixIndex
+
+pytestmark = pytest.mark.anyio
+
+RECEIPTS = [
+    ("Amul Parlour", ["Ice cream"], "Card"),
+    ("D-Mart Ghatkopar", ["Amul Milk 500ml", "Bread"], "UPI"),
+    ("Joe's Cafe", ["Milkshake", "Sandwich"], "Cash"),
+    ("Big Bazaar", ["Amul Butter"], "UPI"),
+]
+
+
+async def _seed(user_id):
+    for store_name, items, payment_method in RECEIPTS:
+        await receipts_service.save_receipt(
+            {
+                "store_name": store_name,
+                "total": 10,
+                "payment_method": payment_method,
+                "items": [{"name": name, "quantity": 1, "price": 5} for name in items],
+            },
+            "",
+            1.0,
+            user_id,
+        )
+
+
+def _stores(response):
+    assert response.status_code == 200, response.text
+    return [receipt["store_name"] for receipt in response.json()["receipts"]]
+
+
+def test_prefix_index_ranks_store_above_items_and_requires_every_word():
+    receipts = [
+        {"_id": ObjectId(), "store_name": "Big Bazaar", "items": [{"name": "Amul Butter"}], "created_at": datetime(2024, 1, 2)},
+        {"_id": ObjectId(), "store_name": "Amul Parlour", "items": [{"name": "Ice cream"}], "created_at": datetime(2024, 1, 1)},
+        {"_id": ObjectId(), "store_name": "DMart", "items": [{"name": "Amul Milk"}], "created_at": datetime(2024, 1, 3)},
+    ]
+    index = PrefixIndex(1, receipts)
+
+    assert index.search(["amu"]) == [receipts[1]["_id"], receipts[2]["_id"], receipts[0]["_id"]]
+    assert index.search(["amu", "mil"]) == [receipts[2]["_id"]]
+    assert index.search(["zzz"]) == []
+
+
+async def test_prefix_search_through_endpoint(client, auth_headers, user):
+    await _seed(user.id)
+
+    response = await client.get("/receipts/search", params={"q": "amu", "prefix": "true", "limit": 2}, headers=auth_headers)
+    # The store name match outranks line item matches
+    assert _stores(response)[0] == "Amul Parlour"
+    assert response.json()["has_more"] is True
+
+    response = await client.get("/receipts/search", params={"q": "amu mil", "prefix": "true"}, headers=auth_headers)
+    assert _stores(response) == ["D-Mart Ghatkopar"]
+    assert "raw_ocr_text" not in response.json()["receipts"][0]
+
+
+async def test_prefix_index_follows_receipt_writes(client, auth_headers, user):
+    await _seed(user.id)
+    response = await client.get("/receipts/search", params={"q": "zomato", "prefix": "true"}, headers=auth_headers)
+    assert _stores(response) == []
+
+    await receipts_service.save_receipt({"store_name": "Zomato", "total": 3}, "", 1.0, user.id)
+    response = await client.get("/receipts/search", params={"q": "zomato", "prefix": "true"}, headers=auth_headers)
+    assert _stores(response) == ["Zomato"]
+
+
+@pytest.mark.mongodb
+async def test_ranked_word_search_through_endpoint(client, auth_headers, user, monkeypatch):
+    monkeypatch.setattr(search_service, "_search_index_ready", False)
+    await _seed(user.id)
+
+    response = await client.get("/receipts/search", params={"q": "amul"}, headers=auth_headers)
+    stores = _stores(response)
+    assert stores[0] == "Amul Parlour"
+    assert set(stores) == {"Amul Parlour", "D-Mart Ghatkopar", "Big Bazaar"}
+    scores = [receipt["score"] for receipt in response.json()["receipts"]]
+    assert scores == sorted(scores, reverse=True)
+
+    response = await client.get("/receipts/search", params={"q": "upi", "limit": 1}, headers=auth_headers)
+    assert len(_stores(response)) == 1
+    assert response.json()["has_more"] is True
@@ -44,6 +44,7 @@ export interface ReceiptData {
     items: ReceiptItem[];
     payment_method?: string;
     category?: string;
+    image_id?: string;
 }
 
 export interface ReceiptItem {
@@ -80,10 +81,11 @@ export interface UpdateReceiptPayload {
 }
 
 interface GetReceiptsResponse {
-    page: number;
+    page: number | null;
     limit: number;
     receipts: ReceiptData[];
     count: number;
+    next_cursor: string | null;
 }
 
 /**
@@ -127,7 +129,7 @@ export const uploadReceipt = async (imageUri: string): Promise<UploadReceiptResp
         const token = useAuthStore.getState().token;
 
         // Use native fetch instead of axios for FormData reliability on Web
-        const response = await fetch(`${api.defaults.baseURL}/receipts/upload_receipt`, {
+        const response = await fetch(`${api.defaults.baseURL}/receipts/upload_receipt?wait=true`, {
             method: 'POST',
             body: formData,
             headers: {
@@ -223,6 +225,19 @@ export const getReceiptById = async (receiptId: string): Promise<ReceiptData> =>
     }
 };
 
+/**
+ * Image source for a receipt's stored thumbnail
+ * @param receiptId - Receipt ID
+ * @returns Source object for <Image>, authenticated with the current token
+ */
+export const getReceiptThumbnailSource = (receiptId: string) => {
+    const token = useAuthStore.getState().token;
+    return {
+        uri: `${api.defaults.baseURL}/receipts/receipt/${receiptId}/thumbnail`,
+        headers: token ? { Authorization: `Bearer ${token}` } : undefined,
+    };
+};
+
 /**
  * Get all receipts
  * @returns List of receipts
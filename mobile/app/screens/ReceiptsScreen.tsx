@@ -1,5 +1,5 @@
 import React, { useState, useCallback, useMemo, useEffect } from 'react';
-import { View, FlatList, ActivityIndicator, RefreshControl, TouchableOpacity, Text, Platform } from 'react-native';
+import { View, FlatList, ActivityIndicator, RefreshControl, TouchableOpacity, Text, Platform, Image } from 'react-native';
 import { Ionicons } from '@expo/vector-icons';
 import DateTimePicker from '@react-native-community/datetimepicker';
 import { useFocusEffect, useNavigation } from '@react-navigation/native';
@@ -9,7 +9,7 @@ import { Title, Subtitle, Caption, Body } from '../components/ui/Typography';
 import { Card } from '../components/ui/Card';
 import { FadeInView } from '../components/ui/FadeInView';
 import { AnimatedNumber } from '../components/ui/AnimatedNumber';
-import { getReceipts, ReceiptData, getCachedReceipts, invalidateReceiptsCache } from '../api/receipts';
+import { getReceipts, ReceiptData, getCachedReceipts, invalidateReceiptsCache, getReceiptThumbnailSource } from '../api/receipts';
 import { RootStackParamList } from '../navigation/AppNavigator';
 import { spacing } from '../utils/responsive';
 import { formatDate } from '../utils/format';
@@ -270,7 +270,14 @@ const ReceiptsScreen = () => {
                   className="bg-white rounded-xl"
                 >
                   <View className="flex-row justify-between items-start mb-2">
-                    <View>
+                    {item.image_id && (item._id || item.id) && (
+                      <Image
+                        source={getReceiptThumbnailSource((item._id || item.id) as string)}
+                        style={{ width: 48, height: 48, borderRadius: 8, marginRight: spacing.sm }}
+                        resizeMode="cover"
+                      />
+                    )}
+                    <View className="flex-1">
                       <Subtitle className="mb-0">{item.store_name || 'Unknown Store'}</Subtitle>
                       <Caption>{formatDate(item.date)}</Caption>
                     </View>